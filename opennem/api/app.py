@@ -44,6 +44,7 @@ from opennem.schema.opennem import FueltechSchema, OpennemErrorSchema
 from opennem.schema.time import TimeInterval, TimePeriod
 from opennem.schema.units import UnitDefinition
 from opennem.users.schema import OpenNEMRoles
+from opennem.utils.cache import close_caches
 from opennem.utils.version import get_version
 
 logger = logging.getLogger("opennem.api")
@@ -67,6 +68,7 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown logic
     await unkey_client.close()
+    await close_caches()
 
 
 app = FastAPI(title="OpenNEM", debug=settings.debug, version=get_version(), redoc_url="/docs", docs_url=None, lifespan=lifespan)
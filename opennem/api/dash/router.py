@@ -12,7 +12,7 @@ from sqlalchemy.engine.base import Engine
 from starlette import status
 
 from opennem.api.stats.controllers import stats_factory
-from opennem.api.stats.schema import DataQueryResult, OpennemDataSet
+from opennem.api.stats.schema import DataQueryColumns, OpennemDataSet
 from opennem.api.time import human_to_period
 from opennem.core.units import get_unit
 from opennem.db import get_database_engine
@@ -77,7 +77,7 @@ async def now_endpoint(
             detail="No results",
         )
 
-    result_set = [DataQueryResult(interval=i[0], result=i[3], group_by=i[2] if len(i) > 1 else None) for i in row]
+    result_set = DataQueryColumns.from_rows(row, result_index=3, group_by_index=2)
 
     response_model = stats_factory(
         result_set,
@@ -19,7 +19,7 @@ from opennem.api.export.queries import (
     weather_observation_query,
 )
 from opennem.api.stats.controllers import stats_factory
-from opennem.api.stats.schema import DataQueryResult, OpennemDataSet
+from opennem.api.stats.schema import DataQueryColumns, OpennemDataSet
 from opennem.api.time import human_to_interval
 from opennem.controllers.output.schema import OpennemExportSeries
 from opennem.core.units import get_unit
@@ -57,11 +57,11 @@ async def weather_daily(
         result = await conn.execute(query)
         row = result.fetchall()
 
-    temp_avg = [DataQueryResult(interval=i[0], group_by=i[1], result=i[2] if len(i) > 1 else None) for i in row]
+    temp_avg = DataQueryColumns.from_rows(row, result_index=2, group_by_index=1)
 
-    temp_min = [DataQueryResult(interval=i[0], group_by=i[1], result=i[3] if len(i) > 1 else None) for i in row]
+    temp_min = DataQueryColumns.from_rows(row, result_index=3, group_by_index=1)
 
-    temp_max = [DataQueryResult(interval=i[0], group_by=i[1], result=i[4] if len(i) > 1 else None) for i in row]
+    temp_max = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
 
     if not temp_avg:
         logger.info(f"No weather results for {station_code}")
@@ -117,7 +117,7 @@ async def gov_stats_cpi() -> OpennemDataSet | None:
         result = await conn.execute(query)
         row = result.fetchall()
 
-    stats = [DataQueryResult(interval=i[0], result=i[1], group_by=i[2] if len(i) > 1 else None) for i in row]
+    stats = DataQueryColumns.from_rows(row, result_index=1, group_by_index=2)
 
     if len(stats) < 1:
         logger.error("No results for gov_stats_cpi returing blank set")
@@ -160,8 +160,8 @@ async def power_flows_region_week(
         logger.error(f"No results from interconnector_power_flow query for {time_series.interval}")
         return None
 
-    imports = [DataQueryResult(interval=i[0], result=i[2], group_by="imports" if len(i) > 1 else None) for i in rows]
-    exports = [DataQueryResult(interval=i[0], result=i[3], group_by="exports" if len(i) > 1 else None) for i in rows]
+    imports = DataQueryColumns.from_rows(rows, result_index=2, group_by="imports")
+    exports = DataQueryColumns.from_rows(rows, result_index=3, group_by="exports")
 
     result = stats_factory(
         imports,
@@ -215,8 +215,8 @@ async def network_flows_for_region(
         logger.error(f"No results from interconnector_power_flow query for {time_series.interval}")
         return None
 
-    imports = [DataQueryResult(interval=i[0], result=i[1], group_by="imports" if len(i) > 1 else None) for i in rows]
-    exports = [DataQueryResult(interval=i[0], result=i[2], group_by="exports" if len(i) > 1 else None) for i in rows]
+    imports = DataQueryColumns.from_rows(rows, result_index=1, group_by="imports")
+    exports = DataQueryColumns.from_rows(rows, result_index=2, group_by="exports")
 
     result = stats_factory(
         imports,
@@ -245,8 +245,8 @@ async def network_flows_for_region(
     if include_emissions:
         unit_emissions = get_unit("emissions")
 
-        import_emissions = [DataQueryResult(interval=i[0], group_by="imports", result=i[3]) for i in rows]
-        export_emissions = [DataQueryResult(interval=i[0], group_by="exports", result=i[4]) for i in rows]
+        import_emissions = DataQueryColumns.from_rows(rows, result_index=3, group_by="imports")
+        export_emissions = DataQueryColumns.from_rows(rows, result_index=4, group_by="exports")
 
         result_import_emissions = stats_factory(
             import_emissions,
@@ -276,7 +276,7 @@ async def network_flows_for_region(
         unit_emissions_factor = get_unit("emissions_factor")
 
         # import factors
-        import_emissions_factors = [DataQueryResult(interval=i[0], group_by="imports", result=i[7]) for i in rows]
+        import_emissions_factors = DataQueryColumns.from_rows(rows, result_index=7, group_by="imports")
         result_import_emissions_factors = stats_factory(
             import_emissions_factors,
             network=time_series.network,
@@ -290,7 +290,7 @@ async def network_flows_for_region(
         result.append_set(result_import_emissions_factors)
 
         # export factors
-        export_emissions_factors = [DataQueryResult(interval=i[0], group_by="exports", result=i[8]) for i in rows]
+        export_emissions_factors = DataQueryColumns.from_rows(rows, result_index=8, group_by="exports")
         result_export_emissions = stats_factory(
             export_emissions_factors,
             network=time_series.network,
@@ -325,7 +325,7 @@ async def power_flows_network_week(
         logger.warning(f"No results from interconnector_flow_network_regions_query with {time_series}")
         return None
 
-    imports = [DataQueryResult(interval=i[0], result=i[4], group_by=i[1] if len(i) > 1 else None) for i in row]
+    imports = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
 
     result = stats_factory(
         imports,
@@ -367,7 +367,7 @@ async def demand_week(
         logger.error(f"No results from network_demand_query with {time_series}")
         return None
 
-    demand = [DataQueryResult(interval=i[0], result=i[2], group_by="demand" if len(i) > 1 else None) for i in row]
+    demand = DataQueryColumns.from_rows(row, result_index=2, group_by="demand")
 
     result = stats_factory(
         demand,
@@ -407,7 +407,7 @@ async def power_week(
         result = await conn.execute(query)
         row = result.fetchall()
 
-    stats = [DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None) for i in row]
+    stats = DataQueryColumns.from_rows(row, result_index=2, group_by_index=1)
 
     if not stats:
         logger.error(f"No results from power week query with {time_series}")
@@ -430,7 +430,7 @@ async def power_week(
 
     # emissions
     if settings.show_emissions_in_power_outputs:
-        emissions = [DataQueryResult(interval=i[0], result=i[3], group_by=i[1] if len(i) > 1 else None) for i in row]
+        emissions = DataQueryColumns.from_rows(row, result_index=3, group_by_index=1)
 
         stats_emissions = stats_factory(
             emissions,
@@ -446,7 +446,7 @@ async def power_week(
 
     # emission factors
     if settings.show_emission_factors_in_power_outputs:
-        emission_factors = [DataQueryResult(interval=i[0], result=i[4], group_by=i[1] if len(i) > 1 else None) for i in row]
+        emission_factors = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
         stats_emission_factors = stats_factory(
             emission_factors,
             network=time_series.network,
@@ -470,7 +470,7 @@ async def power_week(
         result_rooftop = await conn.execute(query)
         row = result_rooftop.fetchall()
 
-    stats_price = [DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None) for i in row]
+    stats_price = DataQueryColumns.from_rows(row, result_index=2, group_by_index=1)
 
     stats_market_value = stats_factory(
         stats=stats_price,
@@ -580,7 +580,7 @@ async def price_for_network_interval(
         result = await conn.execute(query)
         row = result.fetchall()
 
-    price_data = [DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None) for i in row]
+    price_data = DataQueryColumns.from_rows(row, result_index=2, group_by_index=1)
 
     price_set = stats_factory(
         stats=price_data,
@@ -613,8 +613,8 @@ def power_and_emissions_for_network_interval(
         logger.debug(query)
         row = list(c.execute(query))
 
-    power_stats = [DataQueryResult(interval=i[0], result=i[2], group_by=i[1] if len(i) > 1 else None) for i in row]
-    emission_stats = [DataQueryResult(interval=i[0], result=i[3], group_by=i[1] if len(i) > 1 else None) for i in row]
+    power_stats = DataQueryColumns.from_rows(row, result_index=2, group_by_index=1)
+    emission_stats = DataQueryColumns.from_rows(row, result_index=3, group_by_index=1)
 
     if not power_stats:
         logger.error(f"No results from emissions_for_network_interval query with {time_series}")
@@ -650,9 +650,7 @@ def power_and_emissions_for_network_interval(
     if include_emission_factors:
         emission_factor_unit = get_unit("emissions_factor")
 
-        emission_factor_results = [
-            DataQueryResult(interval=i[0], result=i[4], group_by=i[1] if len(i) > 1 else None) for i in row
-        ]
+        emission_factor_results = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
 
         emission_factor_set = stats_factory(
             emission_factor_results,
@@ -682,9 +680,9 @@ async def demand_network_region_daily(
         result = await conn.execute(query)
         row = result.fetchall()
 
-    results_energy = [DataQueryResult(interval=i[0], group_by=i[2], result=i[3] if len(i) > 1 else None) for i in row]
+    results_energy = DataQueryColumns.from_rows(row, result_index=3, group_by_index=2)
 
-    results_market_value = [DataQueryResult(interval=i[0], group_by=i[2], result=i[4] if len(i) > 1 else None) for i in row]
+    results_market_value = DataQueryColumns.from_rows(row, result_index=4, group_by_index=2)
 
     if not results_energy:
         logger.error(f"No results from query: {query}")
@@ -736,11 +734,11 @@ async def energy_fueltech_daily(
         result = await conn.execute(query)
         row = result.fetchall()
 
-    results_energy = [DataQueryResult(interval=i[0], group_by=i[1], result=i[2] if len(i) > 1 else None) for i in row]
+    results_energy = DataQueryColumns.from_rows(row, result_index=2, group_by_index=1)
 
-    results_market_value = [DataQueryResult(interval=i[0], group_by=i[1], result=i[3] if len(i) > 1 else None) for i in row]
+    results_market_value = DataQueryColumns.from_rows(row, result_index=3, group_by_index=1)
 
-    results_emissions = [DataQueryResult(interval=i[0], group_by=i[1], result=i[4] if len(i) > 1 else None) for i in row]
+    results_emissions = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
 
     if not results_energy:
         logger.error(f"No results from query: {query}")
@@ -809,14 +807,14 @@ async def energy_interconnector_flows_and_emissions_v2(
         )
         return None
 
-    imports = [DataQueryResult(interval=i[0], group_by="imports", result=i[3]) for i in row]
-    exports = [DataQueryResult(interval=i[0], group_by="exports", result=i[4]) for i in row]
+    imports = DataQueryColumns.from_rows(row, result_index=3, group_by="imports")
+    exports = DataQueryColumns.from_rows(row, result_index=4, group_by="exports")
 
-    import_emissions = [DataQueryResult(interval=i[0], group_by="imports", result=i[5]) for i in row]
-    export_emissions = [DataQueryResult(interval=i[0], group_by="exports", result=i[6]) for i in row]
+    import_emissions = DataQueryColumns.from_rows(row, result_index=5, group_by="imports")
+    export_emissions = DataQueryColumns.from_rows(row, result_index=6, group_by="exports")
 
-    import_mv = [DataQueryResult(interval=i[0], group_by="imports", result=i[7]) for i in row]
-    export_mv = [DataQueryResult(interval=i[0], group_by="exports", result=i[8]) for i in row]
+    import_mv = DataQueryColumns.from_rows(row, result_index=7, group_by="imports")
+    export_mv = DataQueryColumns.from_rows(row, result_index=8, group_by="exports")
 
     result = stats_factory(
         imports,
@@ -889,8 +887,8 @@ async def energy_interconnector_flows_and_emissions_v2(
     result.append_set(result_export_mv)
 
     if include_emission_factor:
-        import_emission_factor = [DataQueryResult(interval=i[0], group_by="imports", result=i[9]) for i in row]
-        export_emission_factor = [DataQueryResult(interval=i[0], group_by="exports", result=i[10]) for i in row]
+        import_emission_factor = DataQueryColumns.from_rows(row, result_index=9, group_by="imports")
+        export_emission_factor = DataQueryColumns.from_rows(row, result_index=10, group_by="exports")
 
         result_import_emission_factor = stats_factory(
             import_emission_factor,
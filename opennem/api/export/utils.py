@@ -8,7 +8,8 @@ import logging
 from pydantic.main import BaseModel
 
 from opennem.api.stats.schema import OpennemDataSet
-from opennem.exporter.local import write_to_local
+from opennem.exporter.local import write_chunks_to_local, write_to_local
+from opennem.exporter.serialize import iter_dataset_json
 from opennem.exporter.storage_bucket import cloudflare_uploader
 
 logger = logging.getLogger(__name__)
@@ -20,17 +21,23 @@ async def write_output(
     is_local: bool = False,
     exclude_unset: bool = True,
 ) -> int:
-    """Writes output of stat sets either locally or to s3"""
-    write_content = stat_set.model_dump_json(exclude_unset=exclude_unset)
-
+    """Writes output of stat sets either locally or to s3. Data sets are streamed a series at a time"""
     byte_count = 0
 
+    if isinstance(stat_set, OpennemDataSet):
+        write_chunks = iter_dataset_json(stat_set, exclude_unset=exclude_unset)
+
+        if is_local:
+            return write_chunks_to_local(path, write_chunks)
+
+        return await cloudflare_uploader.upload_chunks(write_chunks, path, "application/json")
+
+    write_content = stat_set.model_dump_json(exclude_unset=exclude_unset)
+
     if is_local:
         byte_count = write_to_local(path, write_content)
     elif isinstance(stat_set, str):
         byte_count = await cloudflare_uploader.upload_content(stat_set, path, "application/json")
-    elif isinstance(stat_set, OpennemDataSet):
-        byte_count = await cloudflare_uploader.upload_content(write_content, path, "application/json")
     elif isinstance(stat_set, BaseModel):
         byte_count = await cloudflare_uploader.upload_content(write_content, path, "application/json")
 
@@ -1,9 +1,10 @@
 import logging
-from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from textwrap import dedent
-from typing import Any
 
+import numpy as np
+import pandas as pd
 from datetime_truncate import truncate as date_trunc
 from sqlalchemy import select
 from sqlalchemy import text as sql
@@ -11,7 +12,6 @@ from sqlalchemy import text as sql
 from opennem import settings
 from opennem.api.time import human_to_interval
 from opennem.core.feature_flags import get_list_of_enabled_features
-from opennem.core.normalizers import cast_float_or_none
 from opennem.db import db_connect, get_read_session
 from opennem.db.models.opennem import FacilityScada
 from opennem.queries.utils import duid_to_case
@@ -25,17 +25,64 @@ from opennem.utils.dates import (
     get_last_completed_interval_for_network,
     get_today_for_network,
 )
-from opennem.utils.numbers import cast_trailing_nulls
 from opennem.utils.timezone import is_aware, make_aware
 from opennem.utils.version import get_version
 
-from .schema import DataQueryResult, OpennemData, OpennemDataHistory, OpennemDataSet, ScadaDateRange
+from .schema import DataQueryColumns, DataQueryResult, OpennemData, OpennemDataHistory, OpennemDataSet, ScadaDateRange
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class StatsPivot:
+    """Query results pivoted to an interval x group matrix"""
+
+    # sorted intervals
+    intervals: np.ndarray
+
+    # group codes in the order they first appear
+    group_codes: list[str]
+
+    # results with nan for nulls
+    values: np.ndarray
+
+    # whether each group has a result row for each interval
+    present: np.ndarray
+
+
+def pivot_stats(stats: DataQueryColumns) -> StatsPivot:
+    """Pivot query results into a dense interval x group matrix in one pass. Rows without a
+    group are skipped and where a group has more than one row for an interval the last is kept"""
+    group_by = np.array(stats.group_by, dtype=object)
+    rows_mask = np.fromiter((bool(i) for i in group_by), dtype=bool, count=len(group_by))
+
+    # factorize as objects so the original datetimes (and their timezones) are kept
+    interval_codes, intervals = pd.factorize(np.array(stats.interval, dtype=object)[rows_mask])
+    group_codes, groups = pd.factorize(group_by[rows_mask])
+
+    interval_order = np.argsort(intervals, kind="stable")
+    interval_rank = np.empty_like(interval_order)
+    interval_rank[interval_order] = np.arange(len(interval_order))
+    interval_codes = interval_rank[interval_codes]
+
+    results = np.array(
+        [np.nan if i is None else float(i) for i in np.array(stats.result, dtype=object)[rows_mask]], dtype=float
+    )
+
+    values = np.full((len(intervals), len(groups)), np.nan)
+    present = np.zeros((len(intervals), len(groups)), dtype=bool)
+
+    # for duplicate cells only keep the last row
+    keep = ~pd.DataFrame({"i": interval_codes, "g": group_codes}).duplicated(keep="last").to_numpy()
+
+    values[interval_codes[keep], group_codes[keep]] = results[keep]
+    present[interval_codes, group_codes] = True
+
+    return StatsPivot(intervals=intervals[interval_order], group_codes=list(groups), values=values, present=present)
+
+
 def stats_factory(
-    stats: list[DataQueryResult],
+    stats: list[DataQueryResult] | DataQueryColumns,
     units: UnitDefinition,
     interval: TimeInterval,
     network: NetworkSchema | None = None,
@@ -52,7 +99,7 @@ def stats_factory(
     exclude_nulls: bool = True,
 ) -> OpennemDataSet:
     """
-    Takes a list of data query results and returns OpennemDataSets
+    Takes a list of data query results, or the results as columns, and returns OpennemDataSets
 
     @TODO optional groupby field
     @TODO multiple groupings / slight refactor
@@ -62,29 +109,20 @@ def stats_factory(
     if network:
         timezone = network.get_timezone()
 
-    group_codes = list({i.group_by for i in stats if i.group_by})
-
-    stats_grouped = []
-
-    for group_code in group_codes:
-        data_grouped: dict[datetime, Any] = {}
+    if not isinstance(stats, DataQueryColumns):
+        stats = DataQueryColumns.from_results(stats)
 
-        for stat in stats:
-            if stat.group_by != group_code:
-                continue
+    stats_pivot = pivot_stats(stats)
 
-            if stat.interval not in data_grouped:
-                data_grouped[stat.interval] = None
-
-            # if stat.result:
-            data_grouped[stat.interval] = stat.result
-
-        data_sorted = OrderedDict(sorted(data_grouped.items()))
+    stats_grouped = []
 
-        data_value = list(data_sorted.values())
+    for group_index, group_code in enumerate(stats_pivot.group_codes):
+        group_present = stats_pivot.present[:, group_index]
+        data_value = stats_pivot.values[group_present, group_index]
+        data_nulls = np.isnan(data_value)
 
         # Skip null series
-        if exclude_nulls and not [i for i in data_value if i]:
+        if exclude_nulls and not np.any(~data_nulls & (data_value != 0)):
             continue
 
         # @TODO possible bring this back
@@ -94,20 +132,16 @@ def stats_factory(
 
         # Cast trailing nulls
         if (not units.name.startswith("temperature") or (units.cast_nulls is True)) and (cast_nulls is True):
-            data_value = cast_trailing_nulls(data_value)
-
-        data_trimmed = dict(zip(data_sorted.keys(), data_value, strict=True))
-
-        # data_trimmed = trim_nulls(data_trimmed)
+            data_value_set = np.flatnonzero(~data_nulls)
+            trailing_start = data_value_set[-1] + 1 if len(data_value_set) else 0
+            data_nulls[trailing_start:] = False
+            data_value[trailing_start:] = 0
 
         # Find start/end dates
-        dates = list(data_trimmed.keys())
-
-        if not dates:
-            return None
+        dates = stats_pivot.intervals[group_present]
 
-        start = min(dates)
-        end = max(dates)
+        start = dates[0]
+        end = dates[-1]
 
         # should probably make sure these are the same TZ
         if localize:
@@ -140,14 +174,14 @@ def stats_factory(
             start = date_trunc(start, truncate_to="month")
             end = date_trunc(end, truncate_to="month")
 
-        # free
-        dates = []
+        data_history = data_value.astype(object)
+        data_history[data_nulls] = None
 
         history = OpennemDataHistory(
             start=start,
             last=end,
             interval=interval.interval_human,
-            data=[cast_float_or_none(i) for i in data_trimmed.values()],
+            data=data_history.tolist(),
         )
 
         data = OpennemData(
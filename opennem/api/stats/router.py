@@ -28,7 +28,7 @@ from opennem.utils.dates import get_last_completed_interval_for_network, get_tod
 
 from .controllers import get_scada_range, get_scada_range_optimized, stats_factory
 from .queries import energy_facility_query, power_facility_query
-from .schema import DataQueryResult, OpennemDataSet
+from .schema import DataQueryColumns, OpennemDataSet
 
 logger = logging.getLogger(__name__)
 
@@ -113,7 +113,7 @@ async def power_station(
     async with engine.begin() as c:
         results = list(await c.execute(query))
 
-    stats = [DataQueryResult(interval=i[0], result=i[3], group_by=i[2] if len(i) > 1 else None) for i in results]
+    stats = DataQueryColumns.from_rows(results, result_index=3, group_by_index=2)
 
     if not stats:
         raise HTTPException(
@@ -257,11 +257,11 @@ async def energy_station(
             detail="Station stats not found",
         )
 
-    results_energy = [DataQueryResult(interval=i[0], group_by=i[1], result=i[3] if len(i) > 1 else None) for i in row]
+    results_energy = DataQueryColumns.from_rows(row, result_index=3, group_by_index=1)
 
-    results_emissions = [DataQueryResult(interval=i[0], group_by=i[1], result=i[4] if len(i) > 1 else None) for i in row]
+    results_emissions = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
 
-    results_market_value = [DataQueryResult(interval=i[0], group_by=i[1], result=i[4] if len(i) > 1 else None) for i in row]
+    results_market_value = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
 
     if len(results_energy) < 1:
         raise HTTPException(
@@ -380,7 +380,7 @@ async def power_flows_network_week(
     if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No results")
 
-    imports = [DataQueryResult(interval=i[0], result=i[4], group_by=i[1] if len(i) > 1 else None) for i in row]
+    imports = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
 
     result = stats_factory(
         imports,
@@ -576,7 +576,7 @@ async def emission_factor_per_network(  # type: ignore
             detail="No results",
         )
 
-    emission_factors = [DataQueryResult(interval=i[0], result=i[4], group_by=i[1] if len(i) > 1 else None) for i in row]
+    emission_factors = DataQueryColumns.from_rows(row, result_index=4, group_by_index=1)
 
     result = stats_factory(
         emission_factors,
@@ -705,7 +705,7 @@ async def price_network_endpoint(
             detail="No results",
         )
 
-    result_set = [DataQueryResult(interval=i[0], result=i[3], group_by=i[2] if len(i) > 1 else None) for i in row]
+    result_set = DataQueryColumns.from_rows(row, result_index=3, group_by_index=2)
 
     result = stats_factory(
         result_set,
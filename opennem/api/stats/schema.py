@@ -3,17 +3,21 @@ from __future__ import annotations
 import logging
 import math
 import operator
+from bisect import bisect_left, bisect_right
 from collections import Counter
+from collections.abc import Sequence
+from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 from pathlib import Path
 from typing import Annotated, Any
 from zoneinfo import ZoneInfo
 
+import numpy as np
 import pydantic
 import requests
 from datedelta import datedelta
-from pydantic import PlainSerializer, ValidationError, field_validator
+from pydantic import PlainSerializer, PrivateAttr, ValidationError, field_validator
 
 from opennem import settings
 from opennem.core.feature_flags import get_list_of_enabled_features
@@ -105,6 +109,121 @@ def validate_datetime_is_aware(value: datetime) -> datetime:
     return value
 
 
+class HistoryIndex:
+    """Positions of the intervals of a history from its start and step so values can be looked up
+    without building the datetimes for the whole series. Datetimes are stepped in the wall clock
+    time of start as they are when adding intervals to start"""
+
+    __slots__ = ("start", "step", "size", "series", "validated", "_start_naive", "_step_months", "_month_datetimes")
+
+    def __init__(self, start: datetime, step: timedelta | datedelta, data: list[ValidNumberOrNull]) -> None:
+        self.start = start
+        self.step = step
+        self.size = len(data)
+        self.series = np.array([np.nan if i is None else float(i) for i in data], dtype=float)
+        self.validated = False
+
+        self._start_naive = start.replace(tzinfo=None)
+        self._step_months: int | None = None
+        self._month_datetimes: list[datetime] = []
+
+        if isinstance(step, datedelta):
+            if step.days:
+                raise ValueError(f"Unsupported history interval: {step}")
+
+            self._step_months = step.years * 12 + step.months
+
+    def _to_wall_clock(self, dt: datetime) -> datetime:
+        if dt.tzinfo and self.start.tzinfo:
+            dt = dt.astimezone(self.start.tzinfo)
+
+        return dt.replace(tzinfo=None)
+
+    def _month_wall_clocks(self, size: int) -> list[datetime]:
+        """Wall clock datetimes of the first size intervals of a month stepped series. Months are
+        stepped one interval at a time so a month end start carries over the same as adding intervals
+        to start ex. Jan 31 + 1M is Mar 1 and then Apr 1"""
+        month_datetimes = self._month_datetimes
+
+        if not month_datetimes:
+            month_datetimes.append(self._start_naive)
+
+        while len(month_datetimes) < size:
+            month_datetimes.append(month_datetimes[-1] + self.step)
+
+        return month_datetimes
+
+    def datetime_at(self, position: int) -> datetime:
+        if self._step_months is not None:
+            return self._month_wall_clocks(position + 1)[position].replace(tzinfo=self.start.tzinfo)
+
+        return self.start + self.step * position
+
+    def position_of(self, dt: datetime) -> int | None:
+        """Position of the interval at dt or None if it is not an interval of the series"""
+        dt_wall = self._to_wall_clock(dt)
+
+        if self._step_months is not None:
+            month_datetimes = self._month_wall_clocks(self.size)
+            position = bisect_left(month_datetimes, dt_wall, hi=self.size)
+
+            if position >= self.size or month_datetimes[position] != dt_wall:
+                return None
+        else:
+            position, remainder = divmod(dt_wall - self._start_naive, self.step)
+
+            if remainder:
+                return None
+
+        if not 0 <= position < self.size:
+            return None
+
+        return position
+
+    def position_on_date(self, dt: date) -> int | None:
+        """Position of the last interval on a date"""
+        next_day = datetime.combine(dt + timedelta(days=1), datetime.min.time())
+
+        if self._step_months is not None:
+            position = bisect_left(self._month_wall_clocks(self.size), next_day, hi=self.size) - 1
+        else:
+            position = min(-((self._start_naive - next_day) // self.step) - 1, self.size - 1)
+
+        if not 0 <= position < self.size or self.datetime_at(position).date() != dt:
+            return None
+
+        return position
+
+    def position_range(self, start: datetime | None = None, end: datetime | None = None) -> tuple[int, int]:
+        """Positions of the first and last intervals between start and end inclusive"""
+        first, last = 0, self.size - 1
+
+        if start:
+            start_wall = self._to_wall_clock(start)
+            while first <= last and self.datetime_at(first).replace(tzinfo=None) < start_wall:
+                first = self._next_position(first, start_wall)
+
+        if end:
+            end_wall = self._to_wall_clock(end)
+            while last >= first and self.datetime_at(last).replace(tzinfo=None) > end_wall:
+                last = self._previous_position(last, end_wall)
+
+        return first, last
+
+    def _next_position(self, position: int, dt_wall: datetime) -> int:
+        # jump to the estimate then step to the exact position
+        if self._step_months is None:
+            return max(position + 1, -((self._start_naive - dt_wall) // self.step))
+
+        return max(position + 1, bisect_left(self._month_wall_clocks(self.size), dt_wall, hi=self.size))
+
+    def _previous_position(self, position: int, dt_wall: datetime) -> int:
+        if self._step_months is None:
+            return min(position - 1, (dt_wall - self._start_naive) // self.step)
+
+        return min(position - 1, bisect_right(self._month_wall_clocks(self.size), dt_wall, hi=self.size) - 1)
+
+
 class OpennemDataHistory(BaseConfig):
     start: datetime
     last: datetime
@@ -114,33 +233,115 @@ class OpennemDataHistory(BaseConfig):
         PlainSerializer(lambda x: [cast_float_or_none(i) for i in x], return_type=float, when_used="json"),
     ] = pydantic.Field(..., description="Data values")
 
+    _index: HistoryIndex | None = PrivateAttr(default=None)
+    _index_key: tuple | None = PrivateAttr(default=None)
+
+    @property
+    def index(self) -> HistoryIndex:
+        """Index over the history. Rebuilt when data, start or interval are replaced (data
+        shouldn't be modified in place)"""
+        index_key = (id(self.data), len(self.data), self.start, self.interval)
+
+        if self._index is None or self._index_key != index_key:
+            self._index = HistoryIndex(self.start, self.get_interval(), self.data)
+            self._index_key = index_key
+
+        return self._index
+
+    @property
+    def series(self) -> np.ndarray:
+        """Values as a float array with nan for nulls"""
+        return self.index.series
+
+    def get_value(self, dt: datetime) -> ValidNumberOrNull:
+        """Get value for an interval"""
+        position = self.index.position_of(dt)
+
+        if position is None:
+            return None
+
+        return self.data[position]
+
     def get_date(self, dt: date) -> ValidNumberOrNull:
-        """Get value for a specific date"""
-        _values = self.values()
-        _get_value = list(filter(lambda x: x[0].date() == dt, _values))
+        """Get value for a specific date. For intervals less than a day this is the last interval of the date"""
+        position = self.index.position_on_date(dt)
 
-        if not _get_value:
+        if position is None:
             return None
 
-        return _get_value.pop()[1]
+        return self.data[position]
 
     def get_interval(self) -> timedelta | datedelta:
         return get_human_interval(self.interval)
 
-    def values(self) -> list[tuple[datetime, ValidNumberOrNull]]:
-        interval_obj = get_human_interval(self.interval)
-        dt = self.start
+    def slice(self, start: datetime | None = None, end: datetime | None = None) -> OpennemDataHistory | None:
+        """History for the intervals between start and end inclusive"""
+        first, last = self.index.position_range(start, end)
+
+        if first > last:
+            return None
+
+        return OpennemDataHistory(
+            start=self.index.datetime_at(first),
+            last=self.index.datetime_at(last),
+            interval=self.interval,
+            data=self.data[first : last + 1],
+        )
 
-        # return as list rather than generate as optimization
-        timeseries_data = []
+    def resample(self, interval: str, method: str = "sum") -> OpennemDataHistory:
+        """Resample to a larger interval that is a whole number of the current intervals, in chunks from
+        start. Chunks with only nulls are null
 
-        for v in self.data:
-            timeseries_data.append((dt, v))
-            dt = dt + interval_obj
+        :param interval: human interval ex. 1h
+        :param method: sum or mean
+        """
+        interval_to = get_human_interval(interval)
+        index_to = HistoryIndex(self.start, interval_to, [])
 
-        assert validate_data_outputs(self.data, self.get_interval(), self.start, self.last) is True
+        if (index_to._step_months is None) != (self.index._step_months is None):
+            raise ValueError(f"Can't resample {self.interval} to {interval}")
 
-        return timeseries_data
+        if index_to._step_months is not None:
+            chunk_size, remainder = divmod(index_to._step_months, self.index._step_months)
+        else:
+            chunk_size, remainder = divmod(interval_to, self.index.step)
+
+        if remainder or chunk_size < 1:
+            raise ValueError(f"Interval {interval} is not a multiple of {self.interval}")
+
+        num_chunks = -(-self.index.size // chunk_size)
+        chunks = np.full(num_chunks * chunk_size, np.nan)
+        chunks[: self.index.size] = self.series
+        chunks = chunks.reshape(num_chunks, chunk_size)
+
+        chunk_nulls = np.isnan(chunks).all(axis=1)
+
+        with np.errstate(invalid="ignore"):
+            if method == "sum":
+                values = np.nansum(chunks, axis=1)
+            elif method == "mean":
+                values = np.nanmean(np.where(chunk_nulls[:, None], 0, chunks), axis=1)
+            else:
+                raise ValueError(f"Invalid resample method: {method}")
+
+        data = values.astype(object)
+        data[chunk_nulls] = None
+
+        return OpennemDataHistory(
+            start=self.start,
+            last=index_to.datetime_at(num_chunks - 1),
+            interval=interval,
+            data=data.tolist(),
+        )
+
+    def values(self) -> list[tuple[datetime, ValidNumberOrNull]]:
+        index = self.index
+
+        if not index.validated:
+            assert validate_data_outputs(self.data, self.get_interval(), self.start, self.last) is True
+            index.validated = True
+
+        return [(index.datetime_at(position), v) for position, v in enumerate(self.data)]
 
 
 class OpennemData(BaseConfig):
@@ -309,6 +510,39 @@ class DataQueryResult(BaseConfig):
     group_by: str | None = None
 
 
+@dataclass
+class DataQueryColumns:
+    """Query results as columns which can be passed to stats_factory in place of a list of
+    DataQueryResult without building a model for each row"""
+
+    interval: list[datetime]
+    result: list[ValidNumberOrNull]
+    group_by: list[str | None]
+
+    @classmethod
+    def from_rows(
+        cls, rows: Sequence[Sequence[Any]], result_index: int, group_by_index: int | None = None, group_by: str | None = None
+    ) -> DataQueryColumns:
+        """Columns from query rows where the interval is the first field and the group is either a
+        field of the row or the same for every row"""
+        return cls(
+            interval=[i[0] for i in rows],
+            result=[i[result_index] for i in rows],
+            group_by=[i[group_by_index] for i in rows] if group_by_index is not None else [group_by] * len(rows),
+        )
+
+    @classmethod
+    def from_results(cls, results: list[DataQueryResult]) -> DataQueryColumns:
+        return cls(
+            interval=[i.interval for i in results],
+            result=[i.result for i in results],
+            group_by=[i.group_by for i in results],
+        )
+
+    def __len__(self) -> int:
+        return len(self.interval)
+
+
 class ScadaDateRange(BaseConfig):
     start: datetime
     end: datetime
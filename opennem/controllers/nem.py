@@ -5,23 +5,21 @@ Parses MMS tables into OpenNEM derived database
 
 import logging
 from collections.abc import Hashable
+from datetime import datetime
 from typing import Any
 
+import numpy as np
 import pandas as pd
-from sqlalchemy.dialects.postgresql import insert
 
 from opennem.controllers.schema import ControllerReturn
-from opennem.core.battery import get_battery_unit_map
+from opennem.core.battery import BatteryUnitMap, get_battery_unit_map
 from opennem.core.networks import NetworkNEM
-from opennem.core.normalizers import clean_float
 from opennem.core.parsers.aemo.mms import AEMOTableSchema, AEMOTableSet
-from opennem.db import get_write_session
-from opennem.db.bulk_insert_csv import bulkinsert_mms_items
+from opennem.db.bulk_insert_csv import bulkinsert_mms_items, bulkinsert_transaction
 from opennem.db.models.opennem import BalancingSummary, FacilityScada
 from opennem.importer.rooftop import rooftop_remap_regionids
 from opennem.schema.aemo.mms import MMSBaseClass
 from opennem.schema.network import NetworkAEMORooftop, NetworkSchema
-from opennem.utils.dates import parse_date
 
 logger = logging.getLogger("opennem.controllers.nem")
 
@@ -37,11 +35,31 @@ FACILITY_SCADA_COLUMN_NAMES = [
     "energy",
 ]
 
+# unique keys that upserts conflict on
+FACILITY_SCADA_CONFLICT_COLUMNS = ["interval", "network_id", "facility_code", "is_forecast"]
+BALANCING_SUMMARY_CONFLICT_COLUMNS = ["interval", "network_id", "network_region", "is_forecast"]
+
 # Helpers
 
 
+def remap_battery_facility_codes(df: pd.DataFrame, battery_unit_map: dict[str, BatteryUnitMap]) -> pd.Series:
+    """Map bidirectional battery units to their charge unit when generated is negative and
+    their discharge unit otherwise. Other facility codes are returned unchanged"""
+    facility_codes = df["facility_code"]
+
+    if not battery_unit_map or facility_codes.empty:
+        return facility_codes
+
+    charge_units = facility_codes.map({code: unit_map.charge_unit for code, unit_map in battery_unit_map.items()})
+    discharge_units = facility_codes.map({code: unit_map.discharge_unit for code, unit_map in battery_unit_map.items()})
+
+    remapped = pd.Series(np.where(df["generated"] < 0, charge_units, discharge_units), index=df.index)
+
+    return remapped.fillna(facility_codes)
+
+
 async def generate_facility_scada(
-    records: list[dict[str, Any] | MMSBaseClass],
+    records: pd.DataFrame | list[dict[str, Any] | MMSBaseClass],
     network: NetworkSchema = NetworkNEM,
     interval_field: str = "settlementdate",
     facility_code_field: str = "duid",
@@ -49,9 +67,13 @@ async def generate_facility_scada(
     energy_field: str | None = None,
     is_forecast: bool = False,
 ) -> list[dict[Hashable, Any]]:
-    """Optimized facility scada generator"""
+    """Optimized facility scada generator. Takes either a dataframe built from a table's
+    column store or a list of records"""
 
-    df = pd.DataFrame().from_records(records)
+    if isinstance(records, pd.DataFrame):
+        df = records.copy()
+    else:
+        df = pd.DataFrame().from_records(records)
 
     column_renames = {
         interval_field: "interval",
@@ -82,24 +104,9 @@ async def generate_facility_scada(
 
     df = df[FACILITY_SCADA_COLUMN_NAMES]
 
-    # Get battery unit mappings
+    # split bidirectional battery units into charge and discharge units
     battery_unit_map = await get_battery_unit_map()
-
-    # Create a function to map facility codes based on generated value
-    def map_battery_code(row):
-        facility_code = row["facility_code"]
-        generated = row["generated"]
-
-        if facility_code in battery_unit_map:
-            battery_map = battery_unit_map[facility_code]
-            if generated < 0:
-                return battery_map.charge_unit
-            else:
-                return battery_map.discharge_unit
-        return facility_code
-
-    # Apply the mapping function
-    df["facility_code"] = df.apply(map_battery_code, axis=1)
+    df["facility_code"] = remap_battery_facility_codes(df, battery_unit_map)
 
     # set the index
     df.set_index(["interval", "network_id", "facility_code", "is_forecast"], inplace=True)
@@ -113,283 +120,195 @@ async def generate_facility_scada(
     return clean_records
 
 
-# Processors
+def generate_interval_records(
+    table: AEMOTableSchema,
+    key_field: str,
+    key_name: str,
+    value_fields: dict[str, str],
+    interval_field: str = "settlementdate",
+    optional_fields: list[str] | None = None,
+    network: NetworkSchema = NetworkNEM,
+) -> pd.DataFrame:
+    """Shared dedupe and transform stage for tables keyed on (interval, key_field)
 
+    Drops records without an interval or key, keeps the first record for each
+    (interval, key) pair, casts the value fields to numbers and renames the columns
+    to interval, key_name and the names in value_fields."""
+    df = table.to_frame()
 
-async def process_dispatch_interconnectorres(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
-    records_to_store = []
-    primary_keys = []
+    # schema tables are indexed on their primary keys
+    if not isinstance(df.index, pd.RangeIndex):
+        df = df.reset_index()
 
-    for record in table.records:
-        interval = parse_date(record["settlementdate"])
+    for field in [interval_field, key_field, *value_fields]:
+        if field not in df.columns:
+            if field in (optional_fields or []) or df.empty:
+                df[field] = None
+                continue
 
-        if not interval:
-            logger.warning(f"Invalid interval for record: {record}")
-            continue
+            raise Exception(f"No {field} in table {table.full_name}")
 
-        interconnector_id = record.get("interconnectorid")
+    df = df[[interval_field, key_field, *value_fields]]
 
-        if not interconnector_id:
-            logger.warning(f"No interconnector id for record: {record}")
-            continue
+    if not pd.api.types.is_datetime64_any_dtype(df[interval_field]):
+        df[interval_field] = pd.to_datetime(df[interval_field], format="mixed", errors="coerce")
 
-        primary_key = {interval, interconnector_id}
+    df = df[df[interval_field].notna() & df[key_field].notna() & (df[key_field] != "")]
+    df = df.drop_duplicates(subset=[interval_field, key_field], keep="first")
 
-        if primary_key in primary_keys:
-            continue
+    for field in value_fields:
+        df[field] = pd.to_numeric(df[field], errors="coerce")
 
-        primary_keys.append(primary_key)
+    df = df.rename(columns={interval_field: "interval", key_field: key_name, **value_fields})
+    df["network_id"] = network.code
 
-        if "meteredmwflow" not in record:
-            raise Exception(f"No meteredmwflow in record: {record}")
+    return df
 
-        records_to_store.append(
-            {
-                "network_id": "NEM",
-                "facility_code": interconnector_id,
-                "interval": interval,
-                "generated": record.get("meteredmwflow", 0),
-            }
-        )
-        cr.processed_records += 1
-
-    # insert
-    async with get_write_session() as session:
-        try:
-            stmt = insert(FacilityScada).values(records_to_store)
-            stmt = stmt.on_conflict_do_update(
-                index_elements=["interval", "network_id", "facility_code", "is_forecast"],
-                set_={"generated": stmt.excluded.generated},
-            )
-
-            await session.execute(stmt)
-            await session.commit()
-
-            cr.inserted_records = cr.processed_records
-            cr.server_latest = max([r["interval"] for r in records_to_store]) if records_to_store else None
-        except Exception as e:
-            logger.error("Error inserting dispatch interconnectorres records")
-            logger.error(e)
-            cr.errors = cr.processed_records
-            await session.rollback()
-        finally:
-            await session.close()
 
-    return cr
+def interval_records_to_dicts(df: pd.DataFrame) -> list[dict[Hashable, Any]]:
+    """Records from generate_interval_records with missing values as None"""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
 
 
-async def process_nem_price(table: AEMOTableSchema) -> ControllerReturn:
-    """Stores the NEM price for both dispatch price and trading price"""
+def interval_records_latest(df: pd.DataFrame) -> datetime | None:
+    if df.empty:
+        return None
 
-    cr = ControllerReturn(total_records=len(table.records))
-    records_to_store = []
-    primary_keys = []
+    return df["interval"].max().to_pydatetime()
 
-    price_field = "price"
 
-    if table.full_name == "dispatch_price":
-        price_field = "price_dispatch"
+# Processors
 
-    for record in table.records:
-        interval = parse_date(record["settlementdate"])
 
-        primary_key = {interval, record["regionid"]}
+async def process_dispatch_interconnectorres(table: AEMOTableSchema) -> ControllerReturn:
+    cr = ControllerReturn(total_records=table.record_count)
 
-        if primary_key in primary_keys:
-            continue
+    df = generate_interval_records(
+        table,
+        key_field="interconnectorid",
+        key_name="facility_code",
+        value_fields={"meteredmwflow": "generated"},
+    )
 
-        primary_keys.append(primary_key)
+    # the frame is handed to the bulk inserter as is and encoded column by column
+    records_to_store = df
+    cr.processed_records = len(records_to_store)
 
-        records_to_store.append(
-            {
-                "network_id": "NEM",
-                "network_region": record.get("regionid"),
-                "interval": interval,
-                price_field: record["rrp"],
-            }
+    try:
+        cr.inserted_records = await bulkinsert_mms_items(
+            FacilityScada, records_to_store, ["generated"], conflict_columns=FACILITY_SCADA_CONFLICT_COLUMNS
         )
+        cr.server_latest = interval_records_latest(df)
+    except Exception as e:
+        logger.error("Error inserting dispatch interconnectorres records")
+        logger.error(e)
+        cr.errors = cr.processed_records
 
-        cr.processed_records += 1
-
-    # Process records in chunks
-    chunk_size = 1000
-    for i in range(0, len(records_to_store), chunk_size):
-        chunk = records_to_store[i : i + chunk_size]
-
-        async with get_write_session() as session:
-            try:
-                stmt = insert(BalancingSummary).values(chunk)
-                stmt = stmt.on_conflict_do_update(
-                    index_elements=["interval", "network_id", "network_region", "is_forecast"],
-                    set_={price_field: getattr(stmt.excluded, price_field)},
-                )
-
-                await session.execute(stmt)
-                await session.commit()
+    return cr
 
-                cr.inserted_records += len(chunk)
 
-                logger.debug(f"Inserted {len(chunk)} records for NEM price")
-            except Exception as e:
-                logger.error(f"Error inserting NEM price records (chunk {i//chunk_size + 1})")
-                logger.error(e)
-                cr.errors += len(chunk)
-                await session.rollback()
-            finally:
-                await session.close()
+async def process_nem_price(table: AEMOTableSchema) -> ControllerReturn:
+    """Stores the NEM price for both dispatch price and trading price"""
 
-    cr.server_latest = max([r["interval"] for r in records_to_store]) if records_to_store else None
+    cr = ControllerReturn(total_records=table.record_count)
 
-    return cr
+    price_field = "price"
 
+    if table.full_name == "dispatch_price":
+        price_field = "price_dispatch"
 
-async def process_dispatch_regionsum(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
-    records_to_store = []
-    primary_keys = []
+    df = generate_interval_records(table, key_field="regionid", key_name="network_region", value_fields={"rrp": price_field})
 
-    for record in table.records:
-        if not isinstance(record, dict):
-            continue
+    records_to_store = df
+    cr.processed_records = len(records_to_store)
 
-        interval = parse_date(record.get("settlementdate"))
+    # only the price column is copied and updated so demand etc. on existing rows is kept
+    try:
+        cr.inserted_records = await bulkinsert_mms_items(
+            BalancingSummary, records_to_store, [price_field], conflict_columns=BALANCING_SUMMARY_CONFLICT_COLUMNS
+        )
+        cr.server_latest = interval_records_latest(df)
+    except Exception as e:
+        logger.error("Error inserting NEM price records")
+        logger.error(e)
+        cr.errors = cr.processed_records
 
-        primary_key = {interval, record["regionid"]}
+    return cr
 
-        if primary_key in primary_keys:
-            continue
 
-        primary_keys.append(primary_key)
+async def process_dispatch_regionsum(table: AEMOTableSchema) -> ControllerReturn:
+    cr = ControllerReturn(total_records=table.record_count)
+
+    df = generate_interval_records(
+        table,
+        key_field="regionid",
+        key_name="network_region",
+        value_fields={
+            "netinterchange": "net_interchange",
+            "totaldemand": "demand",
+            "demand_and_nonschedgen": "demand_total",
+        },
+    )
 
-        if "demand_and_nonschedgen" not in record:
-            raise Exception("bad value in dispatch_regionsum")
+    records_to_store = df
+    cr.processed_records = len(records_to_store)
 
-        records_to_store.append(
-            {
-                "network_id": "NEM",
-                "network_region": record["regionid"],
-                "interval": interval,
-                "net_interchange": record["netinterchange"],
-                "demand": record["totaldemand"],
-                "demand_total": record["demand_and_nonschedgen"],
-            }
+    try:
+        cr.inserted_records = await bulkinsert_mms_items(
+            BalancingSummary,
+            records_to_store,
+            ["net_interchange", "demand_total", "demand"],
+            conflict_columns=BALANCING_SUMMARY_CONFLICT_COLUMNS,
         )
-
-        cr.processed_records += 1
-
-    async with get_write_session() as session:
-        try:
-            stmt = insert(BalancingSummary).values(records_to_store)
-            stmt = stmt.on_conflict_do_update(
-                index_elements=["interval", "network_id", "network_region", "is_forecast"],
-                set_={
-                    "net_interchange": stmt.excluded.net_interchange,
-                    "demand_total": stmt.excluded.demand_total,
-                    "demand": stmt.excluded.demand,
-                },
-            )
-
-            await session.execute(stmt)
-            await session.commit()
-
-            cr.inserted_records = cr.processed_records
-            cr.server_latest = max([r["interval"] for r in records_to_store]) if records_to_store else None
-        except Exception as e:
-            logger.error("Error inserting dispatch regionsum records")
-            logger.error(e)
-            cr.errors = cr.processed_records
-            await session.rollback()
-        finally:
-            await session.close()
+        cr.server_latest = interval_records_latest(df)
+    except Exception as e:
+        logger.error("Error inserting dispatch regionsum records")
+        logger.error(e)
+        cr.errors = cr.processed_records
 
     return cr
 
 
 async def process_trading_regionsum(table: AEMOTableSchema) -> ControllerReturn:
     """Process trading regionsum"""
-    if not table.records:
+    if not table.record_count:
         logger.debug(table)
         raise Exception("Invalid table no records")
 
-    cr = ControllerReturn(total_records=len(table.records))
-    limit = None
-    records_to_store = []
-    records_processed = 0
-    primary_keys = []
-
-    for record in table.records:
-        if not isinstance(record, dict):
-            raise Exception("Invalid record type")
-
-        interval = parse_date(
-            record["settlementdate"],
-            dayfirst=False,
-            date_format="%Y/%m/%d %H:%M:%S",
-        )
-
-        if not interval:
-            continue
-
-        _pk = {interval, record["regionid"]}
+    cr = ControllerReturn(total_records=table.record_count)
 
-        if _pk in primary_keys:
-            continue
-
-        primary_keys.append(_pk)
-
-        net_interchange = None
+    df = generate_interval_records(
+        table,
+        key_field="regionid",
+        key_name="network_region",
+        value_fields={"netinterchange": "net_interchange_trading"},
+        optional_fields=["netinterchange"],
+    )
 
-        if "netinterchange" in record:
-            net_interchange = clean_float(record["netinterchange"])
+    records_to_store = df
+    cr.processed_records = len(records_to_store)
 
-        records_to_store.append(
-            {
-                "network_id": "NEM",
-                "network_region": record["regionid"],
-                "net_interchange_trading": net_interchange,
-                "interval": interval,
-            }
+    try:
+        cr.inserted_records = await bulkinsert_mms_items(
+            BalancingSummary,
+            records_to_store,
+            ["net_interchange_trading"],
+            conflict_columns=BALANCING_SUMMARY_CONFLICT_COLUMNS,
         )
-
-        records_processed += 1
-
-        if limit and records_processed >= limit:
-            logger.info(f"Reached limit of: {limit} {records_processed}")
-            break
-
-    async with get_write_session() as session:
-        try:
-            stmt = insert(BalancingSummary).values(records_to_store)
-            stmt = stmt.on_conflict_do_update(
-                index_elements=["interval", "network_id", "network_region", "is_forecast"],
-                set_={
-                    "net_interchange_trading": stmt.excluded.net_interchange_trading,
-                },
-            )
-
-            await session.execute(stmt)
-            await session.commit()
-
-            cr.inserted_records = records_processed
-            cr.processed_records = records_processed
-            cr.server_latest = max([i["interval"] for i in records_to_store]) if records_to_store else None
-        except Exception as e:
-            logger.error("Error inserting records")
-            logger.error(e)
-            cr.errors = records_processed
-            await session.rollback()
-        finally:
-            await session.close()
+        cr.server_latest = interval_records_latest(df)
+    except Exception as e:
+        logger.error("Error inserting records")
+        logger.error(e)
+        cr.errors = cr.processed_records
 
     return cr
 
 
 async def process_unit_scada_optimized(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = await generate_facility_scada(
-        table.records,  # type:ignore
+        table.to_frame(),
         interval_field="settlementdate",
         facility_code_field="duid",
         power_field="scadavalue",
@@ -403,10 +322,10 @@ async def process_unit_scada_optimized(table: AEMOTableSchema) -> ControllerRetu
 
 
 async def process_unit_solution(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = await generate_facility_scada(
-        table.records,  # type: ignore
+        table.to_frame(),
         interval_field="settlementdate",
         facility_code_field="duid",
         power_field="initialmw",
@@ -420,10 +339,10 @@ async def process_unit_solution(table: AEMOTableSchema) -> ControllerReturn:
 
 
 async def process_meter_data_gen_duid(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = await generate_facility_scada(
-        table.records,  # type: ignore
+        table.to_frame(),
         interval_field="interval_datetime",
         facility_code_field="duid",
         power_field="mwh_reading",
@@ -437,10 +356,10 @@ async def process_meter_data_gen_duid(table: AEMOTableSchema) -> ControllerRetur
 
 
 async def process_rooftop_actual(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = await generate_facility_scada(
-        table.records,  # type: ignore
+        table.to_frame(),
         interval_field="interval_datetime",
         facility_code_field="regionid",
         power_field="power",
@@ -458,10 +377,10 @@ async def process_rooftop_actual(table: AEMOTableSchema) -> ControllerReturn:
 
 
 async def process_rooftop_forecast(table: AEMOTableSchema) -> ControllerReturn:
-    cr = ControllerReturn(total_records=len(table.records))
+    cr = ControllerReturn(total_records=table.record_count)
 
     records = await generate_facility_scada(
-        table.records,  # type: ignore
+        table.to_frame(),
         interval_field="interval_datetime",
         facility_code_field="regionid",
         power_field="powermean",
@@ -499,35 +418,44 @@ async def store_aemo_tableset(tableset: AEMOTableSet) -> ControllerReturn:
 
     cr = ControllerReturn()
 
-    for table in tableset.tables:
-        if table.full_name not in _TABLE_PROCESSOR_MAP:
-            logger.debug("No processor for table %s", table.full_name)
-            continue
+    # all tables of the set are copied and merged in one transaction on one connection. Each
+    # table runs in its own savepoint so a failing table is rolled back and logged without
+    # aborting the other tables of the set
+    async with bulkinsert_transaction() as conn:
+        for table in tableset.tables:
+            if table.full_name not in _TABLE_PROCESSOR_MAP:
+                logger.debug("No processor for table %s", table.full_name)
+                continue
 
-        process_meth = _TABLE_PROCESSOR_MAP[table.full_name]
+            process_meth = _TABLE_PROCESSOR_MAP[table.full_name]
 
-        if process_meth not in globals():
-            logger.info("Invalid processing function %s", process_meth)
-            continue
+            if process_meth not in globals():
+                logger.info("Invalid processing function %s", process_meth)
+                continue
 
-        logger.info(f"processing table {table.full_name} with {len(table.records)} records")
+            logger.info(f"processing table {table.full_name} with {table.record_count} records")
 
-        record_item = None
+            record_item = None
 
-        try:
-            record_item = await globals()[process_meth](table)
-            logger.info(f"Stored {record_item.inserted_records} records for table {table.full_name}")
-        except Exception as e:
-            logger.error(f"Error processing {table.full_name}: {e}")
-            raise e
+            try:
+                async with conn.transaction():
+                    record_item = await globals()[process_meth](table)
 
-        if record_item:
-            cr.processed_records += record_item.processed_records
-            cr.total_records += record_item.total_records
-            cr.inserted_records += record_item.inserted_records
-            cr.errors += record_item.errors
-            cr.error_detail += record_item.error_detail
-            cr.server_latest = record_item.server_latest
+                logger.info(f"Stored {record_item.inserted_records} records for table {table.full_name}")
+            except Exception as e:
+                logger.error(f"Error processing {table.full_name}: {e}")
+                cr.total_records += table.record_count
+                cr.errors += table.record_count
+                cr.error_detail.append(f"Error processing {table.full_name}: {e}")
+                continue
+
+            if record_item:
+                cr.processed_records += record_item.processed_records
+                cr.total_records += record_item.total_records
+                cr.inserted_records += record_item.inserted_records
+                cr.errors += record_item.errors
+                cr.error_detail += record_item.error_detail
+                cr.server_latest = record_item.server_latest
 
     logger.info(f"Stored {cr.inserted_records} records of {cr.total_records} in {len(tableset.tables)} tables")
 
@@ -2,7 +2,7 @@ import logging
 
 from opennem import settings
 from opennem.api.stats.controllers import stats_factory
-from opennem.api.stats.schema import DataQueryResult, OpennemDataSet
+from opennem.api.stats.schema import DataQueryColumns, OpennemDataSet
 from opennem.controllers.output.schema import OpennemExportSeries
 from opennem.core.units import get_unit
 from opennem.db import get_database_engine
@@ -37,16 +37,12 @@ async def power_flows_per_interval(
         logger.error(f"No results from interconnector_power_flow query for {time_series.interval}")
         return None
 
-    imports = [DataQueryResult(interval=i[0], result=i[3], group_by="imports" if len(i) > 1 else None) for i in rows]
-    exports = [DataQueryResult(interval=i[0], result=i[4], group_by="exports" if len(i) > 1 else None) for i in rows]
-    emissions_imports = [DataQueryResult(interval=i[0], result=i[5], group_by="imports" if len(i) > 1 else None) for i in rows]
-    emissions_exports = [DataQueryResult(interval=i[0], result=i[6], group_by="exports" if len(i) > 1 else None) for i in rows]
-    emissions_factor_imports = [
-        DataQueryResult(interval=i[0], result=i[9], group_by="imports" if len(i) > 1 else None) for i in rows
-    ]
-    emissions_factor_exports = [
-        DataQueryResult(interval=i[0], result=i[10], group_by="exports" if len(i) > 1 else None) for i in rows
-    ]
+    imports = DataQueryColumns.from_rows(rows, result_index=3, group_by="imports")
+    exports = DataQueryColumns.from_rows(rows, result_index=4, group_by="exports")
+    emissions_imports = DataQueryColumns.from_rows(rows, result_index=5, group_by="imports")
+    emissions_exports = DataQueryColumns.from_rows(rows, result_index=6, group_by="exports")
+    emissions_factor_imports = DataQueryColumns.from_rows(rows, result_index=9, group_by="imports")
+    emissions_factor_exports = DataQueryColumns.from_rows(rows, result_index=10, group_by="exports")
 
     result = stats_factory(
         imports,
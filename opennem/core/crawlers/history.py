@@ -1,19 +1,22 @@
 """ " Reads and stores crawler history"""
 
 import logging
+import time
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from textwrap import dedent
 
+import numpy as np
 from datetime_truncate import truncate as date_trunc
 from sqlalchemy import text as sql
-from sqlalchemy.dialects.postgresql import insert
 
 from opennem.core.time import get_interval
-from opennem.db import SessionLocal, db_connect
+from opennem.db import db_connect
+from opennem.db.bulk_insert_csv import bulkinsert_mms_items
 from opennem.db.models.opennem import CrawlHistory
+from opennem.schema.network import NetworkNEM
 from opennem.schema.time import TimeInterval
-from opennem.utils.dates import get_today_opennem
+from opennem.utils.dates import get_last_completed_interval_for_network, get_today_opennem
 
 logger = logging.getLogger("opennem.crawler.history")
 
@@ -29,76 +32,109 @@ class CrawlHistoryGap:
     interval: datetime
 
 
+# crawl history buffered by CrawlHistoryWriter is flushed at this many entries or
+# once the oldest buffered entry is this many seconds old
+CRAWL_HISTORY_FLUSH_SIZE = 1_000
+CRAWL_HISTORY_FLUSH_SECONDS = 30.0
+
+_CRAWL_HISTORY_CONFLICT_COLUMNS = ["source", "crawler_name", "network_id", "interval"]
+_CRAWL_HISTORY_UPDATE_COLUMNS = ["inserted_records", "crawled_time", "processed_time"]
+
+
+def _crawl_history_records(crawler_name: str, histories: list[CrawlHistoryEntry]) -> list[dict[str, datetime | str | int | None]]:
+    processed_time = get_today_opennem()
+
+    return [
+        {
+            "source": "nemweb",
+            "crawler_name": crawler_name,
+            "network_id": "NEM",
+            "interval": ch.interval,
+            "inserted_records": ch.records,
+            "crawled_time": None,
+            "processed_time": processed_time,
+        }
+        for ch in histories
+    ]
+
+
 async def set_crawler_history(crawler_name: str, histories: list[CrawlHistoryEntry]) -> int:
     """Sets the crawler history"""
-    engine = db_connect()
+    if not histories:
+        return 0
 
-    history_intervals = [i.interval for i in histories]
+    # an interval can only be upserted once per statement so the last entry wins
+    histories = list({ch.interval: ch for ch in histories}.values())
 
-    logger.debug(f"Have {len(history_intervals)} history intervals for {crawler_name}")
+    logger.debug(f"Have {len(histories)} history intervals for {crawler_name}")
 
-    date_max = max(history_intervals)
-    date_min = min(history_intervals)
+    try:
+        await bulkinsert_mms_items(
+            CrawlHistory,
+            _crawl_history_records(crawler_name, histories),
+            _CRAWL_HISTORY_UPDATE_COLUMNS,  # type: ignore
+            conflict_columns=_CRAWL_HISTORY_CONFLICT_COLUMNS,
+        )
+    except Exception as e:
+        logger.error(f"set_crawler_history error updating records: {e}")
+        return 0
 
-    logger.debug(f"crawler {crawler_name} date range: {date_min}, {date_max}")
+    _mark_crawler_intervals(crawler_name, histories)
 
-    stmt = sql(
-        """
-        select
-            interval
-        from crawl_history
-        where
-            interval >= :date_max
-            and interval <= :date_min
+    return len(histories)
+
+
+class CrawlHistoryWriter:
+    """Buffers crawl history entries over a crawl run and writes them in batches
+
+    Use as an async context manager so that whatever is left is written at the end:
+
+        async with CrawlHistoryWriter(crawler.name) as history_writer:
+            await history_writer.add(CrawlHistoryEntry(interval=interval, records=records))
     """
-    )
 
-    query = stmt.bindparams(date_max=date_max, date_min=date_min)
+    def __init__(
+        self,
+        crawler_name: str,
+        flush_size: int = CRAWL_HISTORY_FLUSH_SIZE,
+        flush_seconds: float = CRAWL_HISTORY_FLUSH_SECONDS,
+    ) -> None:
+        self.crawler_name = crawler_name
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
 
-    async with engine.connect() as conn:
-        result = await conn.execute(query)
-        results = list(result.fetchall())
-
-    existing_intervals = [i[0] for i in results]
-
-    logger.debug(f"Got {len(existing_intervals)} existing intervals for crawler {crawler_name}")
-
-    # Persist the crawl history records
-    crawl_history_records: list[dict[str, datetime | str | int | None]] = []
-
-    for ch in histories:
-        crawl_history_records.append(
-            {
-                "source": "nemweb",
-                "crawler_name": crawler_name,
-                "network_id": "NEM",
-                "interval": ch.interval,
-                "inserted_records": ch.records,
-                "crawled_time": None,
-                "processed_time": get_today_opennem(),
-            }
-        )
+        self._entries: dict[datetime, CrawlHistoryEntry] = {}
+        self._buffered_at: float | None = None
 
-    # insert
-    stmt = insert(CrawlHistory).values(crawl_history_records)
-    stmt.bind = engine  # type: ignore
-    stmt = stmt.on_conflict_do_update(  # type: ignore
-        index_elements=["source", "crawler_name", "network_id", "interval"],
-        set_={
-            "inserted_records": stmt.excluded.inserted_records,  # type: ignore
-            "crawled_time": stmt.excluded.crawled_time,  # type: ignore
-            "processed_time": stmt.excluded.processed_time,  # type: ignore
-        },
-    )
+    @property
+    def pending(self) -> int:
+        return len(self._entries)
 
-    async with SessionLocal() as session:
-        try:
-            await session.execute(stmt)
-            await session.commit()
-        except Exception as e:
-            logger.error(f"set_crawler_history error updating records: {e}")
+    async def add(self, entry: CrawlHistoryEntry) -> None:
+        self._entries[entry.interval] = entry
 
-    return len(histories)
+        if self._buffered_at is None:
+            self._buffered_at = time.monotonic()
+
+        if len(self._entries) >= self.flush_size or time.monotonic() - self._buffered_at >= self.flush_seconds:
+            await self.flush()
+
+    async def flush(self) -> int:
+        if not self._entries:
+            return 0
+
+        # swap the buffer out before writing so entries added meanwhile go to the next flush
+        histories = list(self._entries.values())
+        self._entries = {}
+        self._buffered_at = None
+
+        return await set_crawler_history(crawler_name=self.crawler_name, histories=histories)
+
+    async def __aenter__(self) -> "CrawlHistoryWriter":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.flush()
 
 
 async def get_crawler_history(crawler_name: str, interval: TimeInterval, days: int = 3) -> list[datetime]:
@@ -143,6 +179,112 @@ async def get_crawler_history(crawler_name: str, interval: TimeInterval, days: i
     return models
 
 
+@dataclass
+class CrawlerIntervalBitmap:
+    """Which intervals a crawler has history for as a bool array indexed by interval number from start.
+
+    Intervals are naive in NEM time (AEST) to match the AEMO filenames"""
+
+    start: datetime
+    interval_size: int
+    crawled: np.ndarray
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def _step(self) -> timedelta:
+        return timedelta(minutes=self.interval_size)
+
+    def _index(self, dt: datetime) -> int | None:
+        dt = _to_nem_naive(dt)
+        position, remainder = divmod(dt - self.start, self._step)
+
+        if remainder or position < 0:
+            return None
+
+        return position
+
+    def covers(self, dt: datetime) -> bool:
+        return self._index(dt) is not None
+
+    def mark(self, intervals: list[datetime]) -> None:
+        positions = [i for i in map(self._index, intervals) if i is not None]
+
+        if not positions:
+            return
+
+        if max(positions) >= len(self.crawled):
+            self.crawled = np.concatenate([self.crawled, np.zeros(max(positions) + 1 - len(self.crawled), dtype=bool)])
+
+        self.crawled[positions] = True
+
+    def missing(self, start: datetime, end: datetime) -> list[datetime]:
+        """Intervals from start to end inclusive without history, newest first"""
+        start_index = self._index(start)
+        end_index = self._index(end)
+
+        if start_index is None or end_index is None:
+            raise ValueError(f"Range {start} to {end} is not covered by the bitmap starting {self.start}")
+
+        window = np.zeros(end_index - start_index + 1, dtype=bool)
+        covered = self.crawled[start_index : end_index + 1]
+        window[: len(covered)] = covered
+
+        return [start + self._step * int(i) for i in np.flatnonzero(~window)[::-1]]
+
+
+# bitmaps by crawler name and interval size. reloaded from crawl_history after this many
+# seconds to pick up history written by other processes
+CRAWL_HISTORY_RECONCILE_SECONDS = 3600
+
+_CRAWLER_INTERVAL_BITMAPS: dict[tuple[str, int], CrawlerIntervalBitmap] = {}
+
+
+def _to_nem_naive(dt: datetime) -> datetime:
+    if dt.tzinfo:
+        return dt.astimezone(NetworkNEM.get_fixed_offset()).replace(tzinfo=None)
+
+    return dt
+
+
+def _mark_crawler_intervals(crawler_name: str, histories: list[CrawlHistoryEntry]) -> None:
+    """Update loaded bitmaps for the crawler with newly written history"""
+    intervals = [ch.interval for ch in histories if ch.records is not None]
+
+    for (bitmap_crawler_name, _), bitmap in _CRAWLER_INTERVAL_BITMAPS.items():
+        if bitmap_crawler_name == crawler_name:
+            bitmap.mark(intervals)
+
+
+async def _load_crawler_interval_bitmap(crawler_name: str, interval: TimeInterval, start: datetime) -> CrawlerIntervalBitmap:
+    engine = db_connect()
+
+    # the cast matches the naive intervals the same way the crawl history was written
+    stmt = sql(
+        """
+        select
+            interval::timestamp
+        from crawl_history
+        where
+            crawler_name = :crawler_name
+            and inserted_records is not null
+            and interval >= cast(:start as timestamp)
+    """
+    )
+
+    query = stmt.bindparams(crawler_name=crawler_name, start=start)
+
+    async with engine.begin() as conn:
+        result = await conn.execute(query)
+        results = result.fetchall()
+
+    bitmap = CrawlerIntervalBitmap(start=start, interval_size=interval.interval, crawled=np.zeros(0, dtype=bool))
+    bitmap.mark([i[0] for i in results])
+
+    logger.debug(f"Loaded interval bitmap for crawler {crawler_name} with {len(results)} intervals since {start}")
+
+    return bitmap
+
+
 async def get_crawler_missing_intervals(
     crawler_name: str,
     interval: TimeInterval,
@@ -150,10 +292,46 @@ async def get_crawler_missing_intervals(
 ) -> list[datetime]:
     """Gets the crawler missing intervals going back a period of days
 
+    Sub-hourly intervals are looked up in an in-memory bitmap of the crawl history that is
+    updated as history is written and reconciled against the database periodically
+
     :param crawler_name: The crawler name
     :param interval: The interval to check
     :param days: The number of days to check back
     """
+    if not days or not isinstance(days, int):
+        raise Exception("Days is required and should be an int")
+
+    # longer intervals are truncated to calendar periods and have few intervals to check
+    if interval.interval >= 60:
+        return await _get_crawler_missing_intervals_sql(crawler_name, interval, days)
+
+    # same as nemweb_latest_interval() in the database aligned to the crawler interval so the
+    # window start stays on the bitmap intervals between calls
+    latest = get_last_completed_interval_for_network(NetworkNEM, tz_aware=False)
+    latest = latest.replace(minute=latest.minute - latest.minute % interval.interval, second=0, microsecond=0)
+    start = latest - timedelta(days=days)
+
+    bitmap_key = (crawler_name, interval.interval)
+    bitmap = _CRAWLER_INTERVAL_BITMAPS.get(bitmap_key)
+
+    if not bitmap or not bitmap.covers(start) or time.monotonic() - bitmap.loaded_at > CRAWL_HISTORY_RECONCILE_SECONDS:
+        bitmap = await _load_crawler_interval_bitmap(crawler_name, interval, start)
+        _CRAWLER_INTERVAL_BITMAPS[bitmap_key] = bitmap
+
+    models = bitmap.missing(start, latest)
+
+    logger.debug(f"Got {len(models)} missing intervals for crawler {crawler_name}")
+
+    return models
+
+
+async def _get_crawler_missing_intervals_sql(
+    crawler_name: str,
+    interval: TimeInterval,
+    days: int = 14,
+) -> list[datetime]:
+    """Gets the crawler missing intervals going back a period of days from the database"""
     engine = db_connect()
 
     stmt = sql(
@@ -182,9 +360,6 @@ async def get_crawler_missing_intervals(
     """
     )
 
-    if not days or not isinstance(days, int):
-        raise Exception("Days is required and should be an int")
-
     query = stmt.bindparams(crawler_name=crawler_name)
 
     async with engine.begin() as conn:
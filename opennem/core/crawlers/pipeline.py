@@ -0,0 +1,104 @@
+"""
+Bounded concurrency pipeline for crawlers.
+
+Items flow through a list of stages (ex. download -> parse -> store). Each stage has its own
+pool of workers and a bounded input queue so a slow stage applies backpressure to the
+stages before it rather than letting work pile up in memory. An item that fails in any
+stage is recorded and dropped without affecting the other items in flight.
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+logger = logging.getLogger("opennem.core.crawlers.pipeline")
+
+# sentinel to signal to a worker that there are no more items
+_STAGE_DONE = object()
+
+
+@dataclass
+class PipelineStage:
+    """A stage in the pipeline. The handler takes the output of the previous stage"""
+
+    name: str
+    handler: Callable[[Any], Awaitable[Any]]
+    concurrency: int = 1
+
+    # number of items that can wait on this stage. defaults to the concurrency
+    queue_size: int | None = None
+
+
+@dataclass
+class PipelineError:
+    stage: str
+    item: Any
+    error: Exception
+
+
+@dataclass
+class PipelineResult:
+    results: list[Any] = field(default_factory=list)
+    errors: list[PipelineError] = field(default_factory=list)
+
+
+async def run_pipeline(items: Iterable[Any], stages: list[PipelineStage]) -> PipelineResult:
+    """Run items through the stages and return the outputs of the final stage"""
+    if not stages:
+        raise ValueError("Pipeline requires at least one stage")
+
+    pipeline_result = PipelineResult()
+
+    queues: list[asyncio.Queue] = [
+        asyncio.Queue(maxsize=max(stage.queue_size or stage.concurrency, 1)) for stage in stages
+    ]
+
+    async def _stage_worker(stage_index: int) -> None:
+        stage = stages[stage_index]
+        queue_in = queues[stage_index]
+        queue_out = queues[stage_index + 1] if stage_index + 1 < len(stages) else None
+
+        while True:
+            item = await queue_in.get()
+
+            if item is _STAGE_DONE:
+                return
+
+            try:
+                stage_output = await stage.handler(item)
+            except Exception as e:
+                logger.error(f"Pipeline stage {stage.name} error: {e}")
+                pipeline_result.errors.append(PipelineError(stage=stage.name, item=item, error=e))
+                continue
+
+            # a stage can drop an item by returning None
+            if stage_output is None:
+                continue
+
+            if queue_out:
+                await queue_out.put(stage_output)
+            else:
+                pipeline_result.results.append(stage_output)
+
+    async def _run_stage(stage_index: int) -> None:
+        workers = [asyncio.create_task(_stage_worker(stage_index)) for _ in range(max(stages[stage_index].concurrency, 1))]
+
+        await asyncio.gather(*workers)
+
+        # once all workers have finished signal the next stage
+        if stage_index + 1 < len(stages):
+            for _ in range(max(stages[stage_index + 1].concurrency, 1)):
+                await queues[stage_index + 1].put(_STAGE_DONE)
+
+    async def _feed() -> None:
+        for item in items:
+            await queues[0].put(item)
+
+        for _ in range(max(stages[0].concurrency, 1)):
+            await queues[0].put(_STAGE_DONE)
+
+    await asyncio.gather(_feed(), *[_run_stage(i) for i in range(len(stages))])
+
+    return pipeline_result
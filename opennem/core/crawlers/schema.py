@@ -48,6 +48,12 @@ class CrawlerDefinition(BaseConfig):
     backfill_days: int | None = None
     bulk_insert: bool = Field(default=False)
 
+    # number of entries handled at once by each stage of the crawl pipeline
+    # see opennem.core.crawlers.pipeline
+    download_concurrency: int = 4
+    parse_concurrency: int = 2
+    store_concurrency: int = 2
+
     priority: CrawlerPriority
     schedule: CrawlerSchedule | None = None
     backoff: int | None = None
@@ -1,90 +1,80 @@
 import logging
-from io import BytesIO
+from collections.abc import Generator
 from pathlib import Path
-from zipfile import ZipFile
+from tempfile import SpooledTemporaryFile
+from typing import IO
 
-from opennem.utils.archive import _handle_zip, chain_streams
+from opennem.utils.archive import DOWNLOAD_CHUNK_SIZE, iter_zip_members
 from opennem.utils.httpx import http
 from opennem.utils.mime import mime_from_content, mime_from_url
+from opennem.utils.url import get_filename_from_url
 
 logger = logging.getLogger("opennem.downloader")
 
+# downloads up to this size are kept in memory and larger ones are spooled to disk
+DOWNLOAD_MEMORY_LIMIT = 10 * 1024 * 1024
 
-async def url_downloader(url: str) -> bytes:
-    """Downloads a URL and returns content, handling embedded zips and other MIME's"""
-
-    logger.debug(f"Downloading: {url}")
-
-    response = await http.get(url)
-
-    response.raise_for_status()
-
-    content = BytesIO(response.content)
 
+def iter_content_streams(
+    content: IO[bytes], url: str | None = None, suffixes: tuple[str, ...] | None = None
+) -> Generator[tuple[str, IO[bytes]], None, None]:
+    """Yield (filename, stream) for each file in content. Zips and zips of zips are
+    iterated member by member with each member read lazily, anything else is yielded as is"""
     file_mime = mime_from_content(content)
 
-    if not file_mime:
+    if not file_mime and url:
         file_mime = mime_from_url(url)
 
-    # @TODO handle all this in utils/archive.py
-    # and make it all generic to handle other
-    # mime types
+    # @TODO handle other archive mime types
     if file_mime == "application/zip":
-        with ZipFile(content) as zf:
-            if len(zf.namelist()) == 1:
-                return zf.open(zf.namelist()[0]).read()
+        yield from iter_zip_members(content, suffixes=suffixes)
+        return
 
-            c = []
-            stream_count = 0
+    content.seek(0)
 
-            for filename in zf.namelist():
-                if filename.endswith(".zip"):
-                    c.append(_handle_zip(zf.open(filename), "r"))
-                    stream_count += 1
-                else:
-                    c.append(zf.open(filename))
+    yield get_filename_from_url(url) if url else "", content
 
-            return chain_streams(c).read()
 
-    return content.getvalue()
+async def url_download(url: str) -> IO[bytes]:
+    """Downloads a URL and returns the raw content as a file. The response is streamed into a
+    spooled temporary file so small downloads are kept in memory and larger ones on disk"""
 
+    logger.debug(f"Downloading: {url}")
 
-def file_opener(path: Path) -> bytes:
-    """Opens a local file, handling embedded zips and other MIME's"""
+    content = SpooledTemporaryFile(max_size=DOWNLOAD_MEMORY_LIMIT)
 
-    logger.debug(f"Opening file: {path}")
+    try:
+        async with http.stream("GET", url) as response:
+            response.raise_for_status()
 
-    if not path.is_file():
-        raise Exception(f"File not found: {path}")
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                content.write(chunk)
+    except BaseException:
+        content.close()
+        raise
 
-    content: BytesIO | None = None
+    content.seek(0)
 
-    with path.open("rb") as fh:
-        content = BytesIO(fh.read())
+    return content
 
-    file_mime = mime_from_content(content)
 
-    # @TODO handle all this in utils/archive.py
-    # and make it all generic to handle other
-    # mime types
-    if file_mime == "application/zip":
-        with ZipFile(content) as zf:
-            if len(zf.namelist()) == 1:
-                return zf.open(zf.namelist()[0]).read()
+async def url_downloader(url: str) -> bytes:
+    """Downloads a URL and returns content, handling embedded zips and other MIME's"""
+    content = await url_download(url)
 
-            c = []
-            stream_count = 0
+    return b"".join(fh.read() for _, fh in iter_content_streams(content, url=url))
 
-            for filename in zf.namelist():
-                if filename.endswith(".zip"):
-                    c.append(_handle_zip(zf.open(filename), "r"))
-                    stream_count += 1
-                else:
-                    c.append(zf.open(filename))
 
-            return chain_streams(c).read()
+def file_opener(path: Path) -> bytes:
+    """Opens a local file, handling embedded zips and other MIME's"""
 
-    return content.getvalue()
+    logger.debug(f"Opening file: {path}")
+
+    if not path.is_file():
+        raise Exception(f"File not found: {path}")
+
+    with path.open("rb") as fh:
+        return b"".join(member_fh.read() for _, member_fh in iter_content_streams(fh))
 
 
 if __name__ == "__main__":
@@ -14,11 +14,14 @@ Documentation at: https://github.com/opennem/opennem/wiki/Network-Flows
 import logging
 from dataclasses import dataclass
 from datetime import datetime
+from functools import cache
 from typing import NewType
 
 import numpy as np
 import pandas as pd
+from sqlalchemy import text as sql
 
+from opennem.db import db_connect_sync
 from opennem.schema.network import NetworkNEM, NetworkSchema
 
 # from result import Err, Ok, Result
@@ -378,13 +381,326 @@ def solve_flow_emissions_with_pandas(interconnector_data, region_data, network:
     return result_data
 
 
+# NEM flows that emissions are solved for when the facility tables have no interconnectors
+NEM_REGION_FLOWS: list[RegionFlow] = [
+    RegionFlow("VIC1->NSW1"),
+    RegionFlow("VIC1->TAS1"),
+    RegionFlow("VIC1->SA1"),
+    RegionFlow("NSW1->VIC1"),
+    RegionFlow("NSW1->QLD1"),
+    RegionFlow("QLD1->NSW1"),
+    RegionFlow("TAS1->VIC1"),
+    RegionFlow("SA1->VIC1"),
+]
+
+
+@dataclass(frozen=True)
+class FlowTopology:
+    """Interconnector graph of a network as the directed flows between its regions"""
+
+    network_code: str
+    region_flows: tuple[RegionFlow, ...]
+
+    @classmethod
+    def from_interconnectors(cls, network_code: str, interconnectors: list[tuple[str, str]]) -> "FlowTopology":
+        """Topology with flows in both directions for each interconnector region pair"""
+        region_flows: list[RegionFlow] = []
+
+        for region_from, region_to in interconnectors:
+            for region_flow in (RegionFlow(f"{region_from}->{region_to}"), RegionFlow(f"{region_to}->{region_from}")):
+                if region_flow not in region_flows:
+                    region_flows.append(region_flow)
+
+        return cls(network_code=network_code, region_flows=tuple(region_flows))
+
+    @property
+    def regions(self) -> list[Region]:
+        return sorted({Region(region) for region_flow in self.region_flows for region in region_flow.split("->")})
+
+
+NEM_FLOW_TOPOLOGY = FlowTopology(network_code="NEM", region_flows=tuple(NEM_REGION_FLOWS))
+
+
+@dataclass(frozen=True)
+class _FlowSystem:
+    """Emissions balance system for a topology with the coordinates of its non-zero coefficients
+
+    The unknowns are the emissions for each region followed by the emissions of each flow out of a
+    flow-through region. There is a balance equation for each region and an intensity equation
+    for each of those flows"""
+
+    regions: list[Region]
+    columns: list[str]
+    constant_rows: np.ndarray
+    constant_columns: np.ndarray
+    constant_values: np.ndarray
+    # intensity equation coefficient coordinates with the topology flow and source region they're
+    # calculated from. the source region column is the same as its index in regions
+    intensity_rows: np.ndarray
+    intensity_columns: np.ndarray
+    intensity_flows: np.ndarray
+    # source region of each of the topology flows
+    source_columns: np.ndarray
+
+
+@cache
+def _compile_flow_system(topology: FlowTopology) -> _FlowSystem:
+    """Builds the sparsity pattern of the system once for each topology"""
+    regions = topology.regions
+    region_index = {region: i for i, region in enumerate(regions)}
+
+    neighbours: dict[str, set[str]] = {region: set() for region in regions}
+
+    for region_flow in topology.region_flows:
+        region_from, region_to = region_flow.split("->")
+        neighbours[region_from].add(region_to)
+        neighbours[region_to].add(region_from)
+
+    # regions connected to more than one other region pass emissions from their imports through
+    through_flows = [
+        (flow_position, region_flow)
+        for flow_position, region_flow in enumerate(topology.region_flows)
+        if len(neighbours[region_flow.split("->")[0]]) > 1
+    ]
+
+    rows: list[int] = list(range(len(regions)))
+    columns: list[int] = list(range(len(regions)))
+    values: list[float] = [1.0] * len(regions)
+
+    intensity_rows: list[int] = []
+    intensity_columns: list[int] = []
+    intensity_flows: list[int] = []
+
+    for column, (flow_position, region_flow) in enumerate(through_flows, start=len(regions)):
+        region_from, region_to = region_flow.split("->")
+
+        # exported from the source region balance, imported to the destination and the intensity equation
+        rows += [region_index[Region(region_from)], region_index[Region(region_to)], column]
+        columns += [column, column, column]
+        values += [1.0, -1.0, 1.0]
+
+        intensity_rows.append(column)
+        intensity_columns.append(region_index[Region(region_from)])
+        intensity_flows.append(flow_position)
+
+    return _FlowSystem(
+        regions=regions,
+        columns=[*regions, *[region_flow for _, region_flow in through_flows]],
+        constant_rows=np.array(rows, dtype=int),
+        constant_columns=np.array(columns, dtype=int),
+        constant_values=np.array(values),
+        intensity_rows=np.array(intensity_rows, dtype=int),
+        intensity_columns=np.array(intensity_columns, dtype=int),
+        intensity_flows=np.array(intensity_flows, dtype=int),
+        source_columns=np.array([region_index[Region(i.split("->")[0])] for i in topology.region_flows], dtype=int),
+    )
+
+
+def get_flow_topology(network: NetworkSchema) -> FlowTopology:
+    """Load the interconnector topology for a network from the interconnector units in the facility tables
+
+    The topology is a value so the compiled system is cached for each version of the interconnectors. The
+    NEM falls back to NEM_FLOW_TOPOLOGY when there are no interconnector units
+    """
+    engine = db_connect_sync()
+
+    stmt = sql(
+        """
+        select distinct
+            u.interconnector_region_from,
+            u.interconnector_region_to
+        from units u
+        join facilities f on u.station_id = f.id
+        where
+            u.interconnector is True
+            and f.network_id = :network_id
+            and u.interconnector_region_from is not null
+            and u.interconnector_region_to is not null
+        order by 1, 2
+    """
+    )
+
+    query = stmt.bindparams(network_id=network.code)
+
+    with engine.begin() as conn:
+        result = conn.execute(query)
+        results = result.fetchall()
+
+    if not results:
+        if network.code == NetworkNEM.code:
+            logger.warning("No interconnectors found for network NEM, using the default NEM flow topology")
+            return NEM_FLOW_TOPOLOGY
+
+        raise FlowSolverException(f"No interconnectors found for network {network.code}")
+
+    return FlowTopology.from_interconnectors(network.code, [(i[0], i[1]) for i in results])
+
+
+@dataclass
+class FlowSolverResultColumns:
+    """Flow solver results for a range of intervals as arrays indexed by interval and then region flow"""
+
+    network: NetworkSchema
+    intervals: list[datetime]
+    region_flows: list[RegionFlow]
+    energy_mwh: np.ndarray
+    emissions_t: np.ndarray
+    # solution of the emissions balance system for each interval with the region or flow for each column
+    emissions_balance: np.ndarray
+    balance_columns: list[str]
+
+    def __len__(self) -> int:
+        return len(self.intervals)
+
+    def to_records(self) -> list[FlowSolverResultRecord]:
+        """Results as a FlowSolverResultRecord for each interval and flow"""
+        return [
+            FlowSolverResultRecord(interval=interval, region_flow=region_flow, emissions_t=float(emissions_t))
+            for interval, emissions_row in zip(self.intervals, self.emissions_t, strict=True)
+            for region_flow, emissions_t in zip(self.region_flows, emissions_row, strict=True)
+        ]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Get flow solver results as a dataframe with the same columns as FlowSolverResult"""
+        num_flows = len(self.region_flows)
+
+        return pd.DataFrame(
+            {
+                "trading_interval": np.repeat(np.array([i.replace(tzinfo=None) for i in self.intervals]), num_flows),
+                "interconnector_region_from": np.tile([i.split("->")[0] for i in self.region_flows], len(self.intervals)),
+                "interconnector_region_to": np.tile([i.split("->")[1] for i in self.region_flows], len(self.intervals)),
+                "emissions": self.emissions_t.ravel(),
+            }
+        )
+
+
+def _index_region_data(
+    region_data: NetworkRegionsDemandEmissions, interval_index: dict[datetime, int], regions: list[Region]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Region energy and emissions as (interval, region) arrays"""
+    region_index = {region: i for i, region in enumerate(regions)}
+    shape = (len(interval_index), len(regions))
+
+    energy = np.zeros(shape)
+    emissions = np.zeros(shape)
+    present = np.zeros(shape, dtype=bool)
+
+    for region_record in region_data.data:
+        interval_position = interval_index.get(region_record.interval)
+        region_position = region_index.get(region_record.region_code)
+
+        if interval_position is None or region_position is None:
+            continue
+
+        energy[interval_position, region_position] = region_record.energy
+        emissions[interval_position, region_position] = region_record.emissions_t
+        present[interval_position, region_position] = True
+
+    if not present.all():
+        interval_position, region_position = np.argwhere(~present)[0]
+        raise FlowSolverException(f"Region {regions[region_position]} not found in network {region_data.network.code}")
+
+    return energy, emissions
+
+
+def _index_interconnector_data(
+    interconnector_data: NetworkInterconnectorEnergyEmissions, interval_index: dict[datetime, int], region_flows: list[RegionFlow]
+) -> np.ndarray:
+    """Interconnector energy as an (interval, flow) array"""
+    flow_index = {region_flow: i for i, region_flow in enumerate(region_flows)}
+    shape = (len(interval_index), len(region_flows))
+
+    energy = np.zeros(shape)
+    present = np.zeros(shape, dtype=bool)
+
+    for interconnector in interconnector_data.data:
+        interval_position = interval_index.get(interconnector.interval)
+        flow_position = flow_index.get(interconnector.region_flow)
+
+        if interval_position is None or flow_position is None:
+            continue
+
+        if present[interval_position, flow_position]:
+            raise FlowSolverException(
+                f"Interconnector {interconnector.interval} {interconnector.region_flow} has multiple results"
+            )
+
+        energy[interval_position, flow_position] = interconnector.energy_mwh
+        present[interval_position, flow_position] = True
+
+    if not present.all():
+        interval_position, flow_position = np.argwhere(~present)[0]
+        intervals = list(interval_index)
+
+        raise FlowSolverException(
+            f"Interconnector {intervals[interval_position]} {region_flows[flow_position]} not found in network "
+            f"{interconnector_data.network.code}"
+        )
+
+    return energy
+
+
+def solve_flow_emissions_for_intervals(
+    network: NetworkSchema,
+    intervals: list[datetime],
+    interconnector_data: NetworkInterconnectorEnergyEmissions,
+    region_data: NetworkRegionsDemandEmissions,
+    topology: FlowTopology | None = None,
+) -> FlowSolverResultColumns:
+    """Solve flow emissions for a list of intervals
+
+    The data is indexed into arrays by interval and the emissions balance system for every interval
+    is filled in from the compiled system of the topology and solved in a single call. The topology
+    is loaded from the facility tables with get_flow_topology when one isn't passed
+    """
+    if not topology:
+        topology = get_flow_topology(network)
+
+    system = _compile_flow_system(topology)
+    region_flows = list(topology.region_flows)
+
+    interval_index = {interval: i for i, interval in enumerate(intervals)}
+
+    region_energy, region_emissions = _index_region_data(region_data, interval_index, system.regions)
+    flow_energy = _index_interconnector_data(interconnector_data, interval_index, region_flows)
+
+    num_intervals = len(interval_index)
+    num_columns = len(system.columns)
+
+    a = np.zeros((num_intervals, num_columns, num_columns))
+    a[:, system.constant_rows, system.constant_columns] = system.constant_values
+    a[:, system.intensity_rows, system.intensity_columns] = (
+        -flow_energy[:, system.intensity_flows] / region_energy[:, system.intensity_columns]
+    )
+
+    # net emissions for each region and zero for the intensity equations
+    b = np.zeros((num_intervals, num_columns))
+    b[:, : len(system.regions)] = np.nan_to_num(region_emissions)
+
+    emissions_balance = np.linalg.solve(a, b[..., np.newaxis])[..., 0] if num_intervals else b
+
+    # simple flows
+    source_intensity = region_emissions[:, system.source_columns] / region_energy[:, system.source_columns]
+
+    return FlowSolverResultColumns(
+        network=network,
+        intervals=list(interval_index),
+        region_flows=region_flows,
+        energy_mwh=flow_energy,
+        emissions_t=flow_energy * source_intensity,
+        emissions_balance=emissions_balance,
+        balance_columns=list(system.columns),
+    )
+
+
 def solve_flow_emissions_for_interval(
     network: NetworkSchema,
     interval: datetime,
     interconnector_data: NetworkInterconnectorEnergyEmissions,
     region_data: NetworkRegionsDemandEmissions,
+    topology: FlowTopology | None = None,
 ) -> FlowSolverResult:
-    """_summary_
+    """Solve flow emissions for an interval
 
     Args:
         interconnector_data: for each network, contains a list of interconnectors and
@@ -409,159 +725,43 @@ def solve_flow_emissions_for_interval(
     Example return:
 
     [{region_flow: "NSW1->QLD1", emissions: 154.34}, {region_flow: "VIC1->NSW1", emissions: 0.0}, ...]
-
-
-    Emissions
     """
-
-    if network.code != "NEM":
-        raise FlowSolverException(f"Flow solver only supports NEM network. {network.code} provided")
-
-    region_flow_set = [
-        RegionFlow("VIC1->NSW1"),
-        RegionFlow("VIC1->TAS1"),
-        RegionFlow("VIC1->SA1"),
-        RegionFlow("NSW1->VIC1"),
-        RegionFlow("NSW1->QLD1"),
-        RegionFlow("QLD1->NSW1"),
-        RegionFlow("TAS1->VIC1"),
-        RegionFlow("SA1->VIC1"),
-    ]
-
-    a = np.array(
-        [
-            # emissions balance equations
-            [1, 0, 0, 0, 0, 0, 0, 0, -1, 0],
-            [0, 1, 0, 0, 0, 0, -1, 0, 0, 0],
-            [0, 0, 1, 0, 0, 0, 0, 0, 0, -1],
-            [0, 0, 0, 1, 0, -1, 1, 1, 0, 0],
-            [0, 0, 0, 0, 1, 1, 0, -1, 1, 1],
-            # emissions intensity equations for flow-through regions
-            [
-                0,
-                0,
-                0,
-                -interconnector_data.get_interconnector(interval=interval, region_flow=RegionFlow("NSW1->QLD1")).energy_mwh
-                / region_data.get_region(interval=interval, region=Region("NSW1")).energy,
-                0,
-                0,
-                1,
-                0,
-                0,
-                0,
-            ],
-            [
-                0,
-                0,
-                0,
-                -interconnector_data.get_interconnector(interval=interval, region_flow=RegionFlow("NSW1->VIC1")).energy_mwh
-                / region_data.get_region(interval=interval, region=Region("NSW1")).energy,
-                0,
-                0,
-                0,
-                1,
-                0,
-                0,
-            ],
-            [
-                0,
-                0,
-                0,
-                -interconnector_data.get_interconnector(interval=interval, region_flow=RegionFlow("VIC1->TAS1")).energy_mwh
-                / region_data.get_region(interval=interval, region=Region("VIC1")).energy,
-                0,
-                0,
-                0,
-                0,
-                0,
-                1,
-            ],
-            [
-                0,
-                0,
-                0,
-                -interconnector_data.get_interconnector(interval=interval, region_flow=RegionFlow("VIC1->SA1")).energy_mwh
-                / region_data.get_region(interval=interval, region=Region("VIC1")).energy,
-                0,
-                0,
-                0,
-                0,
-                1,
-                0,
-            ],
-            [
-                0,
-                0,
-                0,
-                -interconnector_data.get_interconnector(interval=interval, region_flow=RegionFlow("VIC1->NSW1")).energy_mwh
-                / region_data.get_region(interval=interval, region=Region("VIC1")).energy,
-                1,
-                0,
-                0,
-                0,
-                0,
-                0,
-            ],
-        ]
+    flow_columns = solve_flow_emissions_for_intervals(
+        network=network,
+        intervals=[interval],
+        interconnector_data=interconnector_data,
+        region_data=region_data,
+        topology=topology,
     )
 
-    # net emissions for each region (region emissions )
-    region_emissions = np.array(
-        [
-            # net emissions for each region (region emissions, minus exported, plus imported)
-            [region_data.get_region(interval=interval, region=Region("SA1")).emissions_t],
-            [region_data.get_region(interval=interval, region=Region("QLD1")).emissions_t],
-            [region_data.get_region(interval=interval, region=Region("TAS1")).emissions_t],
-            [region_data.get_region(interval=interval, region=Region("NSW1")).emissions_t],
-            [region_data.get_region(interval=interval, region=Region("VIC1")).emissions_t],
-            [0],
-            [0],
-            [0],
-            [0],
-            [0],
-        ]
+    return FlowSolverResult(
+        network=network,
+        interconnector_data=interconnector_data,
+        region_data=region_data,
+        result_data=flow_columns.to_records(),
     )
 
-    # cast nan to 0
-    region_emissions = np.nan_to_num(region_emissions)
-
-    # obtain solution
-    np.linalg.solve(a, region_emissions)
-
-    flow_results = FlowSolverResult(network=network, interconnector_data=interconnector_data, region_data=region_data)
-
-    # simple flows
-    for region_flow in region_flow_set:
-        flow_results.calculate_flow(interval=interval, region_flow=region_flow)
-
-    return flow_results
-
 
 def solve_flow_emissions_for_interval_range(
     network: NetworkSchema,
     interconnector_data: NetworkInterconnectorEnergyEmissions,
     region_data: NetworkRegionsDemandEmissions,
-) -> FlowSolverResult:
+    topology: FlowTopology | None = None,
+) -> FlowSolverResultColumns:
     """
-    Solve flow emissions for interval range
+    Solve flow emissions for every interval in the interconnector data
     """
-
-    if network.code != "NEM":
-        raise FlowSolverException(f"Flow solver only supports NEM network. {network.code} provided")
-
-    intervals = list({i.interval for i in interconnector_data.data})
+    intervals = sorted({i.interval for i in interconnector_data.data})
 
     logger.debug(f"Called with {len(intervals)} intervals")
 
-    flow_results = FlowSolverResult(network=network, interconnector_data=interconnector_data, region_data=region_data)
-
-    for interval in intervals:
-        result_data = solve_flow_emissions_for_interval(
-            network=network, interval=interval, interconnector_data=interconnector_data, region_data=region_data
-        )
-        flow_results.append_results(result_data.data)
-
-    return flow_results
+    return solve_flow_emissions_for_intervals(
+        network=network,
+        intervals=intervals,
+        interconnector_data=interconnector_data,
+        region_data=region_data,
+        topology=topology,
+    )
 
 
 # debugger entry point
@@ -0,0 +1,186 @@
+"""
+Columnar record store for AEMO MMS tables.
+
+Stores one list per column rather than a dict per record. Code fields (DUID's, region
+ids etc.) are interned so repeated values share a single string and date fields are
+parsed into timestamps in one vectorised pass when the columns are read. Known numeric
+fields are stored as typed float arrays with NaN for missing values. Values in numeric
+fields that aren't numbers keep their raw value for records and are NaN in arrays and
+frames, which logs how many were coerced.
+
+Other fields are kept as the strings from the file since the type of a field isn't known
+until it is read by a schema or controller.
+"""
+
+import logging
+import sys
+from array import array
+from collections.abc import Generator
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# fields that hold a small set of repeated codes and are interned
+MMS_INTERNED_FIELDS = ["duid", "regionid", "interconnectorid", "runno", "intervention"]
+
+# fields that hold dates in the AEMO MMS date format
+MMS_DATE_FIELDS = ["settlementdate", "interval_datetime", "lastchanged", "datetime", "effectivedate"]
+
+MMS_DATE_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+# fields that hold numeric values and are stored as float arrays
+MMS_NUMERIC_FIELDS = [
+    "scadavalue",
+    "initialmw",
+    "totalcleared",
+    "mwh_reading",
+    "power",
+    "powermean",
+    "powerpoe50",
+    "powerpoelow",
+    "powerpoehigh",
+    "rrp",
+    "rop",
+    "meteredmwflow",
+    "mwflow",
+    "netinterchange",
+    "totaldemand",
+    "demand_and_nonschedgen",
+]
+
+
+
+
+def _count_invalid(invalid: dict[int, Any]) -> int:
+    # empty values are kept as is but are missing values rather than invalid
+    return sum(1 for value in invalid.values() if value != "")
+
+
+def parse_mms_dates(values: list[Any]) -> pd.Series:
+    """Parse a column of MMS date strings in one pass, falling back to mixed formats"""
+    series = pd.Series(values, dtype="object")
+
+    try:
+        return pd.to_datetime(series, format=MMS_DATE_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(series, format="mixed", errors="coerce")
+
+
+class AEMOColumnStore:
+    """Column oriented store of AEMO MMS records with one list per field"""
+
+    __slots__ = ("fieldnames", "_columns", "_interned", "_numeric", "_invalid", "_length")
+
+    def __init__(self, fieldnames: list[str]) -> None:
+        self.fieldnames = fieldnames
+        self._numeric = [f in MMS_NUMERIC_FIELDS for f in fieldnames]
+        self._columns: list[list[Any] | array] = [array("d") if numeric else [] for numeric in self._numeric]
+        self._interned = [f in MMS_INTERNED_FIELDS for f in fieldnames]
+        # raw values of numeric fields that aren't numbers keyed by row for each column
+        self._invalid: list[dict[int, Any]] = [{} for _ in fieldnames]
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def invalid_count(self) -> int:
+        """Number of values in numeric fields that aren't numbers or empty"""
+        return sum(_count_invalid(i) for i in self._invalid)
+
+    def append_row(self, values: list[Any]) -> None:
+        """Append a row of values ordered by fieldnames"""
+        for column, invalid, value, interned, numeric in zip(
+            self._columns, self._invalid, values, self._interned, self._numeric, strict=True
+        ):
+            if numeric:
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    if value is not None:
+                        invalid[self._length] = value
+
+                    value = np.nan
+            elif interned and isinstance(value, str):
+                value = sys.intern(value)
+
+            column.append(value)
+
+        self._length += 1
+
+    def append_record(self, record: dict[str, Any]) -> None:
+        """Append a record dict keyed by fieldname"""
+        self.append_row([record.get(f) for f in self.fieldnames])
+
+    def extend(self, other: "AEMOColumnStore") -> None:
+        """Concatenate the columns of another store with the same fields onto this one"""
+        if other.fieldnames != self.fieldnames:
+            raise ValueError("Cannot extend column store with different fields")
+
+        for column, other_column in zip(self._columns, other._columns, strict=True):
+            column.extend(other_column)
+
+        for invalid, other_invalid in zip(self._invalid, other._invalid, strict=True):
+            invalid.update({self._length + row: value for row, value in other_invalid.items()})
+
+        self._length += other._length
+
+    def _log_invalid(self, fieldname: str, invalid: dict[int, Any]) -> None:
+        if invalid_count := _count_invalid(invalid):
+            logger.warning(f"Coerced {invalid_count} values in numeric field {fieldname} that aren't numbers to NaN")
+
+    def column(self, fieldname: str) -> np.ndarray:
+        """Return a single column as an array"""
+        position = self.fieldnames.index(fieldname)
+        values = self._columns[position]
+
+        if fieldname in MMS_DATE_FIELDS:
+            return parse_mms_dates(values).to_numpy()
+
+        if isinstance(values, array):
+            self._log_invalid(fieldname, self._invalid[position])
+            return np.array(values, dtype=np.float64)
+
+        return np.asarray(values, dtype=object)
+
+    def iter_rows(self) -> Generator[tuple[Any, ...], None, None]:
+        """Iterate over rows as tuples ordered by fieldnames with None for missing numeric values and
+        the raw value for numeric values that aren't numbers"""
+        columns: list[Any] = []
+
+        for column, invalid in zip(self._columns, self._invalid, strict=True):
+            if isinstance(column, array):
+                column = [None if np.isnan(v) else v for v in column]
+
+                for row, value in invalid.items():
+                    column[row] = value
+
+            columns.append(column)
+
+        yield from zip(*columns, strict=True)
+
+    def iter_records(self) -> Generator[dict[str, Any], None, None]:
+        """Iterate over rows as dicts. Allocates a dict per row so prefer to_frame"""
+        for row in self.iter_rows():
+            yield dict(zip(self.fieldnames, row, strict=True))
+
+    def to_records(self) -> list[dict[str, Any]]:
+        return list(self.iter_records())
+
+    def to_frame(self) -> pd.DataFrame:
+        """Build a dataframe directly from the columns with dates parsed"""
+        frame_columns: dict[str, Any] = {}
+
+        for fieldname, values, invalid in zip(self.fieldnames, self._columns, self._invalid, strict=True):
+            if fieldname in MMS_DATE_FIELDS:
+                frame_columns[fieldname] = parse_mms_dates(values)
+            elif isinstance(values, array):
+                self._log_invalid(fieldname, invalid)
+                frame_columns[fieldname] = pd.Series(np.array(values, dtype=np.float64))
+            else:
+                frame_columns[fieldname] = pd.Series(values, dtype="object")
+
+        return pd.DataFrame(frame_columns, columns=self.fieldnames)
@@ -22,7 +22,7 @@ class AEMODataBucketSize(enum.Enum):
     year = "year"
 
 
-@dataclass
+@dataclass(frozen=True)
 class AEMOMMSFilename:
     filename: str
     date: datetime | None = field(default=None)
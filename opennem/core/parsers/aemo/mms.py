@@ -4,17 +4,20 @@ Parse AEMO MMS CSV format which can have multiple tables and definitions per CSV
 """
 
 import csv
+import io
 import logging
+from collections.abc import Generator, Iterable
 from datetime import datetime
 from pathlib import Path
-from typing import Any
+from typing import IO, Any
 
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic import BaseModel, ConfigDict, field_validator
 from pydantic.error_wrappers import ValidationError
 from pydantic.fields import PrivateAttr
 
-from opennem.core.downloader import url_downloader
+from opennem.core.downloader import iter_content_streams, url_download
 from opennem.core.normalizers import normalize_duid
+from opennem.core.parsers.aemo.columns import AEMOColumnStore
 from opennem.schema.aemo.mms import MMSBaseClass, get_mms_schema_for_table
 from opennem.schema.core import BaseConfig
 from opennem.utils.version import get_version
@@ -37,11 +40,15 @@ class AEMOTableSchema(BaseConfig):
     name: str
     namespace: str
     fieldnames: list[str]
-    records: list[dict[str, Any]] = Field(default_factory=list)
 
     # optionally it has a schema
     _record_schema: MMSBaseClass | None = PrivateAttr()
 
+    # raw records are stored by column. schema validated and values_only records
+    # are kept as a list of rows. A table only ever uses one of the two
+    _columns: AEMOColumnStore | None = PrivateAttr(default=None)
+    _rows: list[Any] = PrivateAttr(default_factory=list)
+
     # the url this table was taken from if any
     url_source: str | None = None
 
@@ -64,6 +71,35 @@ class AEMOTableSchema(BaseConfig):
 
         return None
 
+    @property
+    def records(self) -> list[Any]:
+        """Records as a list. For column stored tables this is a read only copy built from the
+        columns with a dict per record so prefer to_frame or iter_records, and add records
+        with add_record"""
+        if self._columns is not None:
+            return self._columns.to_records()
+
+        return self._rows
+
+    @property
+    def record_count(self) -> int:
+        if self._columns is not None:
+            return len(self._columns)
+
+        return len(self._rows)
+
+    @property
+    def columns(self) -> AEMOColumnStore | None:
+        """The column store for the table if the records are stored by column"""
+        return self._columns
+
+    def iter_records(self) -> Generator[dict[str, Any] | Any, None, None]:
+        """Iterate over records one at a time without building the full list"""
+        if self._columns is not None:
+            yield from self._columns.iter_records()
+        else:
+            yield from self._rows
+
     @field_validator("name")
     @classmethod
     def validate_name(cls, table_name: str) -> str:
@@ -93,8 +129,35 @@ class AEMOTableSchema(BaseConfig):
 
         return True
 
+    def _has_schema(self) -> bool:
+        return hasattr(self, "_record_schema") and bool(self._record_schema)
+
+    def _use_row_storage(self, values_only: bool = False) -> None:
+        """Move column stored records to the list of rows on the first write that needs a row"""
+        if self._columns is None:
+            return
+
+        if values_only:
+            self._rows = [list(i) for i in self._columns.iter_rows()]
+        else:
+            self._rows = self._columns.to_records()
+
+        self._columns = None
+
+    def add_row(self, values: list[Any]) -> bool:
+        """Add a raw row of values ordered by fieldnames to the column store"""
+        if self._rows:
+            return self.add_record(dict(zip(self.fieldnames, values, strict=True)))
+
+        if self._columns is None:
+            self._columns = AEMOColumnStore(self.fieldnames)
+
+        self._columns.append_row(values)
+
+        return True
+
     def add_record(self, record: dict | MMSBaseClass, values_only: bool = False) -> bool:
-        if isinstance(record, dict) and hasattr(self, "_record_schema") and self._record_schema:
+        if isinstance(record, dict) and self._has_schema():
             _record = None
 
             if not isinstance(record, dict):
@@ -120,21 +183,50 @@ class AEMOTableSchema(BaseConfig):
                 logger.error(f"Record error: {e}")
                 return False
 
+            self._use_row_storage(values_only=values_only)
+
             if values_only:
-                self.records.append(list(_record.values()))
+                self._rows.append(list(_record.values()))
             else:
-                self.records.append(_record)
+                self._rows.append(_record)
+
+        elif isinstance(record, dict) and not values_only and not self._rows:
+            if self._columns is None:
+                self._columns = AEMOColumnStore(self.fieldnames)
+
+            self._columns.append_record(record)
 
         else:
+            self._use_row_storage(values_only=values_only)
+
             if values_only and isinstance(record, dict):
-                self.records.append(list(record.values()))
-            elif values_only and isinstance(record, list):
-                self.records.append(record)
+                self._rows.append(list(record.values()))
             else:
-                self.records.append(record)
+                self._rows.append(record)
 
         return True
 
+    def merge(self, table: "AEMOTableSchema", values_only: bool = False) -> None:
+        """Merge the records of another table with the same definition into this one.
+
+        Record buffers are concatenated rather than re-added one at a time since they
+        have already been parsed and validated"""
+        if table.fieldnames == self.fieldnames:
+            if table._columns is not None and not self._rows and not values_only:
+                if self._columns is None:
+                    self._columns = AEMOColumnStore(self.fieldnames)
+
+                self._columns.extend(table._columns)
+                return
+
+            if table._columns is None and self._columns is None:
+                self._rows.extend(table._rows)
+                return
+
+        # differing fields or storage so re-add record by record
+        for record in table.iter_records():
+            self.add_record(record, values_only=values_only)
+
     def to_frame(self) -> Any:
         """Return a pandas dataframe for the table"""
         if not _HAVE_PANDAS:
@@ -142,7 +234,19 @@ class AEMOTableSchema(BaseConfig):
 
         _index_keys = []
 
-        _df = pd.DataFrame(self.records)
+        if self._columns is not None:
+            return self._columns.to_frame()
+
+        # raw records moved to row storage are framed the same as when stored by column
+        if not self._has_schema() and self._rows and all(isinstance(i, dict) for i in self._rows):
+            columns = AEMOColumnStore(self.fieldnames)
+
+            for record in self._rows:
+                columns.append_record(record)
+
+            return columns.to_frame()
+
+        _df = pd.DataFrame(self._rows)
 
         if hasattr(self, "_record_schema") and self._record_schema:
             if hasattr(self._record_schema, "_primary_keys"):
@@ -158,14 +262,17 @@ class AEMOTableSchema(BaseConfig):
         return _df
 
     def to_csv(self, filename: str) -> None:
-        logger.info(f"Writing table {self.full_name} with {len(self.records)} records")
+        logger.info(f"Writing table {self.full_name} with {self.record_count} records")
 
         with open(filename, "w") as fh:
             csvwriter = csv.DictWriter(fh, fieldnames=self.fieldnames)
             csvwriter.writeheader()
 
-            for record in self.records:
-                csvwriter.writerow(dict(zip(self.fieldnames, record, strict=True)))
+            if self._columns is not None:
+                csvwriter.writerows(self._columns.iter_records())
+            else:
+                for record in self._rows:
+                    csvwriter.writerow(dict(zip(self.fieldnames, record, strict=True)))
 
         logger.info(f"Wrote records to {self.full_name}")
 
@@ -177,6 +284,10 @@ class AEMOTableSet(BaseModel):
     generated: datetime = datetime.now()
     tables: list[AEMOTableSchema] = []
 
+    # lookups of tables by full name and by name
+    _full_name_index: dict[str, AEMOTableSchema] = PrivateAttr(default_factory=dict)
+    _name_index: dict[str, AEMOTableSchema] = PrivateAttr(default_factory=dict)
+
     @property
     def table_names(self) -> list[str]:
         _names: list[str] = []
@@ -186,57 +297,48 @@ class AEMOTableSet(BaseModel):
 
         return _names
 
-    def has_table(self, table_name: str) -> bool:
-        found_table: bool = False
-
-        if not self.tables:
-            return False
+    def _index_tables(self) -> None:
+        """(Re)build the table lookups. Tables are looked up by full name and then by name"""
+        self._full_name_index = {t.full_name: t for t in self.tables}
+        self._name_index = {t.name: t for t in self.tables}
 
-        if len(self.tables) < 1:
-            return False
+    def _lookup_table(self, table_name: str) -> AEMOTableSchema | None:
+        # tables can be appended to the list directly so re-index if it's out of sync
+        if len(self._full_name_index) != len(self.tables):
+            self._index_tables()
 
-        table_lookup = list(filter(lambda t: t.full_name == table_name, self.tables))
-
-        if len(table_lookup) > 0:
-            return True
+        if table_name in self._full_name_index:
+            return self._full_name_index[table_name]
 
         # if not found search by name only
         # @NOTE this might lead to bugs
-        table_lookup = list(filter(lambda t: t.name == table_name, self.tables))
-
-        if len(table_lookup) > 0:
-            return True
+        return self._name_index.get(table_name)
 
-        return found_table
+    def has_table(self, table_name: str) -> bool:
+        return self._lookup_table(table_name) is not None
 
     def add_table(self, table: AEMOTableSchema, values_only: bool = False) -> bool:
-        _existing_table = self.get_table(table.full_name)
+        if len(self._full_name_index) != len(self.tables):
+            self._index_tables()
+
+        _existing_table = self._full_name_index.get(table.full_name)
 
         if _existing_table:
-            for r in table.records:
-                _existing_table.add_record(r, values_only=values_only)
+            _existing_table.merge(table, values_only=values_only)
         else:
             self.tables.append(table)
+            self._full_name_index[table.full_name] = table
+            self._name_index[table.name] = table
 
         return True
 
     def get_table(self, table_name: str) -> AEMOTableSchema | None:
-        if not self.has_table(table_name):
-            return None
-
-        table_lookup = list(filter(lambda t: t.full_name == table_name, self.tables))
+        table = self._lookup_table(table_name)
 
-        if table_lookup:
-            return table_lookup.pop()
+        if not table:
+            logger.debug("Looking up table: {} amongst ({})".format(table_name, ", ".join([i.name for i in self.tables])))
 
-        table_lookup = list(filter(lambda t: t.name == table_name, self.tables))
-
-        if table_lookup:
-            return table_lookup.pop()
-
-        logger.debug("Looking up table: {} amongst ({})".format(table_name, ", ".join([i.name for i in self.tables])))
-
-        return None
+        return table
 
 
 class AEMOParserException(Exception):
@@ -247,34 +349,72 @@ AEMO_ROW_HEADER_TYPES = ["C", "I", "D"]
 
 MMS_DUID_FIELDS = ["duid"]
 
+# maximum number of records yielded per table chunk when stream parsing
+MMS_STREAM_BATCH_SIZE = 50_000
 
-def parse_aemo_mms_csv(
-    content: str,
-    table_set: AEMOTableSet | None = None,
+
+def _new_table_from_header(
+    row: list[str], parse_table_schemas: bool = False, url: str | None = None
+) -> AEMOTableSchema:
+    """Build an empty table from an MMS "I" header row"""
+    table_fields = [i.lower() for i in row[4:]]
+
+    table = AEMOTableSchema(
+        name=row[2],
+        namespace=row[1],
+        fields=table_fields,
+        fieldnames=table_fields,
+        url_source=url,
+    )
+
+    # do we have a custom shema for the table?
+    if parse_table_schemas:
+        table_schema = get_mms_schema_for_table(table.full_name)
+
+        if table_schema:
+            table.set_schema(table_schema)
+
+    return table
+
+
+def _new_table_batch(table: AEMOTableSchema) -> AEMOTableSchema:
+    """Return an empty table with the same definition (and schema) as the table passed in"""
+    table_batch = AEMOTableSchema(
+        name=table.name,
+        namespace=table.namespace,
+        fieldnames=table.fieldnames,
+        url_source=table.url_source,
+    )
+
+    if hasattr(table, "_record_schema") and table._record_schema:
+        table_batch.set_schema(table._record_schema)
+
+    return table_batch
+
+
+def parse_aemo_mms_rows(
+    rows: Iterable[list[str]],
     namespace_filter: list[str] | None = None,
     parse_table_schemas: bool = False,
     skip_records: bool = False,
     url: str | None = None,
     values_only: bool = False,
-) -> AEMOTableSet:
+    batch_size: int | None = None,
+) -> Generator[tuple[str, AEMOTableSchema], None, None]:
     """
-    Parse AEMO CSV's into schemas and return a table set
+    Parse rows of an AEMO MMS CSV and yield (table_name, table) chunks
 
-    Exception raised on error and logs malformed CSVs
+    Each yielded table holds at most batch_size records. If batch_size is not set
+    a table is yielded once when it is complete. A table with no records is still
+    yielded once so that callers can see which tables are defined in a file.
     """
+    table_current: AEMOTableSchema | None = None
+    duid_field_indexes: list[int] = []
 
-    if not table_set:
-        table_set = AEMOTableSet()
-
-    content_split = content.splitlines()
-
-    # @NOTE more efficient csv parsing
-    datacsv = csv.reader(content_split)
+    # has the current table been yielded at least once
+    table_current_yielded = False
 
-    # init all the parser vars
-    table_current = None
-
-    for row in datacsv:
+    for row in rows:
         if not row or type(row) is not list or len(row) < 1:
             continue
 
@@ -284,41 +424,28 @@ def parse_aemo_mms_csv(
             logger.info(f"Skipping row, invalid type: {record_type}")
             continue
 
-        # new table set
-        # @TODO switch to match
         match record_type:
+            # new file or end of file
             case "C":
                 # @TODO csv meta stored in table
-                if table_current:
-                    table_set.add_table(table_current, values_only=values_only)
+                if table_current and (table_current.record_count or not table_current_yielded):
+                    yield table_current.full_name, table_current
+
+                table_current = None
 
             # new table
             case "I":
-                if table_current:
-                    table_set.add_table(table_current, values_only=values_only)
+                if table_current and (table_current.record_count or not table_current_yielded):
+                    yield table_current.full_name, table_current
 
-                table_namespace = row[1]
-                table_name = row[2]
-                table_fields = [i.lower() for i in row[4:]]
+                table_current = None
+                table_current_yielded = False
 
-                if namespace_filter and table_namespace.lower() not in namespace_filter:
-                    table_current = None
+                if namespace_filter and row[1].lower() not in namespace_filter:
                     continue
 
-                table_current = AEMOTableSchema(
-                    name=table_name,
-                    namespace=table_namespace,
-                    fields=table_fields,
-                    fieldnames=table_fields,
-                    url_source=url,
-                )
-
-                # do we have a custom shema for the table?
-                if parse_table_schemas:
-                    table_schema = get_mms_schema_for_table(table_current.full_name)
-
-                    if table_schema:
-                        table_current.set_schema(table_schema)
+                table_current = _new_table_from_header(row, parse_table_schemas=parse_table_schemas, url=url)
+                duid_field_indexes = [i for i, f in enumerate(table_current.fieldnames) if f in MMS_DUID_FIELDS]
 
             # new record
             case "D":
@@ -335,18 +462,115 @@ def parse_aemo_mms_csv(
                     logger.error("Malformed AEMO csv - length mismatch between records and fields")
                     continue
 
-                record = dict(zip(table_current.fieldnames, values, strict=True))
+                for field_index in duid_field_indexes:
+                    values[field_index] = normalize_duid(values[field_index])
 
-                for field, fieldvalue in record.items():
-                    if field in MMS_DUID_FIELDS:
-                        fieldvalue_parsed = normalize_duid(fieldvalue)
-                        record[field] = fieldvalue_parsed
+                if values_only or table_current._has_schema():
+                    table_current.add_record(dict(zip(table_current.fieldnames, values, strict=True)), values_only=values_only)
+                else:
+                    table_current.add_row(values)
 
-                table_current.add_record(record, values_only=values_only)
+                if batch_size and table_current.record_count >= batch_size:
+                    yield table_current.full_name, table_current
+
+                    table_current = _new_table_batch(table_current)
+                    table_current_yielded = True
 
             case _:
                 logger.error(f"Invalid AEMO record type: {record_type}")
 
+    # file did not end with a "C" row
+    if table_current and (table_current.record_count or not table_current_yielded):
+        yield table_current.full_name, table_current
+
+
+def parse_aemo_mms_csv_stream(
+    stream: IO[bytes],
+    namespace_filter: list[str] | None = None,
+    parse_table_schemas: bool = False,
+    skip_records: bool = False,
+    url: str | None = None,
+    values_only: bool = False,
+    batch_size: int = MMS_STREAM_BATCH_SIZE,
+    encoding: str = "utf-8",
+) -> Generator[tuple[str, AEMOTableSchema], None, None]:
+    """
+    Stream parse an AEMO MMS CSV from a binary stream
+
+    The stream is decoded and read a row at a time so the file is never held in memory.
+    Yields (table_name, table) chunks of at most batch_size records. Works on a local
+    file opened with "rb" or a member opened from a zip with ZipFile.open()
+
+        with ZipFile(path) as zf, zf.open(name) as fh:
+            for table_name, table in parse_aemo_mms_csv_stream(fh):
+                ...
+    """
+    text_stream = io.TextIOWrapper(stream, encoding=encoding, newline="")
+
+    try:
+        yield from parse_aemo_mms_rows(
+            csv.reader(text_stream),
+            namespace_filter=namespace_filter,
+            parse_table_schemas=parse_table_schemas,
+            skip_records=skip_records,
+            url=url,
+            values_only=values_only,
+            batch_size=batch_size,
+        )
+    finally:
+        # don't close the underlying stream, the caller owns it
+        text_stream.detach()
+
+
+def parse_aemo_mms_csv(
+    content: str,
+    table_set: AEMOTableSet | None = None,
+    namespace_filter: list[str] | None = None,
+    parse_table_schemas: bool = False,
+    skip_records: bool = False,
+    url: str | None = None,
+    values_only: bool = False,
+) -> AEMOTableSet:
+    """
+    Parse AEMO CSV's into schemas and return a table set
+
+    Exception raised on error and logs malformed CSVs
+    """
+
+    if not table_set:
+        table_set = AEMOTableSet()
+
+    datacsv = csv.reader(io.StringIO(content, newline=""))
+
+    for _, table in parse_aemo_mms_rows(
+        datacsv,
+        namespace_filter=namespace_filter,
+        parse_table_schemas=parse_table_schemas,
+        skip_records=skip_records,
+        url=url,
+        values_only=values_only,
+    ):
+        table_set.add_table(table, values_only=values_only)
+
+    return table_set
+
+
+def parse_aemo_content(
+    content: IO[bytes],
+    table_set: AEMOTableSet | None = None,
+    skip_records: bool = False,
+    url: str | None = None,
+    values_only: bool = False,
+) -> AEMOTableSet:
+    """Parse downloaded content, which can be a CSV or a zip (of zips) of CSVs, into an AEMOTableSet"""
+    if not table_set:
+        table_set = AEMOTableSet()
+
+    # each CSV in the download (and any zips within it) is parsed straight from the archive
+    for _, csv_stream in iter_content_streams(content, url=url):
+        for _, table in parse_aemo_mms_csv_stream(csv_stream, skip_records=skip_records, url=url, values_only=values_only):
+            table_set.add_table(table, values_only=values_only)
+
     return table_set
 
 
@@ -355,25 +579,24 @@ async def parse_aemo_url(
 ) -> AEMOTableSet:
     """Parse a single AEMO URL into an AEMOTableSet"""
 
-    if not table_set:
-        table_set = AEMOTableSet()
-
     try:
-        csv_content = await url_downloader(url)
+        content = await url_download(url)
     except Exception as e:
         raise Exception(f"Could not fetch AEMO url {url}: {e}") from None
 
-    if not csv_content:
-        raise Exception(f"Could not parse URL: {url}")
+    with content:
+        if not content.read(1):
+            raise Exception(f"Could not parse URL: {url}")
+
+        content.seek(0)
 
-    csv_content_decoded = csv_content.decode("utf-8")
-    table_set = parse_aemo_mms_csv(csv_content_decoded, table_set, skip_records=skip_records, url=url, values_only=values_only)
+        table_set = parse_aemo_content(content, table_set=table_set, skip_records=skip_records, url=url, values_only=values_only)
 
     # Count number of records
     total_records = 0
 
     for table in table_set.tables:
-        total_records += len(table.records)
+        total_records += table.record_count
 
     logger.info(f"Parsed {total_records} records")
 
@@ -391,7 +614,7 @@ def parse_aemo_urls(urls: list[str], skip_records: bool = False, values_only: bo
     total_records = 0
 
     for table in aemo.tables:
-        total_records += len(table.records)
+        total_records += table.record_count
 
     logger.info(f"Parsed {total_records} records")
 
@@ -411,8 +634,9 @@ def parse_aemo_file(file: str, table_set: AEMOTableSet | None = None, values_onl
     if file_path.suffix.lower() != ".csv":
         raise Exception(f"Not a CSV file {file_path}")
 
-    with file_path.open() as fh:
-        table_set = parse_aemo_mms_csv(fh.read(), table_set=table_set, values_only=values_only)
+    with file_path.open("rb") as fh:
+        for _, table in parse_aemo_mms_csv_stream(fh, values_only=values_only):
+            table_set.add_table(table, values_only=values_only)
 
     return table_set
 
@@ -1,22 +1,123 @@
 """NEMWeb optimized parsers"""
 
+import asyncio
 import logging
+import multiprocessing
+from collections import deque
+from collections.abc import AsyncGenerator
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
 from shutil import rmtree
 
+from opennem import settings
 from opennem.controllers.nem import store_aemo_tableset
 from opennem.controllers.schema import ControllerReturn
 from opennem.core.parsers.aemo.mms import AEMOTableSet, parse_aemo_file
-from opennem.utils.archive import download_and_unzip
+from opennem.utils.archive import download_and_unzip_async
 
 logger = logging.getLogger("opennem.core.parsers.aemo.nemweb")
 
+# shared pools of parser processes keyed by worker count
+_PARSE_EXECUTORS: dict[int, ProcessPoolExecutor] = {}
+
+
+def _get_parse_workers(max_workers: int | None = None) -> int:
+    if max_workers is None:
+        max_workers = settings.aemo_parse_workers
+
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+
+    return max(max_workers, 0)
+
+
+def _get_parse_executor(max_workers: int) -> Executor:
+    """Get the shared parser process pool for a worker count, creating it on first use"""
+    executor = _PARSE_EXECUTORS.get(max_workers)
+
+    if executor is None:
+        # spawn rather than fork since the parent has a running event loop and threads
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        _PARSE_EXECUTORS[max_workers] = executor
+
+    return executor
+
+
+def _reset_parse_executor(max_workers: int, executor: Executor) -> None:
+    """Drop a broken parser process pool so the next parse creates a new one"""
+    if _PARSE_EXECUTORS.get(max_workers) is executor:
+        del _PARSE_EXECUTORS[max_workers]
+
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _parse_aemo_csv_file(file_path: str, values_only: bool = False) -> AEMOTableSet:
+    """Parse a single CSV file into its own table set. Runs in a parser process and the
+    table set is returned to the parent with its records stored by column"""
+    return parse_aemo_file(file_path, values_only=values_only)
+
+
+async def parse_aemo_files(
+    files: list[Path], values_only: bool = False, max_workers: int | None = None
+) -> AsyncGenerator[tuple[Path, AEMOTableSet], None]:
+    """Parse CSV files across a process pool and yield (file, table_set) in file order.
+
+    At most 2 * max_workers files are in flight so results don't pile up in memory while
+    the caller is storing them. With zero workers files are parsed in the calling process."""
+    csv_files = [f for f in files if f.suffix.lower() == ".csv"]
+    num_workers = _get_parse_workers(max_workers)
+
+    if num_workers == 0:
+        for csv_file in csv_files:
+            yield csv_file, _parse_aemo_csv_file(str(csv_file), values_only=values_only)
+
+        return
+
+    loop = asyncio.get_running_loop()
+    executor = _get_parse_executor(num_workers)
+    pending: deque[tuple[Path, asyncio.Future[AEMOTableSet]]] = deque()
+    files_to_parse = iter(csv_files)
+
+    def _submit_next() -> None:
+        csv_file = next(files_to_parse, None)
+
+        if csv_file:
+            pending.append(
+                (csv_file, loop.run_in_executor(executor, partial(_parse_aemo_csv_file, str(csv_file), values_only=values_only)))
+            )
+
+    try:
+        for _ in range(num_workers * 2):
+            _submit_next()
+
+        while pending:
+            csv_file, parse_future = pending.popleft()
+            _submit_next()
+
+            yield csv_file, await parse_future
+    except BrokenProcessPool:
+        # a parser process died (ex. out of memory) and the pool can't be used again
+        logger.error(f"Parser process pool with {num_workers} workers is broken and will be recreated")
+        _reset_parse_executor(num_workers, executor)
+        raise
+
+
+def _merge_controller_return(cr: ControllerReturn, controller_returns: ControllerReturn) -> None:
+    cr.inserted_records += controller_returns.inserted_records
+
+    if cr.last_modified and controller_returns.last_modified and cr.last_modified < controller_returns.last_modified:
+        cr.last_modified = controller_returns.last_modified
+
 
 async def parse_aemo_url_optimized(
     url: str, table_set: AEMOTableSet | None = None, persist_to_db: bool = True, values_only: bool = False
 ) -> ControllerReturn | AEMOTableSet:
     """Optimized version of aemo url parser that stores the files locally in tmp
-    and parses them individually to resolve memory pressure"""
-    download_path = download_and_unzip(url)
+    and parses them individually to resolve memory pressure. Files are parsed in a
+    process pool and each file is stored as soon as it is parsed"""
+    download_path = await download_and_unzip_async(url)
     cr = ControllerReturn()
 
     download_path_files = [f for f in download_path.iterdir() if f.is_file()]
@@ -26,35 +127,30 @@ async def parse_aemo_url_optimized(
     if not table_set:
         table_set = AEMOTableSet()
 
-    for csv_file_to_process in download_path_files:
-        logger.info(f"parse_aemo_url_optimized parsing {csv_file_to_process}")
-
-        if csv_file_to_process.suffix.lower() != ".csv":
-            continue
-
-        table_set = parse_aemo_file(str(csv_file_to_process), table_set=table_set, values_only=values_only)
+    async for csv_file_to_process, file_table_set in parse_aemo_files(download_path_files, values_only=values_only):
+        logger.info(f"parse_aemo_url_optimized parsed {csv_file_to_process}")
 
         if persist_to_db:
-            controller_returns = await store_aemo_tableset(table_set)
-            cr.inserted_records += controller_returns.inserted_records
-
-            if cr.last_modified and controller_returns.last_modified and cr.last_modified < controller_returns.last_modified:
-                cr.last_modified = controller_returns.last_modified
+            controller_returns = await store_aemo_tableset(file_table_set)
+            _merge_controller_return(cr, controller_returns)
+        else:
+            for table in file_table_set.tables:
+                table_set.add_table(table, values_only=values_only)
 
         try:
             csv_file_to_process.unlink()
         except Exception as e:
             logger.error(f"Error removing file {csv_file_to_process}: {e}")
 
-    if not persist_to_db:
-        return table_set
-
     try:
         rmtree(download_path)
         logger.info(f"Removed {download_path}")
     except Exception as e:
         logger.error(f"Error removing download path: {e}")
 
+    if not persist_to_db:
+        return table_set
+
     return cr
 
 
@@ -62,31 +158,26 @@ async def parse_aemo_url_optimized_bulk(
     url: str, table_set: AEMOTableSet | None = None, persist_to_db: bool = True
 ) -> ControllerReturn | AEMOTableSet:
     """Optimized version of aemo url parser that stores the files locally in tmp
-    and parses them individually to resolve memory pressure"""
-    download_path = download_and_unzip(url)
+    and parses them in a process pool before storing them all at once"""
+    download_path = await download_and_unzip_async(url)
     cr = ControllerReturn()
 
     download_path_files = [f for f in download_path.iterdir() if f.is_file()]
     logger.debug(f"Got {len(download_path_files)} files")
 
-    ts = AEMOTableSet()
-
-    for f in download_path_files:
-        logger.info(f"parse_aemo_url_optimized_bulk parsing {f}")
+    ts = table_set or AEMOTableSet()
 
-        if f.suffix.lower() != ".csv":
-            continue
+    async for f, file_table_set in parse_aemo_files(download_path_files):
+        logger.info(f"parse_aemo_url_optimized_bulk parsed {f}")
 
-        ts = parse_aemo_file(str(f), table_set=ts)
+        for table in file_table_set.tables:
+            ts.add_table(table)
 
-        if not persist_to_db:
-            return ts
+    if not persist_to_db:
+        return ts
 
     controller_returns = await store_aemo_tableset(ts)
-    cr.inserted_records += controller_returns.inserted_records
-
-    if cr.last_modified and controller_returns.last_modified and cr.last_modified < controller_returns.last_modified:
-        cr.last_modified = controller_returns.last_modified
+    _merge_controller_return(cr, controller_returns)
 
     try:
         rmtree(download_path)
@@ -102,7 +193,6 @@ if __name__ == "__main__":
     # @TODO parse into MMS schema
     url = "https://nemweb.com.au/Reports/ARCHIVE/TradingIS_Reports/PUBLIC_TRADINGIS_20231231_20240106.zip"
     # parse_aemo_url_optimized(url)
-    import asyncio
 
     asyncio.run(parse_aemo_url_optimized(url))
 
@@ -6,7 +6,7 @@ from pathlib import Path
 
 from opennem.controllers.nem import store_aemo_tableset
 from opennem.core.parsers.aemo.mms import parse_aemo_file
-from opennem.utils.archive import download_and_unzip
+from opennem.utils.archive import download_and_unzip_async
 
 logger = logging.getLogger("opennem.core.parsers.aemo.url")
 
@@ -15,7 +15,7 @@ async def parse_aemo_url_optimized(url: str) -> int:
     """Optimized version of aemo url parser"""
     files_parsed = 0
 
-    d = download_and_unzip(url)
+    d = await download_and_unzip_async(url)
 
     onlyfiles = [Path(d) / f for f in os.listdir(d) if (Path(d) / f).is_file()]
     logger.debug(f"Got {len(onlyfiles)} files")
@@ -10,9 +10,14 @@ Currently supports:
     * Extracing metadata from AEMO filenames
 """
 
+import heapq
 import html
 import logging
 import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from operator import attrgetter
@@ -21,7 +26,7 @@ from typing import Annotated, Any
 from urllib.parse import urljoin
 from zoneinfo import ZoneInfo
 
-from pydantic import BaseModel, BeforeValidator, ValidationError, field_validator
+from pydantic import BaseModel, BeforeValidator, ConfigDict, PrivateAttr, ValidationError, field_validator
 
 from opennem.core.normalizers import is_number, strip_double_spaces
 from opennem.core.parsers.aemo.filenames import AEMOMMSFilename, parse_aemo_filename
@@ -88,6 +93,11 @@ class DirlistingEntryType(Enum):
 
 
 class DirlistingEntry(BaseConfig):
+    """An entry of a listing. Entries are immutable since they're shared between the cached
+    listings of a url"""
+
+    model_config = ConfigDict(frozen=True)
+
     filename: Path
     link: str
     modified_date: DirlistingModifiedDate
@@ -114,11 +124,57 @@ class DirlistingEntry(BaseConfig):
         return DirlistingEntryType.file
 
 
+# extensions of the entries returned by DirectoryListing.get_files
+_FILE_EXTENSIONS = [".zip", ".csv", ".json"]
+
+
+class _DirlistingIndex:
+    """Lookups over the entries of a listing by AEMO interval date and modified date, built
+    once rather than scanning the entries for every query"""
+
+    def __init__(self, entries: list[DirlistingEntry]) -> None:
+        self.entries = entries
+        self.size = len(entries)
+
+        self.by_interval: dict[datetime, list[int]] = defaultdict(list)
+
+        for position, entry in enumerate(entries):
+            if entry.aemo_interval_date and entry.aemo_interval_date.date:
+                self.by_interval[entry.aemo_interval_date.date].append(position)
+
+        modified = sorted((entry.modified_date, position) for position, entry in enumerate(entries) if entry.modified_date)
+
+        self.modified_dates = [i[0] for i in modified]
+        self.modified_positions = [i[1] for i in modified]
+
+    def is_current(self, entries: list[DirlistingEntry]) -> bool:
+        return self.entries is entries and self.size == len(entries)
+
+    def positions_for_intervals(self, intervals: list[datetime]) -> list[int]:
+        return sorted(position for interval in set(intervals) for position in self.by_interval.get(interval, []))
+
+    def positions_modified_between(self, start: datetime | None = None, end: datetime | None = None) -> list[int]:
+        """Positions of entries modified after start and before end (exclusive)"""
+        start_position = bisect_right(self.modified_dates, start) if start else 0
+        end_position = bisect_left(self.modified_dates, end) if end else len(self.modified_dates)
+
+        return sorted(self.modified_positions[start_position:end_position])
+
+
 class DirectoryListing(BaseModel):
     url: str
     timezone: str | None = None
     entries: list[DirlistingEntry] = []
 
+    _index: _DirlistingIndex | None = PrivateAttr(default=None)
+
+    def _get_index(self) -> _DirlistingIndex:
+        # entries are replaced by the apply_ methods so rebuild when they change
+        if not self._index or not self._index.is_current(self.entries):
+            self._index = _DirlistingIndex(self.entries)
+
+        return self._index
+
     @property
     def count(self) -> int:
         return len(self.entries)
@@ -132,12 +188,7 @@ class DirectoryListing(BaseModel):
         return len(self.get_directories())
 
     def apply_date_range(self, date_range: CrawlDateRange) -> None:
-        self.entries = list(
-            filter(
-                lambda x: x.modified_date and x.modified_date > date_range.start and x.modified_date < date_range.end,
-                self.entries,
-            )
-        )
+        self.entries = [self.entries[i] for i in self._get_index().positions_modified_between(date_range.start, date_range.end)]
 
     def apply_limit(self, limit: int) -> None:
         """Limit to most recent files"""
@@ -148,7 +199,7 @@ class DirectoryListing(BaseModel):
 
     def get_files(self, accepted_extensions: list[str] | None = None) -> list[DirlistingEntry]:
         if accepted_extensions is None:
-            accepted_extensions = [".zip", ".csv", ".json"]
+            accepted_extensions = _FILE_EXTENSIONS
 
         return list(
             filter(
@@ -167,25 +218,26 @@ class DirectoryListing(BaseModel):
         if not obtained_files:
             return []
 
-        _entries = sorted(obtained_files, key=attrgetter("modified_date"), reverse=reverse)
-
         if not limit:
+            _entries = sorted(obtained_files, key=attrgetter("modified_date"), reverse=reverse)
             self.entries = _entries
             return _entries
 
-        self.entries = _entries[:limit]
+        # same as sorting and slicing without sorting the whole listing
+        _select = heapq.nlargest if reverse else heapq.nsmallest
+        self.entries = _select(limit, obtained_files, key=attrgetter("modified_date"))
 
         return self.entries
 
     def get_files_modified_in(self, intervals: list[datetime]) -> list[DirlistingEntry]:
-        return list(filter(lambda x: x.modified_date in intervals, self.entries))
+        intervals_set = set(intervals)
+
+        return list(filter(lambda x: x.modified_date in intervals_set, self.entries))
 
     def get_files_aemo_intervals(self, intervals: list[datetime]) -> list[DirlistingEntry]:
-        return list(filter(lambda x: x.aemo_interval_date.date in intervals if x.aemo_interval_date else False, self.entries))
+        return [self.entries[i] for i in self._get_index().positions_for_intervals(intervals)]
 
     def get_files_modified_since(self, modified_date: datetime) -> list[DirlistingEntry]:
-        modified_since: list[DirlistingEntry] = []
-
         if self.timezone:
             # sanity check the timezone before filter
             try:
@@ -193,16 +245,13 @@ class DirectoryListing(BaseModel):
             except ValueError:
                 raise Exception(f"Invalid dirlisting timezone: {self.timezone}") from None
 
-            modified_since = list(
-                filter(
-                    lambda x: x.modified_date > modified_date,
-                    self.get_files(),
-                )
-            )
-        else:
-            modified_since = list(filter(lambda x: x.modified_date > modified_date, self.get_files()))
+        modified_since = [self.entries[i] for i in self._get_index().positions_modified_between(start=modified_date)]
 
-        return modified_since
+        return [
+            i
+            for i in modified_since
+            if i.entry_type == DirlistingEntryType.file and i.filename.suffix.lower() in _FILE_EXTENSIONS
+        ]
 
 
 def parse_dirlisting_line(dirlisting_line: str) -> DirlistingEntry | None:
@@ -243,7 +292,7 @@ def parse_dirlisting_line(dirlisting_line: str) -> DirlistingEntry | None:
 
     try:
         if model and model.filename:
-            model.aemo_interval_date = parse_aemo_filename(str(model.filename))
+            model = model.model_copy(update={"aemo_interval_date": parse_aemo_filename(str(model.filename))})
     except Exception:
         # logger.debug(f"Error parsing AEMO filename: {e}")
         pass
@@ -254,29 +303,32 @@ def parse_dirlisting_line(dirlisting_line: str) -> DirlistingEntry | None:
     return model
 
 
-async def get_dirlisting(url: str, timezone: str | None = None) -> DirectoryListing:
-    """Parse a directory listng into a list of DirlistingEntry models"""
-    dirlisting_content = await http.get(url)
-
-    logger.debug(f"Got dirlisting content of lenght {len(dirlisting_content.text)}")
+@dataclass
+class _DirlistingCacheEntry:
+    etag: str | None
+    last_modified: str | None
 
-    if not dirlisting_content.text:
-        raise Exception("No dirlisting content")
+    # parsed entries keyed by the raw listing line
+    entries: dict[str, DirlistingEntry | None]
 
-    # resp = pq(dirlisting_content.text, parser="html")
 
-    _dirlisting_models: list[DirlistingEntry] = []
+# previous listing for each url so unchanged listings aren't refetched and
+# unchanged lines aren't parsed again
+_DIRLISTING_CACHE: dict[str, _DirlistingCacheEntry] = {}
 
-    # pre_area = resp("pre")
 
+def _get_dirlisting_lines(content: str) -> list[str]:
+    """Get the entry lines from a listing page"""
     # use regex to find the pre area
-    pre_area = re.search(r"<pre>(.*?)</pre>", dirlisting_content.text, re.DOTALL)
+    pre_area = re.search(r"<pre>(.*?)</pre>", content, re.DOTALL)
 
     if not pre_area:
         raise Exception("Invalid directory listing: no pre or bad html")
 
     pre_content = pre_area.group(1)
 
+    dirlisting_lines: list[str] = []
+
     for i in pre_content.split("<br>"):
         # it catches the containing block so skip those
         if not i:
@@ -288,17 +340,72 @@ async def get_dirlisting(url: str, timezone: str | None = None) -> DirectoryList
         if "To Parent Directory" in i:
             continue
 
-        dirlisting_line = html.unescape(i.strip())
+        dirlisting_lines.append(html.unescape(i.strip()))
+
+    return dirlisting_lines
+
+
+def _listing_entries(entries: Iterable[DirlistingEntry | None]) -> list[DirlistingEntry]:
+    """Entries for a listing. The cached entries are immutable so they're shared rather than copied"""
+    return [i for i in entries if i]
+
+
+async def get_dirlisting(url: str, timezone: str | None = None, use_cache: bool = True) -> DirectoryListing:
+    """Parse a directory listng into a list of DirlistingEntry models
+
+    With use_cache the listing is requested with the ETag and Last-Modified of the previous
+    fetch and if it is unchanged the previous entries are used. Otherwise only lines that
+    weren't in the previous listing are parsed"""
+    cache_entry = _DIRLISTING_CACHE.get(url) if use_cache else None
+
+    request_headers: dict[str, str] = {}
+
+    if cache_entry and cache_entry.etag:
+        request_headers["If-None-Match"] = cache_entry.etag
+
+    if cache_entry and cache_entry.last_modified:
+        request_headers["If-Modified-Since"] = cache_entry.last_modified
+
+    dirlisting_content = await http.get(url, headers=request_headers)
+
+    if cache_entry and dirlisting_content.status_code == 304:
+        logger.debug(f"Dirlisting not modified: {url}")
+
+        return DirectoryListing(url=url, timezone=timezone, entries=_listing_entries(cache_entry.entries.values()))
+
+    # don't parse or cache error pages
+    if dirlisting_content.status_code != 200:
+        raise Exception(f"Could not fetch dirlisting {url}: status {dirlisting_content.status_code}")
+
+    logger.debug(f"Got dirlisting content of lenght {len(dirlisting_content.text)}")
+
+    if not dirlisting_content.text:
+        raise Exception("No dirlisting content")
+
+    previous_entries = cache_entry.entries if cache_entry else {}
+    dirlisting_entries: dict[str, DirlistingEntry | None] = {}
+
+    for dirlisting_line in _get_dirlisting_lines(dirlisting_content.text):
+        if dirlisting_line in previous_entries:
+            dirlisting_entries[dirlisting_line] = previous_entries[dirlisting_line]
+            continue
 
         model = parse_dirlisting_line(dirlisting_line)
 
         if model:
             # append the base URL to the model link
-            model.link = urljoin(url, model.link)
+            model = model.model_copy(update={"link": urljoin(url, model.link)})
+
+        dirlisting_entries[dirlisting_line] = model
 
-            _dirlisting_models.append(model)
+    if use_cache:
+        _DIRLISTING_CACHE[url] = _DirlistingCacheEntry(
+            etag=dirlisting_content.headers.get("etag"),
+            last_modified=dirlisting_content.headers.get("last-modified"),
+            entries=dirlisting_entries,
+        )
 
-    listing_model = DirectoryListing(url=url, timezone=timezone, entries=_dirlisting_models)
+    listing_model = DirectoryListing(url=url, timezone=timezone, entries=_listing_entries(dirlisting_entries.values()))
 
     logger.debug(f"Got back {len(listing_model.entries)} models")
 
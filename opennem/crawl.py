@@ -44,6 +44,7 @@ from opennem.crawlers.nemweb import (
 from opennem.crawlers.wem import WEMBalancing, WEMBalancingLive, WEMFacilityScada, WEMFacilityScadaLive
 from opennem.crawlers.wemde import AEMOWEMDEFacilityScadaHistory, AEMOWEMDETradingReport, AEMOWEMDETradingReportHistory
 from opennem.schema.date_range import CrawlDateRange
+from opennem.utils.cache import SCADA_RANGE_CACHE, invalidate_cache
 from opennem.utils.dates import get_today_opennem
 from opennem.utils.modules import load_all_crawler_definitions
 
@@ -202,6 +203,10 @@ async def run_crawl(
         raise Exception("Crawl controller error") from None
 
     if not has_errors:
+        # new intervals change the ranges that queries are run over
+        if cr.inserted_records:
+            await invalidate_cache(SCADA_RANGE_CACHE)
+
         if cr.server_latest:
             await crawler_set_meta(crawler.name, CrawlStatTypes.latest_processed, cr.server_latest)
             await crawler_set_meta(crawler.name, CrawlStatTypes.server_latest, cr.server_latest)
@@ -2,40 +2,202 @@
 
 import asyncio
 import logging
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from dataclasses import dataclass
 from datetime import datetime
+from functools import partial
+from pathlib import Path
+from shutil import rmtree
+from typing import IO
 
 from opennem.controllers.nem import ControllerReturn, store_aemo_tableset
-from opennem.core.crawlers.history import CrawlHistoryEntry, get_crawler_missing_intervals, set_crawler_history
+from opennem.core.crawlers.history import (
+    CrawlHistoryEntry,
+    CrawlHistoryWriter,
+    get_crawler_missing_intervals,
+    set_crawler_history,
+)
+from opennem.core.crawlers.pipeline import PipelineStage, run_pipeline
 from opennem.core.crawlers.schema import CrawlerDefinition, CrawlerPriority, CrawlerSchedule
+from opennem.core.downloader import url_download
 from opennem.core.parsers.aemo.filenames import AEMODataBucketSize
-from opennem.core.parsers.aemo.mms import parse_aemo_url
-from opennem.core.parsers.aemo.nemweb import parse_aemo_url_optimized, parse_aemo_url_optimized_bulk
+from opennem.core.parsers.aemo.mms import AEMOTableSet, parse_aemo_content
+from opennem.core.parsers.aemo.nemweb import parse_aemo_files
 from opennem.core.parsers.dirlisting import DirlistingEntry, get_dirlisting
 from opennem.crawlers.utils import get_time_interval_for_crawler
 from opennem.schema.date_range import CrawlDateRange
 from opennem.schema.network import NetworkAEMORooftop, NetworkNEM
+from opennem.utils.archive import download_and_unzip_async
 
 logger = logging.getLogger("opennem.crawler.nemweb")
 
 
-async def process_nemweb_entry(crawler: CrawlerDefinition, entry: DirlistingEntry, max_date: datetime) -> ControllerReturn:
-    controller_return: ControllerReturn | None = None
+# entries larger than this (in bytes) are unzipped to disk and parsed in the process pool
+# rather than parsed in memory
+NEMWEB_LARGE_FILE_SIZE = 100_000
+
+# parsed table sets of an entry on disk that can wait on the store stage
+NEMWEB_PARSED_TABLE_SETS_QUEUE_SIZE = 2
+
+
+@dataclass
+class NemwebEntryJob:
+    """An entry as it moves through the download, parse and store stages"""
+
+    entry: DirlistingEntry
+    download_path: Path | None = None
+    content: IO[bytes] | None = None
+    table_set: AEMOTableSet | None = None
+
+    # table sets of an entry on disk as each file is parsed, ended with None or the parse error
+    table_sets: asyncio.Queue[AEMOTableSet | Exception | None] | None = None
+    parse_task: asyncio.Task[None] | None = None
 
+
+async def download_nemweb_entry(crawler: CrawlerDefinition, job: NemwebEntryJob) -> NemwebEntryJob:
+    """Download stage. Large files and archives are streamed to disk"""
+    if crawler.bulk_insert or (job.entry.file_size and job.entry.file_size > NEMWEB_LARGE_FILE_SIZE):
+        job.download_path = await download_and_unzip_async(job.entry.link)
+    else:
+        job.content = await url_download(job.entry.link)
+
+    return job
+
+
+async def _parse_download_table_sets(download_path: Path, table_sets: asyncio.Queue[AEMOTableSet | Exception | None]) -> None:
+    """Parse the files of an unzipped entry in the process pool onto the bounded queue read by the
+    store stage. Files are removed once parsed"""
     try:
-        # @NOTE optimization - if we're dealing with a large file unzip
-        # to disk and parse rather than in-memory. 100,000kb
-        if crawler.bulk_insert:
-            controller_return = await parse_aemo_url_optimized_bulk(entry.link, persist_to_db=True)  # type: ignore
-        elif entry.file_size and entry.file_size > 100_000:
-            controller_return = await parse_aemo_url_optimized(entry.link)  # type: ignore
-        else:
-            ts = await parse_aemo_url(entry.link)
-            controller_return = await store_aemo_tableset(ts)
+        async with aclosing(parse_aemo_files(sorted(download_path.iterdir()))) as parsed_files:
+            async for csv_file, file_table_set in parsed_files:
+                await table_sets.put(file_table_set)
+                csv_file.unlink(missing_ok=True)
     except Exception as e:
-        logger.error(f"Processing error: {e}")
-        raise e
-    if not isinstance(controller_return, ControllerReturn):
-        raise Exception("Controller returns not a ControllerReturn")
+        await table_sets.put(e)
+    else:
+        await table_sets.put(None)
+
+
+async def _iter_parsed_table_sets(table_sets: asyncio.Queue[AEMOTableSet | Exception | None]) -> AsyncIterator[AEMOTableSet]:
+    while (table_set := await table_sets.get()) is not None:
+        if isinstance(table_set, Exception):
+            raise table_set
+
+        yield table_set
+
+
+async def parse_nemweb_entry(
+    crawler: CrawlerDefinition, job: NemwebEntryJob, parse_slots: asyncio.Semaphore | None = None
+) -> NemwebEntryJob:
+    """Parse stage. In-memory content is parsed in a thread. Files on disk are parsed in the process
+    pool and with bulk insert are merged into a single table set. Otherwise the table sets are handed
+    to the store stage on a bounded queue as each file is parsed so large entries are stored one file
+    at a time. The entry holds one of the parse slots until all its files are parsed"""
+    if job.download_path:
+        if not any(i.suffix.lower() == ".csv" for i in job.download_path.iterdir()):
+            rmtree(job.download_path, ignore_errors=True)
+            job.download_path = None
+            raise Exception(f"No files to parse from {job.entry.link}")
+
+        if not crawler.bulk_insert:
+            if parse_slots:
+                await parse_slots.acquire()
+
+            job.table_sets = asyncio.Queue(maxsize=NEMWEB_PARSED_TABLE_SETS_QUEUE_SIZE)
+            job.parse_task = asyncio.create_task(_parse_download_table_sets(job.download_path, job.table_sets))
+
+            if parse_slots:
+                job.parse_task.add_done_callback(lambda _: parse_slots.release())
+
+            return job
+
+        job.table_set = AEMOTableSet()
+
+        try:
+            async with aclosing(parse_aemo_files(sorted(job.download_path.iterdir()))) as parsed_files:
+                async for _, file_table_set in parsed_files:
+                    for table in file_table_set.tables:
+                        job.table_set.add_table(table)
+        finally:
+            rmtree(job.download_path, ignore_errors=True)
+            job.download_path = None
+    else:
+        try:
+            if job.content:
+                job.table_set = await asyncio.to_thread(parse_aemo_content, job.content, url=job.entry.link)
+        finally:
+            if job.content:
+                job.content.close()
+
+            job.content = None
+
+    if not job.table_set or not job.table_set.tables:
+        raise Exception(f"No tables parsed from {job.entry.link}")
+
+    return job
+
+
+async def _store_nemweb_table_sets(job: NemwebEntryJob) -> ControllerReturn:
+    """Store each table set of an entry as it is parsed and sum the controller returns"""
+    controller_return = ControllerReturn()
+    table_sets_stored = 0
+
+    try:
+        if job.table_sets is not None:
+            async for table_set in _iter_parsed_table_sets(job.table_sets):
+                if not table_set.tables:
+                    continue
+
+                table_set_return = await store_aemo_tableset(table_set)
+                table_sets_stored += 1
+
+                controller_return.total_records += table_set_return.total_records
+                controller_return.inserted_records += table_set_return.inserted_records
+                controller_return.processed_records += table_set_return.processed_records
+
+                if table_set_return.last_modified and (
+                    not controller_return.last_modified or table_set_return.last_modified > controller_return.last_modified
+                ):
+                    controller_return.last_modified = table_set_return.last_modified
+
+        elif job.table_set:
+            controller_return = await store_aemo_tableset(job.table_set)
+            table_sets_stored += 1
+    finally:
+        # stop parsing the rest of the files if storing failed
+        if job.parse_task:
+            job.parse_task.cancel()
+            await asyncio.gather(job.parse_task, return_exceptions=True)
+
+        if job.download_path:
+            rmtree(job.download_path, ignore_errors=True)
+
+        job.download_path = None
+        job.table_set = None
+        job.table_sets = None
+        job.parse_task = None
+
+    if not table_sets_stored:
+        raise Exception(f"No tables parsed from {job.entry.link}")
+
+    return controller_return
+
+
+async def store_nemweb_entry(
+    crawler: CrawlerDefinition,
+    job: NemwebEntryJob,
+    max_date: datetime,
+    history_writer: CrawlHistoryWriter | None = None,
+) -> ControllerReturn:
+    """Store stage. Stores the tables and records the crawl history for the entry. With a
+    history writer the crawl history is buffered and written in batches"""
+    entry = job.entry
+
+    if not job.table_set and job.table_sets is None:
+        raise Exception(f"No table set to store for {entry.link}")
+
+    controller_return = await _store_nemweb_table_sets(job)
 
     # don't update crawl time if it fails
     if not controller_return.inserted_records:
@@ -49,13 +211,29 @@ async def process_nemweb_entry(crawler: CrawlerDefinition, entry: DirlistingEntr
         ch = CrawlHistoryEntry(interval=entry.aemo_interval_date.date, records=controller_return.processed_records)
 
         try:
-            await set_crawler_history(crawler_name=crawler.name, histories=[ch])
+            if history_writer:
+                await history_writer.add(ch)
+            else:
+                await set_crawler_history(crawler_name=crawler.name, histories=[ch])
         except Exception as e:
             logger.error(f"Error updating crawl history: {e}")
 
     return controller_return
 
 
+async def process_nemweb_entry(crawler: CrawlerDefinition, entry: DirlistingEntry, max_date: datetime) -> ControllerReturn:
+    """Download, parse and store a single entry"""
+    try:
+        job = await download_nemweb_entry(crawler, NemwebEntryJob(entry=entry))
+        job = await parse_nemweb_entry(crawler, job)
+        controller_return = await store_nemweb_entry(crawler, job, max_date=max_date)
+    except Exception as e:
+        logger.error(f"Processing error: {e}")
+        raise e
+
+    return controller_return
+
+
 async def run_nemweb_aemo_crawl(
     crawler: CrawlerDefinition,
     run_fill: bool = True,
@@ -133,32 +311,41 @@ async def run_nemweb_aemo_crawl(
 
     max_date = max([i.modified_date for i in entries_to_fetch if i.modified_date])
 
-    tasks = []
-    for entry in entries_to_fetch:
-        tasks.append(process_nemweb_entry(crawler=crawler, entry=entry, max_date=max_date))
-
-        if len(tasks) >= 10:
-            task_results = await asyncio.gather(*tasks)
-
-            for task_result in task_results:
-                if task_result:
-                    controller_return.inserted_records += task_result.inserted_records
-                    controller_return.processed_records += task_result.processed_records
-                    controller_return.total_records += task_result.total_records
-                else:
-                    logger.error(f"No task result for {entry.link}")
-
-            tasks = []
+    # entries flow through download -> parse -> store with each stage bounded separately
+    # so a slow or failed entry doesn't hold up the others. entries on disk are still being
+    # parsed while they're stored so the parse slots bound them across both stages. crawl
+    # history for the run is buffered and written in batches
+    parse_slots = asyncio.Semaphore(max(crawler.parse_concurrency, 1))
+
+    async with CrawlHistoryWriter(crawler.name) as history_writer:
+        pipeline_result = await run_pipeline(
+            items=(NemwebEntryJob(entry=entry) for entry in entries_to_fetch),
+            stages=[
+                PipelineStage(
+                    name="download", handler=partial(download_nemweb_entry, crawler), concurrency=crawler.download_concurrency
+                ),
+                PipelineStage(
+                    name="parse",
+                    handler=partial(parse_nemweb_entry, crawler, parse_slots=parse_slots),
+                    concurrency=crawler.parse_concurrency,
+                ),
+                PipelineStage(
+                    name="store",
+                    handler=partial(store_nemweb_entry, crawler, max_date=max_date, history_writer=history_writer),
+                    concurrency=crawler.store_concurrency,
+                ),
+            ],
+        )
 
-    # complete any remaining tasks
-    if tasks:
-        task_results = await asyncio.gather(*tasks)
+    for task_result in pipeline_result.results:
+        controller_return.inserted_records += task_result.inserted_records
+        controller_return.processed_records += task_result.processed_records
+        controller_return.total_records += task_result.total_records
 
-        for task_result in task_results:
-            if task_result:
-                controller_return.inserted_records += task_result.inserted_records
-                controller_return.processed_records += task_result.processed_records
-                controller_return.total_records += task_result.total_records
+    for pipeline_error in pipeline_result.errors:
+        logger.error(f"Error in {pipeline_error.stage} for {pipeline_error.item.entry.link}: {pipeline_error.error}")
+        controller_return.errors += 1
+        controller_return.error_detail.append(str(pipeline_error.error))
 
     if controller_return:
         controller_return.crawls_run = len(entries_to_fetch)
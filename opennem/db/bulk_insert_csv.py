@@ -2,18 +2,27 @@
 """
 OpenNEM Bulk Insert Pipeline
 
-Bulk inserts records using temporary tables and CSV imports with copy_from
+Bulk inserts records using per connection staging tables and COPY
 
 """
 
 import csv
 import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from datetime import datetime
+from functools import cache
 from io import StringIO
 from typing import Any, TypeVar
 
 import asyncpg
+import numpy as np
+import pandas as pd
+from asyncpg import Connection
 from asyncpg.pool import Pool
+from sqlalchemy import Boolean, DateTime, Integer, Numeric
 from sqlalchemy.sql.schema import Column, Table
 
 from opennem import settings
@@ -26,17 +35,21 @@ ORMTableType = TypeVar("ORMTableType", bound=Table)
 # At the module level, create a connection pool
 pool: Pool | None = None
 
+# connection of the current bulkinsert_transaction block
+_bulkinsert_connection: ContextVar[Connection | None] = ContextVar("_bulkinsert_connection", default=None)
+
+# Staging tables are session temp tables so they are never WAL logged and each
+# connection gets its own. They are created once per connection and truncated for
+# each batch rather than created and dropped in every transaction
 _BULK_INSERT_QUERY = """
-    CREATE TEMP TABLE __tmp_{table_name}_{tmp_table_name}
-    (LIKE {table_schema}{table_name} INCLUDING DEFAULTS)
-    ON COMMIT DROP;
+    CREATE TEMP TABLE IF NOT EXISTS {staging_table_name}
+    (LIKE {table_schema}{table_name} INCLUDING DEFAULTS);
 
-    COPY __tmp_{table_name}_{tmp_table_name}
-        FROM STDIN WITH (FORMAT CSV, HEADER TRUE, DELIMITER ',');
+    TRUNCATE {staging_table_name};
 
-    INSERT INTO {table_schema}{table_name}
-        SELECT *
-        FROM __tmp_{table_name}_{tmp_table_name}
+    INSERT INTO {table_schema}{table_name} {insert_columns}
+        SELECT {select_columns}
+        FROM {staging_table_name}
     ON CONFLICT {on_conflict}
 """
 
@@ -48,9 +61,15 @@ _BULK_INSERT_CONFLICT_UPDATE = """
 def build_insert_query(
     table: Table,
     update_cols: list[str | Column] = None,
+    columns: list[str] | None = None,
+    conflict_columns: list[str] | None = None,
 ) -> tuple[str, list[str]]:
     """
     Builds the bulk insert query
+
+    If columns is set only those columns are inserted from the temp table which allows
+    partial upserts (ex. only price) where the other columns of existing rows are left as is.
+    conflict_columns overrides the table primary key as the conflict target
     """
     on_conflict = "DO NOTHING"
 
@@ -68,7 +87,7 @@ def build_insert_query(
 
     update_col_names = list(filter(lambda c: c, update_col_names))
 
-    primary_key_columns = [c.name for c in table.__table__.primary_key.columns.values()]  # type: ignore
+    primary_key_columns = conflict_columns or [c.name for c in table.__table__.primary_key.columns.values()]  # type: ignore
 
     if len(update_col_names):
         on_conflict = _BULK_INSERT_CONFLICT_UPDATE.format(
@@ -95,22 +114,18 @@ def build_insert_query(
         else:
             table_schema = f"{_ts}."
 
-    # Temporary table name uniq
-    tmp_table_name: str = ""
-
-    tmp_table_name = datetime.strftime(datetime.now(), "%Y%m%d%H%M%S")
-
-    if _ts:
-        tmp_table_name = f"{_ts}_{tmp_table_name}"
+    staging_table_name = f"__staging_{_ts}_{table.__table__.name}" if _ts else f"__staging_{table.__table__.name}"
 
     query = _BULK_INSERT_QUERY.format(
         table_name=table.__table__.name,  # type: ignore
         table_schema=table_schema,
         on_conflict=on_conflict,
-        tmp_table_name=tmp_table_name,
+        staging_table_name=staging_table_name,
+        insert_columns=f"({', '.join(columns)})" if columns else "",
+        select_columns=", ".join(columns) if columns else "*",
     )
 
-    return f"__tmp_{table.__table__.name}_{tmp_table_name}", query.split(";")
+    return staging_table_name, query.split(";")
 
 
 def _generate_bulkinsert_csv_from_records(
@@ -184,73 +199,188 @@ async def get_pool() -> Pool:
     return pool
 
 
+@dataclass(frozen=True)
+class BulkInsertTableMeta:
+    """Column metadata for a table used to encode COPY records"""
+
+    column_names: list[str]
+    column_types: dict[str, str]
+    column_defaults: dict[str, Any]
+
+
+def _column_type_kind(column: Column) -> str:
+    column_type = column.type
+
+    if isinstance(column_type, DateTime):
+        return "timestamp"
+
+    if isinstance(column_type, Boolean):
+        return "boolean"
+
+    if isinstance(column_type, Integer):
+        return "integer"
+
+    if isinstance(column_type, Numeric):
+        return "numeric"
+
+    return "text"
+
+
+def get_column_scalar_defaults(table: ORMTableType) -> dict[str, Any]:
+    """Python side scalar column defaults for a table (ex. is_forecast = False)"""
+    return dict(get_table_meta(table).column_defaults)
+
+
+@cache
+def get_table_meta(table: ORMTableType) -> BulkInsertTableMeta:
+    """Column names, types and defaults for a table. Read once from the model rather than
+    querying information_schema on every insert"""
+    columns = table.__table__.columns.values()
+
+    return BulkInsertTableMeta(
+        column_names=[c.name for c in columns],
+        column_types={c.name: _column_type_kind(c) for c in columns},
+        column_defaults={c.name: c.default.arg for c in columns if c.default is not None and c.default.is_scalar},
+    )
+
+
+_BOOLEAN_TRUE_VALUES = {"true", "t", "yes", "y", "1"}
+
+
+def _encode_column(values: pd.Series, column_type: str) -> np.ndarray:
+    """Encode a column to an object array of values asyncpg can copy, with None for missing"""
+    missing = values.isna().to_numpy()
+
+    if column_type == "timestamp":
+        try:
+            encoded = pd.to_datetime(values).astype(object).to_numpy()
+        except (ValueError, TypeError):
+            # mixed timezones or odd formats so parse one at a time
+            encoded = np.array(
+                [v if isinstance(v, datetime) or v is None else datetime.fromisoformat(str(v)) for v in values], dtype=object
+            )
+    elif column_type == "numeric":
+        encoded = pd.to_numeric(values).astype(float).to_numpy(dtype=object)
+    elif column_type == "integer":
+        encoded = pd.to_numeric(values).to_numpy(dtype=object)
+        encoded = np.array([None if m else int(v) for v, m in zip(encoded, missing, strict=True)], dtype=object)
+    elif column_type == "boolean":
+        if pd.api.types.is_bool_dtype(values):
+            encoded = values.to_numpy(dtype=object)
+        else:
+            encoded = values.astype(str).str.lower().isin(_BOOLEAN_TRUE_VALUES).to_numpy(dtype=object)
+    else:
+        encoded = values.astype(str).to_numpy(dtype=object)
+
+    encoded = np.asarray(encoded, dtype=object)
+    encoded[missing] = None
+
+    return encoded
+
+
+def encode_copy_records(
+    records: list[dict] | pd.DataFrame, columns: list[str], table_meta: BulkInsertTableMeta
+) -> list[tuple[Any, ...]]:
+    """Encode records into tuples for asyncpg's binary COPY one column at a time
+    rather than switching on the type of every value"""
+    df = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+
+    encoded_columns = []
+
+    for column in columns:
+        if column in df.columns:
+            values = df[column]
+        else:
+            values = pd.Series([table_meta.column_defaults.get(column)] * len(df), index=df.index, dtype=object)
+
+        encoded_columns.append(_encode_column(values, table_meta.column_types[column]))
+
+    return list(zip(*encoded_columns, strict=True))
+
+
+@asynccontextmanager
+async def bulkinsert_transaction() -> AsyncIterator[Connection]:
+    """Run all bulk inserts within the block on one connection and in one transaction
+
+    ex. all the tables from an AEMO file are copied and merged together and committed at the
+    end. Nested blocks share the outer transaction and can use savepoints (conn.transaction())
+    to roll back part of it"""
+    conn = _bulkinsert_connection.get()
+
+    if conn is not None:
+        yield conn
+        return
+
+    pool = await get_pool()
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            token = _bulkinsert_connection.set(conn)
+
+            try:
+                yield conn
+            finally:
+                _bulkinsert_connection.reset(token)
+
+
+async def _copy_and_merge(
+    conn: Connection, staging_table_name: str, sql_queries: list[str], records: list[tuple[Any, ...]], columns: list[str]
+) -> str:
+    # create the staging table if this connection doesn't have it yet and clear it
+    await conn.execute(";".join(sql_queries[:2]))
+
+    # Use copy_records_to_table to bulk insert the records
+    await conn.copy_records_to_table(staging_table_name, records=records, columns=columns)
+
+    # Execute the INSERT ... ON CONFLICT query
+    return await conn.execute(sql_queries[2])
+
+
 async def bulkinsert_mms_items(
     table: ORMTableType,
-    records: list[dict],
+    records: list[dict] | pd.DataFrame,
     update_fields: list[str | Column[Any]] | None = None,
+    conflict_columns: list[str] | None = None,
 ) -> int:
-    if not records:
+    """Bulk upsert records using a staging table and COPY
+
+    Records can be a list of dicts or a dataframe and can hold a subset of the table
+    columns. Only the columns in the records (and those with a default) are copied and
+    inserted, and update_fields sets which of them are updated on conflict. So price
+    records and demand records can each be upserted into the same balancing summary rows
+    without overwriting each other.
+
+    Within a bulkinsert_transaction block the insert runs in a savepoint of the shared
+    transaction, otherwise it runs in its own transaction."""
+    if len(records) == 0:
         return 0
 
-    tmp_table_name, sql_queries = build_insert_query(table=table, update_cols=update_fields)
+    table_meta = get_table_meta(table)
 
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        async with conn.transaction():
-            try:
-                # Execute CREATE TEMP TABLE
-                await conn.execute(sql_queries[0])
-
-                # Get column names and types from the temporary table
-                table_info = await conn.fetch(f"""
-                    SELECT column_name, data_type
-                    FROM information_schema.columns
-                    WHERE table_name = '{tmp_table_name.split(".")[-1]}'
-                """)
-
-                # Prepare records
-                columns = [col["column_name"] for col in table_info]
-                column_types = {col["column_name"]: col["data_type"] for col in table_info}
-
-                records_to_insert = []
-                for record in records:
-                    record_values = []
-                    for col in columns:
-                        value = record.get(col)
-                        if value is None:
-                            record_values.append(None)
-                        elif column_types[col] == "timestamp without time zone":
-                            # Convert string to datetime object if it's not already
-                            record_values.append(value if isinstance(value, datetime) else datetime.fromisoformat(str(value)))
-                        elif column_types[col] == "numeric":
-                            # Ensure numeric values are passed as float or Decimal
-                            record_values.append(float(value) if value is not None else None)
-                        elif column_types[col] == "boolean":
-                            # Convert string to boolean
-                            value = str(value).lower()
-                            record_values.append(value in ("true", "t", "yes", "y", "1"))
-                        else:
-                            record_values.append(str(value))
-                    records_to_insert.append(record_values)
-
-                # Use copy_records_to_table to bulk insert the records
-                await conn.copy_records_to_table(
-                    tmp_table_name.split(".")[-1],  # Remove schema if present
-                    records=records_to_insert,
-                    columns=columns,
-                )
+    record_fields = records.columns if isinstance(records, pd.DataFrame) else records[0].keys()
+    columns = [c for c in table_meta.column_names if c in record_fields or c in table_meta.column_defaults]
+
+    staging_table_name, sql_queries = build_insert_query(
+        table=table,
+        update_cols=update_fields,
+        columns=columns if len(columns) < len(table_meta.column_names) else None,
+        conflict_columns=conflict_columns,
+    )
 
-                # Execute the INSERT ... ON CONFLICT query
-                insert_result = await conn.execute(sql_queries[2])
+    records_to_insert = encode_copy_records(records, columns, table_meta)
 
-                num_records = len(records)
-                logger.info(f"Bulk inserted {num_records} records: {insert_result}")
+    try:
+        async with bulkinsert_transaction() as conn:
+            async with conn.transaction():
+                insert_result = await _copy_and_merge(conn, staging_table_name, sql_queries, records_to_insert, columns)
+    except Exception as generic_error:
+        logger.error(f"Error during bulk insert: {generic_error}")
+        raise generic_error
 
-                return num_records
+    num_records = len(records)
+    logger.info(f"Bulk inserted {num_records} records: {insert_result}")
 
-            except Exception as generic_error:
-                logger.error(f"Error during bulk insert: {generic_error}")
-                raise generic_error
+    return num_records
 
 
 def generate_csv_from_records(
@@ -1,4 +1,5 @@
 import logging
+from collections.abc import Iterable
 from io import BytesIO, StringIO
 from os import makedirs
 from pathlib import Path
@@ -9,6 +10,23 @@ from opennem.utils.mime import decode_bytes
 logger = logging.getLogger(__name__)
 
 
+def write_chunks_to_local(file_path: str, chunks: Iterable[bytes]) -> int:
+    """Write content from an iterator of byte chunks without joining them"""
+    save_file_path = Path(settings.static_folder_path) / file_path.lstrip("/")
+
+    save_file_path.resolve().parent.mkdir(parents=True, exist_ok=True)
+
+    bytes_written = 0
+
+    with open(save_file_path, "wb") as fh:
+        for chunk in chunks:
+            bytes_written += fh.write(chunk)
+
+    logger.info(f"Wrote {bytes_written} to {save_file_path}")
+
+    return bytes_written
+
+
 def write_to_local(file_path: str, data: StringIO | bytes | BytesIO | str) -> int:
     save_folder = settings.static_folder_path
 
@@ -13,6 +13,7 @@ from aiohttp import ClientError
 
 from opennem import settings
 from opennem.api.stats.schema import OpennemDataSet
+from opennem.exporter.serialize import dump_dataset_json
 
 logger = logging.getLogger("opennem.exporter.r2_bucket")
 
@@ -53,9 +54,12 @@ class OpennemDataSetSerialize:
         if settings.debug:
             indent = 4
 
-        stat_set_content = stat_set_to_write.model_dump_json(
-            exclude_unset=self.exclude_unset, indent=indent if settings.is_dev else None, exclude=exclude
-        )
+        stat_set_content: str | bytes
+
+        if indent and settings.is_dev:
+            stat_set_content = stat_set_to_write.model_dump_json(exclude_unset=self.exclude_unset, indent=indent, exclude=exclude)
+        else:
+            stat_set_content = dump_dataset_json(stat_set_to_write, exclude_unset=self.exclude_unset, exclude=exclude)
 
         try:
             obj_to_write = await self.bucket.Object(key=key)
@@ -0,0 +1,125 @@
+"""
+OpenNEM data set serializer
+
+Serializes OpennemDataSet's to compact JSON for exports. The output is the same as model_dump_json
+but the history number series are encoded from float arrays rather than passing each value through
+the history data serializer. Each model is written field by field in field order with the other
+fields serialized by pydantic, so a data set can be streamed to a file or upload a series at a time.
+"""
+
+import io
+import logging
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+import numpy as np
+import pydantic_core
+from pydantic import BaseModel
+
+from opennem.api.stats.schema import OpennemData, OpennemDataHistory, OpennemDataSet, ValidNumberOrNull
+
+logger = logging.getLogger("opennem.exporter.serialize")
+
+FieldSerializer = Callable[[Any, bool], Iterator[bytes]]
+
+
+def number_series_json(values: list[ValidNumberOrNull] | np.ndarray) -> bytes:
+    """JSON array for a number series with nulls for missing and non-finite values. Encoded by
+    pydantic_core from a float array so numbers are formatted the same as model_dump_json"""
+    return pydantic_core.to_json(np.asarray(values, dtype=float).tolist(), inf_nan_mode="null")
+
+
+def _iter_model_json(
+    model: BaseModel, exclude_unset: bool, fields: dict[str, FieldSerializer], exclude: set[str] | None = None
+) -> Iterator[bytes]:
+    """JSON object for a model with the fields in fields written by their serializer and the rest
+    serialized by pydantic. Fields are written in the same order and with the same exclusions as
+    model_dump_json"""
+    excluded = set(exclude or ())
+    values = model.model_dump(mode="json", exclude_unset=exclude_unset, exclude=excluded | set(fields))
+    field_names = [*type(model).model_fields, *type(model).model_computed_fields]
+
+    separator = b"{"
+
+    for field_name in field_names:
+        if field_name in fields:
+            if field_name in excluded or (exclude_unset and field_name not in model.model_fields_set):
+                continue
+
+            field_json: Iterable[bytes] = fields[field_name](getattr(model, field_name), exclude_unset)
+        elif field_name in values:
+            field_json = (pydantic_core.to_json(values[field_name]),)
+        else:
+            continue
+
+        yield separator + pydantic_core.to_json(field_name) + b":"
+        yield from field_json
+        separator = b","
+
+    yield b"{}" if separator == b"{" else b"}"
+
+
+def _iter_history_json(history: OpennemDataHistory | None, exclude_unset: bool) -> Iterator[bytes]:
+    if history is None:
+        yield b"null"
+        return
+
+    yield from _iter_model_json(history, exclude_unset, {"data": lambda data, _: iter((number_series_json(data),))})
+
+
+def _iter_data_json(data: OpennemData, exclude_unset: bool) -> Iterator[bytes]:
+    yield from _iter_model_json(data, exclude_unset, {"history": _iter_history_json, "forecast": _iter_history_json})
+
+
+def _iter_data_list_json(data: list[OpennemData], exclude_unset: bool) -> Iterator[bytes]:
+    separator = b"["
+
+    for i in data:
+        yield separator
+        yield from _iter_data_json(i, exclude_unset)
+        separator = b","
+
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def iter_dataset_json(stat_set: OpennemDataSet, exclude_unset: bool = False, exclude: set | None = None) -> Iterator[bytes]:
+    """Serialize a data set to compact JSON in chunks. exclude is a set of top level fields"""
+    if exclude and not all(isinstance(i, str) for i in exclude):
+        yield stat_set.model_dump_json(exclude_unset=exclude_unset, exclude=exclude).encode()
+        return
+
+    yield from _iter_model_json(stat_set, exclude_unset, {"data": _iter_data_list_json}, exclude=exclude)
+
+
+def dump_dataset_json(stat_set: OpennemDataSet, exclude_unset: bool = False, exclude: set | None = None) -> bytes:
+    """Serialize a data set to compact JSON. Same output as model_dump_json"""
+    return b"".join(iter_dataset_json(stat_set, exclude_unset=exclude_unset, exclude=exclude))
+
+
+class ChunkReader(io.RawIOBase):
+    """Read only file object over an iterator of byte chunks so the chunks can be streamed to an
+    upload or file without joining them"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b"")
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+
+            if chunk is None:
+                return 0
+
+            self._chunk = memoryview(chunk)
+
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        self.bytes_read += size
+
+        return size
@@ -1,10 +1,12 @@
 import asyncio
 import logging
+from collections.abc import Iterable
 
 import aioboto3
 from botocore.exceptions import ClientError
 
 from opennem import settings
+from opennem.exporter.serialize import ChunkReader
 
 logger = logging.getLogger(__name__)
 
@@ -69,7 +71,7 @@ class CloudflareR2Uploader:
 
     async def upload_content(
         self,
-        content: str,
+        content: str | bytes,
         object_name: str,
         content_type: str | None = None,
     ) -> None:
@@ -78,7 +80,7 @@ class CloudflareR2Uploader:
 
         Args:
             bucket_name (str): The name of the bucket to upload to.
-            content (str): The content to upload.
+            content (str | bytes): The content to upload.
             object_name (str): The object name in the bucket.
             content_type (Optional[str]): The content type of the data.
 
@@ -99,6 +101,45 @@ class CloudflareR2Uploader:
                 logger.error(f"An error occurred while uploading content: {e}")
                 raise
 
+    async def upload_chunks(
+        self,
+        chunks: Iterable[bytes],
+        object_name: str,
+        content_type: str | None = None,
+    ) -> int:
+        """
+        Upload content from an iterator of byte chunks to a Cloudflare R2 bucket without joining
+        the chunks. Large content is uploaded in parts.
+
+        Args:
+            chunks (Iterable[bytes]): The content to upload.
+            object_name (str): The object name in the bucket.
+            content_type (Optional[str]): The content type of the data.
+
+        Returns:
+            int: The number of bytes uploaded.
+
+        Raises:
+            ClientError: If an error occurs during the upload process.
+        """
+        content = ChunkReader(chunks)
+
+        async with await self._get_s3_client() as s3:  # type: ignore
+            try:
+                extra_args = {}
+                if content_type:
+                    extra_args["ContentType"] = content_type
+
+                await s3.upload_fileobj(content, self.bucket_name, object_name, ExtraArgs=extra_args)
+                logger.info(
+                    f"Content uploaded successfully to bucket {self.bucket_name} at {settings.s3_bucket_public_url}{object_name}"
+                )
+            except ClientError as e:
+                logger.error(f"An error occurred while uploading content: {e}")
+                raise
+
+        return content.bytes_read
+
 
 cloudflare_uploader = CloudflareR2Uploader(region="apac")
 
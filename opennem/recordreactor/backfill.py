@@ -0,0 +1,468 @@
+"""
+RecordReactor backfill
+
+Offline mode for rebuilding milestones over a long range. Rather than querying every interval and
+period one at a time, the series for each network are read out of the database once in chunks and
+the record-breaking rows for each record id are found with running highs and lows over the chunk.
+Only the record-breaking rows are persisted.
+
+Supports the interval demand, price and renewable power milestones and the daily generation,
+energy and emissions milestones. The generation, energy and emissions milestones for the longer
+periods are rolled up from the day frames as each period ends.
+"""
+
+import logging
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta
+from functools import cache
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from opennem import settings
+from opennem.core.units import get_unit
+from opennem.db import get_read_session
+from opennem.recordreactor.buckets import get_period_start_end, is_end_of_period
+from opennem.recordreactor.persistence import persist_milestones
+from opennem.recordreactor.rollup import PeriodRollupStore, RollupMethod
+from opennem.recordreactor.schema import (
+    MilestoneAggregate,
+    MilestoneFueltechGrouping,
+    MilestonePeriod,
+    MilestoneRecordSchema,
+    MilestoneType,
+    MilestoneUnitSchema,
+)
+from opennem.recordreactor.state import get_current_milestone_state
+from opennem.recordreactor.unit import get_milestone_unit
+from opennem.schema.network import NetworkNEM, NetworkSchema, NetworkWEM, NetworkWEMDE
+from opennem.utils.dates import get_last_completed_interval_for_network
+
+logger = logging.getLogger("opennem.recordreactor.backfill")
+
+# days of data read from the database at a time
+BACKFILL_CHUNK_DAYS = 30
+
+# columns of the milestone frames that records are found from
+MILESTONE_FRAME_COLUMNS = ["interval", "network_region", "fueltech", "metric", "value"]
+
+_MILESTONE_KEY_COLUMNS = ["network_region", "fueltech", "metric"]
+
+# periods that are rolled up from the day frames
+BACKFILL_ROLLUP_PERIODS = [
+    MilestonePeriod.week_rolling,
+    MilestonePeriod.month,
+    MilestonePeriod.quarter,
+    MilestonePeriod.season,
+    MilestonePeriod.year,
+    MilestonePeriod.financial_year,
+]
+
+
+def find_record_breaking_milestones(
+    frame: pd.DataFrame,
+    network: NetworkSchema,
+    period: MilestonePeriod,
+    running_values: dict[str, float],
+) -> list[MilestoneRecordSchema]:
+    """Find the rows of a milestone frame that set a new high or low for their record id
+
+    The running high or low for each record id starts from running_values, which is updated with the
+    new values, so that frames can be passed in interval order chunk by chunk. Zero and missing values
+    are never records, the same as when persisting milestones.
+    """
+    if frame.empty:
+        return []
+
+    frame = frame.sort_values("interval", kind="stable").reset_index(drop=True)
+
+    group_codes = frame.groupby(_MILESTONE_KEY_COLUMNS, dropna=False, sort=False).ngroup().to_numpy()
+    _, group_first_rows = np.unique(group_codes, return_index=True)
+
+    values = frame["value"].to_numpy(dtype=float)
+    valid = np.isfinite(values) & (values != 0)
+
+    milestone_records: list[MilestoneRecordSchema] = []
+
+    for aggregate in [MilestoneAggregate.high, MilestoneAggregate.low]:
+        is_high = aggregate == MilestoneAggregate.high
+        fill = -np.inf if is_high else np.inf
+
+        # record ids are the same for every row of a group so are built once from its first row
+        group_records = [_milestone_record(frame.iloc[i], network, period, aggregate) for i in group_first_rows]
+        group_initial = np.array([running_values.get(i.record_id, fill) for i in group_records])
+
+        masked = pd.Series(np.where(valid, values, fill))
+        grouped = masked.groupby(group_codes)
+        running = grouped.cummax() if is_high else grouped.cummin()
+
+        # the best value before each row including the starting values
+        previous = running.groupby(group_codes).shift(1).to_numpy()
+        previous = np.where(np.isnan(previous), fill, previous)
+        initial = group_initial[group_codes]
+        previous = np.maximum(previous, initial) if is_high else np.minimum(previous, initial)
+
+        breaking = valid & (masked.to_numpy() > previous if is_high else masked.to_numpy() < previous)
+
+        for position in np.flatnonzero(breaking):
+            milestone_records.append(
+                _milestone_record(frame.iloc[position], network, period, aggregate, value=float(values[position]))
+            )
+
+        # carry the running values over to the next chunk
+        group_last = running.groupby(group_codes).last().to_numpy()
+        group_best = np.maximum(group_last, group_initial) if is_high else np.minimum(group_last, group_initial)
+
+        for group_record, best in zip(group_records, group_best, strict=True):
+            if np.isfinite(best):
+                running_values[group_record.record_id] = float(best)
+
+    return sorted(milestone_records, key=lambda x: x.interval)
+
+
+@cache
+def _milestone_unit(metric: MilestoneType) -> MilestoneUnitSchema:
+    """Milestone unit for a metric. Price is per MWh the same as the live demand and price milestones"""
+    milestone_unit = get_milestone_unit(metric)
+
+    if metric == MilestoneType.price:
+        price_unit = get_unit("price_energy_mega").unit
+        return milestone_unit.model_copy(update={"unit": price_unit, "output_format": f"{{:,.2f}} {price_unit}"})
+
+    return milestone_unit
+
+
+def _milestone_record(
+    row: pd.Series,
+    network: NetworkSchema,
+    period: MilestonePeriod,
+    aggregate: MilestoneAggregate,
+    value: float | None = None,
+) -> MilestoneRecordSchema:
+    metric = MilestoneType(row["metric"])
+
+    return MilestoneRecordSchema(
+        interval=row["interval"],
+        aggregate=aggregate,
+        metric=metric,
+        period=period,
+        unit=_milestone_unit(metric),
+        network=network,
+        network_region=row["network_region"] if isinstance(row["network_region"], str) else None,
+        fueltech=MilestoneFueltechGrouping(row["fueltech"]) if isinstance(row["fueltech"], str) else None,
+        value=value,
+    )
+
+
+def _melt_milestone_frame(frame: pd.DataFrame, metrics: dict[str, tuple[MilestoneType, str | None]]) -> pd.DataFrame:
+    """Long milestone frame from a frame with a column for each metric. metrics maps each value column
+    to its metric and fueltech, where a fueltech of None keeps the fueltech column of the frame"""
+    melted = []
+
+    for column, (metric, fueltech) in metrics.items():
+        metric_frame = pd.DataFrame(
+            {
+                "interval": frame["interval"],
+                "network_region": frame["network_region"],
+                "fueltech": fueltech if fueltech or "fueltech" not in frame else frame["fueltech"],
+                "metric": metric.value,
+                "value": frame[column],
+            }
+        )
+        melted.append(metric_frame)
+
+    return pd.concat(melted, ignore_index=True)[MILESTONE_FRAME_COLUMNS]
+
+
+def _with_network_totals(frame: pd.DataFrame, keys: list[str], region_group: bool) -> pd.DataFrame:
+    """Add network level rows summed over regions to a regional frame"""
+    columns = [i for i in frame.columns if i not in keys and i != "network_region"]
+    network_frame = frame.groupby(keys, as_index=False, dropna=False)[columns].sum(min_count=1)
+    network_frame["network_region"] = None
+
+    if not region_group:
+        return network_frame
+
+    return pd.concat([frame, network_frame], ignore_index=True)
+
+
+async def _read_frame(query: str, params: dict) -> pd.DataFrame:
+    async with get_read_session() as session:
+        result = await session.execute(text(query), params)
+        rows = result.fetchall()
+        columns = list(result.keys())
+
+    return pd.DataFrame(rows, columns=columns)
+
+
+async def get_demand_price_frame(network: NetworkSchema, date_start: datetime, date_end: datetime) -> pd.DataFrame:
+    """Interval demand and price milestone frame for a range"""
+    frame = await _read_frame(
+        """
+        SELECT
+            bs.interval,
+            bs.network_region,
+            sum(bs.demand_total) as demand,
+            sum(bs.price) as price_sum,
+            count(bs.price) as price_count
+        FROM balancing_summary bs
+        WHERE
+            bs.network_id = :network_id AND
+            bs.interval >= :date_start AND
+            bs.interval < :date_end
+        GROUP BY 1, 2
+        """,
+        {"network_id": network.code, "date_start": date_start, "date_end": date_end},
+    )
+
+    if frame.empty:
+        return pd.DataFrame(columns=MILESTONE_FRAME_COLUMNS)
+
+    frame = _with_network_totals(frame.astype({"demand": float, "price_sum": float}), ["interval"], region_group=True)
+
+    # averaged over the rows for the interval the same as the interval queries
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frame["price"] = frame["price_sum"] / frame["price_count"].replace(0, np.nan)
+
+    return _melt_milestone_frame(
+        frame,
+        {
+            "demand": (MilestoneType.demand, MilestoneFueltechGrouping.demand.value),
+            "price": (MilestoneType.price, None),
+        },
+    )
+
+
+async def get_renewable_power_frame(network: NetworkSchema, date_start: datetime, date_end: datetime) -> pd.DataFrame:
+    """Interval renewable and fossil power milestone frame for a range"""
+    if network in [NetworkWEM, NetworkWEMDE] or not network.subnetworks:
+        return pd.DataFrame(columns=MILESTONE_FRAME_COLUMNS)
+
+    network_codes = [network.code.upper()] + [i.code.upper() for i in network.subnetworks]
+
+    frame = await _read_frame(
+        f"""
+        SELECT
+            fs.interval,
+            f.network_region,
+            CASE WHEN ftg.renewable THEN 'renewables' ELSE 'fossils' end as fueltech,
+            COALESCE(sum(generated), 0) AS generation
+        FROM facility_scada fs
+        JOIN facility f ON f.code = fs.facility_code
+        JOIN fueltech ft ON ft.code = f.fueltech_id
+        JOIN fueltech_group ftg ON ftg.code = ft.fueltech_group_id
+        WHERE
+            fs.interval >= :date_start AND
+            fs.interval < :date_end AND
+            fs.network_id IN ({", ".join(f"'{i}'" for i in network_codes)}) AND
+            fs.is_forecast is False
+        GROUP BY 1, 2, 3
+        """,
+        {"date_start": date_start, "date_end": date_end},
+    )
+
+    if frame.empty:
+        return pd.DataFrame(columns=MILESTONE_FRAME_COLUMNS)
+
+    frame = _with_network_totals(frame.astype({"generation": float}), ["interval", "fueltech"], region_group=True)
+
+    return _melt_milestone_frame(frame, {"generation": (MilestoneType.power, None)})
+
+
+async def get_generation_day_frame(network: NetworkSchema, date_start: datetime, date_end: datetime) -> pd.DataFrame:
+    """Daily generation, energy and emissions milestone frame for a range"""
+    network_query = "'NEM','AEMO_ROOFTOP','AEMO_ROOFTOP_BACKFILL'" if network == NetworkNEM else "'WEM', 'WEMDE', 'APVI'"
+    network_region_filter_query = "fs.network_region IN ('WEM', 'WEMDE') and " if network in [NetworkWEM, NetworkWEMDE] else ""
+
+    frame = await _read_frame(
+        f"""
+        SELECT
+            fs.trading_day as interval,
+            fs.network_region as network_region,
+            ftg.code as fueltech,
+            sum(fs.generated) as generated,
+            sum(fs.energy) as energy,
+            sum(fs.emissions) as emissions
+        FROM
+            mv_fueltech_daily fs
+            JOIN fueltech ft ON fs.fueltech_code = ft.code
+            JOIN fueltech_group ftg on ftg.code = ft.fueltech_group_id
+        WHERE
+            fs.network_id IN ({network_query}) AND
+            {network_region_filter_query}
+            fs.trading_day >= :date_start AND
+            fs.trading_day < :date_end
+        GROUP BY 1, 2, 3
+        """,
+        {"date_start": date_start, "date_end": date_end},
+    )
+
+    if frame.empty:
+        return pd.DataFrame(columns=MILESTONE_FRAME_COLUMNS)
+
+    frame["interval"] = pd.to_datetime(frame["interval"]).dt.to_pydatetime()
+    frame = frame.astype({"generated": float, "energy": float, "emissions": float})
+
+    # don't region group for WEM/WEMDE as they are not region specific
+    frame = _with_network_totals(frame, ["interval", "fueltech"], region_group=network not in [NetworkWEM, NetworkWEMDE])
+
+    return _melt_milestone_frame(
+        frame,
+        {
+            "generated": (MilestoneType.power, None),
+            "energy": (MilestoneType.energy, None),
+            "emissions": (MilestoneType.emissions, None),
+        },
+    )
+
+
+def _completed_period(day_end: datetime, period: MilestonePeriod, network: NetworkSchema) -> tuple[datetime, datetime] | None:
+    """The period that ends at a day end, if any. Rolling weeks end every day and start seven days before"""
+    if not is_end_of_period(day_end, period):
+        return None
+
+    if period == MilestonePeriod.week_rolling:
+        return day_end - timedelta(days=7), day_end
+
+    return get_period_start_end(dt=day_end, bucket_size=period, network=network)
+
+
+def rollup_day_frame(
+    rollup_store: PeriodRollupStore,
+    network: NetworkSchema,
+    day_frame: pd.DataFrame,
+    date_start: datetime,
+    date_end: datetime,
+    periods: list[MilestonePeriod],
+) -> list[tuple[MilestonePeriod, pd.DataFrame]]:
+    """Store the days of a day frame for the range [date_start, date_end) and roll up a milestone frame
+    for each of the periods that end in the range. Periods that start before the first stored day
+    aren't complete and are skipped"""
+    day_rows: dict = {}
+
+    if not day_frame.empty:
+        rows = day_frame.astype({"value": float}).astype(object).where(day_frame.notna(), None)
+        rows["day"] = pd.to_datetime(day_frame["interval"]).dt.date
+
+        for day, day_group in rows.groupby("day"):
+            day_rows[day] = day_group[[*_MILESTONE_KEY_COLUMNS, "value"]].to_dict(orient="records")
+
+    period_rows: dict[MilestonePeriod, list[dict]] = {i: [] for i in periods}
+
+    # days are stored from midnight the same as the trading days in the day frame
+    day_end = date_start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if day_end < date_start:
+        day_end += timedelta(days=1)
+
+    while day_end < date_end:
+        rollup_store.add_day(network.code, day_end.date(), day_rows.get(day_end.date(), []))
+        day_end += timedelta(days=1)
+
+        if day_end > date_end:
+            break
+
+        for period in periods:
+            period_range = _completed_period(day_end, period, network)
+
+            if not period_range:
+                continue
+
+            period_start, period_end = period_range
+            rolled_up = rollup_store.rollup(network.code, period_start.date(), period_end.date())
+
+            if rolled_up is None:
+                continue
+
+            period_rows[period] += [i | {"interval": period_start} for i in rolled_up]
+
+    return [
+        (period, pd.DataFrame(rows, columns=MILESTONE_FRAME_COLUMNS).astype({"value": float}))
+        for period, rows in period_rows.items()
+        if rows
+    ]
+
+
+async def iter_backfill_chunks(
+    network: NetworkSchema,
+    start_interval: datetime,
+    end_interval: datetime,
+    metrics: list[MilestoneType],
+    periods: list[MilestonePeriod],
+    chunk_days: int = BACKFILL_CHUNK_DAYS,
+) -> AsyncIterator[tuple[MilestonePeriod, pd.DataFrame]]:
+    """Milestone frames for each period and chunk of the range in interval order"""
+    rollup_periods = [i for i in periods if i in BACKFILL_ROLLUP_PERIODS]
+    rollup_store = PeriodRollupStore(keys=_MILESTONE_KEY_COLUMNS, columns={"value": RollupMethod.sum})
+
+    chunk_start = start_interval
+
+    while chunk_start < end_interval:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end_interval)
+
+        if MilestonePeriod.interval in periods:
+            frames = []
+
+            if MilestoneType.demand in metrics or MilestoneType.price in metrics:
+                frame = await get_demand_price_frame(network, chunk_start, chunk_end)
+                frames.append(frame[frame["metric"].isin([i.value for i in metrics])])
+
+            if MilestoneType.power in metrics:
+                frames.append(await get_renewable_power_frame(network, chunk_start, chunk_end))
+
+            if frames:
+                yield MilestonePeriod.interval, pd.concat(frames, ignore_index=True)
+
+        if (MilestonePeriod.day in periods or rollup_periods) and (
+            MilestoneType.energy in metrics or MilestoneType.emissions in metrics
+        ):
+            day_frame = await get_generation_day_frame(network, chunk_start, chunk_end)
+
+            if MilestonePeriod.day in periods:
+                yield MilestonePeriod.day, day_frame
+
+            for period, frame in rollup_day_frame(rollup_store, network, day_frame, chunk_start, chunk_end, rollup_periods):
+                yield period, frame
+
+        chunk_start = chunk_end
+
+
+async def run_milestone_backfill(
+    start_interval: datetime,
+    end_interval: datetime | None,
+    metrics: list[MilestoneType],
+    networks: list[NetworkSchema],
+    periods: list[MilestonePeriod],
+    chunk_days: int = BACKFILL_CHUNK_DAYS,
+) -> int:
+    """Backfill milestones for a range. Returns the number of record-breaking milestones found"""
+    milestone_state = await get_current_milestone_state()
+
+    # running highs and lows keyed by record id
+    running_values = {record_id: record.value for record_id, record in milestone_state.items()}
+    milestones_found = 0
+
+    for network in networks:
+        if not network.interval_size or not network.data_first_seen:
+            logger.info(f"Skipping {network.code} as it has no interval size or data first seen")
+            continue
+
+        network_start = max(start_interval, network.data_first_seen.replace(tzinfo=None))
+        network_end = end_interval or get_last_completed_interval_for_network(network).replace(tzinfo=None)
+
+        if network.data_last_seen:
+            network_end = min(network_end, network.data_last_seen.replace(tzinfo=None))
+
+        logger.info(f"Backfilling milestones for {network.code} from {network_start} to {network_end}")
+
+        async for period, frame in iter_backfill_chunks(network, network_start, network_end, metrics, periods, chunk_days):
+            milestone_records = find_record_breaking_milestones(frame, network, period, running_values)
+            milestones_found += len(milestone_records)
+
+            if milestone_records and not settings.dry_run:
+                await persist_milestones(milestones=milestone_records)
+
+    logger.info(f"Backfill found {milestones_found} milestones")
+
+    return milestones_found
@@ -2,12 +2,14 @@
 RecordReactor engine
 """
 
+import asyncio
 import logging
 from datetime import datetime, timedelta
 
 import tqdm
 
 from opennem import settings
+from opennem.recordreactor.backfill import run_milestone_backfill
 from opennem.recordreactor.buckets import get_period_start_end, is_end_of_period
 from opennem.recordreactor.processors.demand import run_price_demand_milestone_for_interval
 from opennem.recordreactor.processors.generation import run_generation_energy_emissions_milestones
@@ -52,7 +54,13 @@ async def run_milestone_engine(
     periods: list[MilestonePeriod] | None = None,
     bulk_insert: bool = False,
     bulk_insert_batch_size: int = 100,
+    backfill: bool = False,
 ):
+    """Run the milestone engine for each interval of a range
+
+    With backfill the range is read in chunks and the record-breaking milestones found over whole
+    series at once. See opennem.recordreactor.backfill
+    """
     if not metrics:
         metrics = _DEFAULT_METRICS
 
@@ -62,6 +70,12 @@ async def run_milestone_engine(
     if not periods:
         periods = _DEFAULT_BUCKET_SIZES
 
+    if backfill:
+        await run_milestone_backfill(
+            start_interval=start_interval, end_interval=end_interval, metrics=metrics, networks=networks, periods=periods
+        )
+        return
+
     for network in networks:
         if not network.interval_size:
             logger.info(f"Skipping {network.code} as it has no interval size")
@@ -169,8 +183,6 @@ async def run_milestone_engine(
 
 # debug entry point
 if __name__ == "__main__":
-    import asyncio
-
     nem_start = datetime.fromisoformat("1998-12-08 00:00:00")
     start_interval = datetime.fromisoformat("1999-03-26 04:55:00")
     test_start_interval = datetime.fromisoformat("2010-01-01 00:00:00")
@@ -1,12 +1,21 @@
 """
 RecordReactor peristence methods
+
+New milestones are found by diffing the candidate records against the in-memory milestone state,
+given instance ids client side and written in a single COPY based upsert. Milestones that already
+exist for the record id and interval keep their instance id. The state is only updated once the
+milestones are written.
 """
 
 import logging
+import uuid
+from datetime import datetime
+from typing import Any
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import text
 
-from opennem.db import get_write_session
+from opennem.db import get_read_session
+from opennem.db.bulk_insert_csv import bulkinsert_mms_items
 from opennem.db.models.opennem import Milestones
 from opennem.recordreactor.schema import MilestoneRecordOutputSchema, MilestoneRecordSchema
 from opennem.recordreactor.significance import calculate_milestone_significance
@@ -15,68 +24,129 @@ from opennem.recordreactor.utils import check_milestone_is_new, get_record_descr
 
 logger = logging.getLogger("opennem.recordreactor.persistence")
 
+# columns updated when a milestone for the record id and interval already exists. The instance id
+# is never updated as other milestones can point to it
+_MILESTONE_UPDATE_FIELDS = [
+    "aggregate",
+    "metric",
+    "period",
+    "significance",
+    "value",
+    "value_unit",
+    "network_id",
+    "network_region",
+    "fueltech_id",
+    "description",
+    "previous_instance_id",
+]
+
+
+async def get_existing_instance_ids(milestones: list[MilestoneRecordSchema]) -> dict[tuple[str, datetime], uuid.UUID]:
+    """Instance ids of the milestones already stored for the record id and interval of candidates"""
+    keys = {(i.record_id, i.interval.replace(tzinfo=None)) for i in milestones if i.value}
+
+    if not keys:
+        return {}
+
+    query = text("""
+        SELECT m.record_id, m.interval, m.instance_id
+        FROM milestones m
+        JOIN unnest(CAST(:record_ids AS text[]), CAST(:intervals AS timestamp[])) AS k(record_id, interval)
+            ON m.record_id = k.record_id AND m.interval = k.interval
+    """)
+
+    async with get_read_session() as session:
+        result = await session.execute(query, {"record_ids": [i[0] for i in keys], "intervals": [i[1] for i in keys]})
+
+        return {(row.record_id, row.interval): row.instance_id for row in result.fetchall()}
+
+
+def get_new_milestones(
+    milestones: list[MilestoneRecordSchema],
+    milestone_state: dict[str, MilestoneRecordOutputSchema],
+    existing_instance_ids: dict[tuple[str, datetime], uuid.UUID] | None = None,
+) -> tuple[list[dict[str, Any]], dict[str, MilestoneRecordOutputSchema]]:
+    """Diff candidate milestones against the milestone state
+
+    Candidates are compared in order so a batch can hold several milestones for a record id, each
+    pointing to the one before it. Milestones in existing_instance_ids, keyed by record id and
+    interval, keep their instance id. Returns the milestone rows to insert and the state updates.
+    The passed state is not modified.
+    """
+    existing_instance_ids = existing_instance_ids or {}
+    milestone_rows: list[dict[str, Any]] = []
+    state_updates: dict[str, MilestoneRecordOutputSchema] = {}
+    seen_keys: set[tuple] = set()
+
+    for record in milestones:
+        milestone_prev = state_updates.get(record.record_id) or milestone_state.get(record.record_id)
+
+        if milestone_prev and not check_milestone_is_new(record, milestone_prev):
+            continue
+
+        if not record.value:
+            continue
+
+        # the same record id and interval can only be written once per insert
+        if (record.record_id, record.interval) in seen_keys:
+            logger.warning(f"Duplicate milestone: {record.record_id} for interval {record.interval}")
+            continue
+
+        seen_keys.add((record.record_id, record.interval))
+
+        description = get_record_description(record)
+        significance = calculate_milestone_significance(record)
+        instance_id = existing_instance_ids.get((record.record_id, record.interval.replace(tzinfo=None))) or uuid.uuid4()
+
+        milestone_rows.append(
+            {
+                "record_id": record.record_id,
+                "interval": record.interval,
+                "instance_id": instance_id,
+                "aggregate": record.aggregate.value,
+                "metric": record.metric.value,
+                "period": record.period.value,
+                "significance": significance,
+                "value": record.value,
+                "value_unit": record.unit.unit,
+                "network_id": record.network.code,
+                "network_region": record.network_region or None,
+                "fueltech_id": record.fueltech.value if record.fueltech else None,
+                "description": description,
+                "previous_instance_id": milestone_prev.instance_id if milestone_prev else None,
+            }
+        )
+
+        state_updates[record.record_id] = MilestoneRecordOutputSchema(
+            **record.model_dump(),
+            network_id=record.network.code,
+            value_unit=record.unit.unit,
+            instance_id=instance_id,
+            significance=significance,
+        )
+
+    return milestone_rows, state_updates
+
 
 async def persist_milestones(
     milestones: list[MilestoneRecordSchema],
-):
-    """ """
+) -> int:
+    """Persist the new milestones from a list of candidates. Returns the number of milestones written"""
 
     if not milestones:
-        return
+        return 0
 
     milestone_state = await get_current_milestone_state()
 
-    async with get_write_session() as session:
-        for record in milestones:
-            milestone_prev: MilestoneRecordOutputSchema | None = None
-
-            if record.record_id in milestone_state:
-                milestone_prev = milestone_state[record.record_id]
-
-            if not milestone_prev or check_milestone_is_new(record, milestone_prev):
-                if not record.value:
-                    continue
-
-                description = get_record_description(record)
-                significance = calculate_milestone_significance(record)
-
-                milestone_new = Milestones(
-                    record_id=record.record_id,
-                    interval=record.interval,
-                    aggregate=record.aggregate.value,
-                    metric=record.metric.value,
-                    period=record.period.value,
-                    significance=significance,
-                    value=record.value,
-                    value_unit=record.unit.unit,
-                    network_id=record.network.code,
-                    description=description,
-                    previous_instance_id=milestone_prev.instance_id if milestone_prev else None,
-                )
-
-                if record.network_region:
-                    milestone_new.network_region = record.network_region
-
-                if record.fueltech:
-                    milestone_new.fueltech_id = record.fueltech.value
-
-                try:
-                    milestone_new = await session.merge(milestone_new)
-                    await session.flush()
-
-                    # update state to point to this new milestone
-                    milestone_state[record.record_id] = MilestoneRecordOutputSchema(
-                        **record.model_dump(),
-                        network_id=record.network.code,
-                        value_unit=record.unit.unit,
-                        instance_id=milestone_new.instance_id,
-                        significance=significance,
-                    )
-
-                    # logger.info(
-                    #     f"Added milestone for interval {record.aggregate.value} {record.record_id} with value {record.value}"
-                    # )
-                except IntegrityError:
-                    logger.warning(f"Milestone already exists: {record.record_id} for interval {record.interval}")
-
-        await session.commit()
+    existing_instance_ids = await get_existing_instance_ids(milestones)
+    milestone_rows, state_updates = get_new_milestones(milestones, milestone_state, existing_instance_ids)
+
+    if not milestone_rows:
+        return 0
+
+    await bulkinsert_mms_items(Milestones, milestone_rows, update_fields=_MILESTONE_UPDATE_FIELDS)
+
+    # update state to point to the new milestones
+    milestone_state.update(state_updates)
+
+    return len(milestone_rows)
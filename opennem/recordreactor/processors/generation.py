@@ -3,11 +3,12 @@ RecordReactor generation methods
 """
 
 import logging
-from datetime import datetime
+from datetime import date, datetime
 
 from opennem.queries.energy import get_fueltech_generated_energy_emissions, get_fueltech_interval_energy_emissions
 from opennem.recordreactor.buckets import get_bucket_interval
 from opennem.recordreactor.persistence import persist_milestones
+from opennem.recordreactor.rollup import PeriodRollupStore, RollupMethod, RollupRow, day_ranges
 from opennem.recordreactor.schema import (
     MilestoneAggregate,
     MilestoneFueltechGrouping,
@@ -21,6 +22,18 @@ from opennem.schema.network import NetworkSchema, NetworkWEM, NetworkWEMDE
 
 logger = logging.getLogger("opennem.recordreactor.controllers.generation")
 
+_GENERATION_METRIC_COLUMNS = {
+    MilestoneType.power: "fueltech_generated",
+    MilestoneType.energy: "fueltech_energy",
+    MilestoneType.emissions: "fueltech_emissions",
+}
+
+# day aggregates that the month, quarter, year and financial year milestones are rolled up from
+_GENERATION_ROLLUP_STORE = PeriodRollupStore(
+    keys=["network_region", "fueltech_id"],
+    columns={i: RollupMethod.sum for i in _GENERATION_METRIC_COLUMNS.values()},
+)
+
 
 async def aggregate_generation_and_emissions_data(
     network: NetworkSchema,
@@ -43,129 +56,128 @@ async def aggregate_generation_and_emissions_data(
         network=network, interval=bucket_interval, date_start=date_start, date_end=date_end, region_group=region_group
     )
 
+    return generation_milestone_records(
+        rows=[i._asdict() for i in results],
+        network=network,
+        bucket_size=bucket_size,
+        date_start=date_start,
+        region_group=region_group,
+    )
+
+
+def generation_milestone_records(
+    rows: list[RollupRow],
+    network: NetworkSchema,
+    bucket_size: MilestonePeriod,
+    date_start: datetime,
+    region_group: bool = True,
+) -> list[MilestoneRecordSchema]:
+    """Low and high power, energy and emissions milestone records for fueltech generation rows"""
     milestone_records: list[MilestoneRecordSchema] = []
 
-    for row in results:
-        milestone_records.append(
-            MilestoneRecordSchema(
-                interval=date_start,
-                aggregate=MilestoneAggregate.low,
-                metric=MilestoneType.power,
-                period=bucket_size,
-                unit=get_milestone_unit(MilestoneType.power),
-                network=network,
-                network_region=row.network_region if region_group else None,
-                fueltech=MilestoneFueltechGrouping(row.fueltech_id),
-                value=row.fueltech_generated,
-            )
-        )
+    for row in rows:
+        for metric, column in _GENERATION_METRIC_COLUMNS.items():
+            for aggregate in [MilestoneAggregate.low, MilestoneAggregate.high]:
+                milestone_records.append(
+                    MilestoneRecordSchema(
+                        interval=date_start,
+                        aggregate=aggregate,
+                        metric=metric,
+                        period=bucket_size,
+                        unit=get_milestone_unit(metric),
+                        network=network,
+                        network_region=row["network_region"] if region_group else None,
+                        fueltech=MilestoneFueltechGrouping(row["fueltech_id"]),
+                        value=row[column],
+                    )
+                )
 
-        milestone_records.append(
-            MilestoneRecordSchema(
-                interval=date_start,
-                aggregate=MilestoneAggregate.high,
-                metric=MilestoneType.power,
-                period=bucket_size,
-                unit=get_milestone_unit(MilestoneType.power),
-                network=network,
-                network_region=row.network_region if region_group else None,
-                fueltech=MilestoneFueltechGrouping(row.fueltech_id),
-                value=row.fueltech_generated,
-            )
-        )
+    return milestone_records
 
-        milestone_records.append(
-            MilestoneRecordSchema(
-                interval=date_start,
-                aggregate=MilestoneAggregate.low,
-                metric=MilestoneType.energy,
-                period=bucket_size,
-                unit=get_milestone_unit(MilestoneType.energy),
-                network=network,
-                network_region=row.network_region if region_group else None,
-                fueltech=MilestoneFueltechGrouping(row.fueltech_id),
-                value=row.fueltech_energy,
-            )
-        )
 
-        milestone_records.append(
-            MilestoneRecordSchema(
-                interval=date_start,
-                aggregate=MilestoneAggregate.high,
-                metric=MilestoneType.energy,
-                period=bucket_size,
-                unit=get_milestone_unit(MilestoneType.energy),
-                network=network,
-                network_region=row.network_region if region_group else None,
-                fueltech=MilestoneFueltechGrouping(row.fueltech_id),
-                value=row.fueltech_energy,
-            )
-        )
+async def get_generation_day_aggregates(
+    network: NetworkSchema, date_start: datetime, date_end: datetime
+) -> dict[date, list[RollupRow]]:
+    """Fueltech generation, energy and emissions for each day and region of a range"""
+    results = await get_fueltech_generated_energy_emissions(
+        network=network, interval="fs.trading_day", date_start=date_start, date_end=date_end, region_group=True
+    )
 
-        milestone_records.append(
-            MilestoneRecordSchema(
-                interval=date_start,
-                aggregate=MilestoneAggregate.low,
-                metric=MilestoneType.emissions,
-                period=bucket_size,
-                unit=get_milestone_unit(MilestoneType.emissions),
-                network=network,
-                network_region=row.network_region if region_group else None,
-                fueltech=MilestoneFueltechGrouping(row.fueltech_id),
-                value=row.fueltech_emissions,
-            )
+    day_aggregates: dict[date, list[RollupRow]] = {}
+
+    for row in results:
+        day = row.interval.date() if isinstance(row.interval, datetime) else row.interval
+        day_aggregates.setdefault(day, []).append(
+            {i: getattr(row, i) for i in _GENERATION_ROLLUP_STORE.keys + tuple(_GENERATION_ROLLUP_STORE.columns)}
         )
 
-        milestone_records.append(
-            MilestoneRecordSchema(
-                interval=date_start,
-                aggregate=MilestoneAggregate.high,
-                metric=MilestoneType.emissions,
-                period=bucket_size,
-                unit=get_milestone_unit(MilestoneType.emissions),
-                network=network,
-                network_region=row.network_region if region_group else None,
-                fueltech=MilestoneFueltechGrouping(row.fueltech_id),
-                value=row.fueltech_emissions,
-            )
+    return day_aggregates
+
+
+async def load_generation_rollup_days(network: NetworkSchema, date_start: datetime, date_end: datetime) -> None:
+    """Store the day aggregates for a range that aren't stored or were stored before they settled, so
+    that late and corrected data in mv_fueltech_daily is rolled up. Each run of days is one query"""
+    stale_days = _GENERATION_ROLLUP_STORE.stale_days(network.code, date_start.date(), date_end.date())
+
+    for range_start, range_end in day_ranges(stale_days):
+        day_aggregates = await get_generation_day_aggregates(
+            network=network,
+            date_start=datetime.combine(range_start, datetime.min.time()),
+            date_end=datetime.combine(range_end, datetime.min.time()),
         )
 
-    return milestone_records
+        for day in stale_days:
+            if range_start <= day < range_end:
+                _GENERATION_ROLLUP_STORE.add_day(network.code, day, day_aggregates.get(day, []))
 
 
 async def run_generation_energy_emissions_milestones(
     network: NetworkSchema, bucket_size: MilestonePeriod, period_start: datetime, period_end: datetime
 ):
+    """Generation, energy and emissions milestones for a completed period
+
+    Days are aggregated once into the rollup store and the longer periods are rolled up from the
+    stored days. Days that aren't stored, such as when the engine starts part way through a period,
+    and days stored before they settled are loaded again first.
+    """
     if bucket_size == MilestonePeriod.interval:
         return
 
-    milestone_data = await aggregate_generation_and_emissions_data(
-        network=network,
-        bucket_size=bucket_size,
-        date_start=period_start,
-        date_end=period_end,
-        region_group=False,
-    )
+    if bucket_size == MilestonePeriod.day:
+        day_aggregates = await get_generation_day_aggregates(network=network, date_start=period_start, date_end=period_end)
+        _GENERATION_ROLLUP_STORE.add_day(network.code, period_start.date(), day_aggregates.get(period_start.date(), []))
+    else:
+        await load_generation_rollup_days(network=network, date_start=period_start, date_end=period_end)
 
-    await persist_milestones(
-        milestones=milestone_data,
-    )
+    region_groups = [False, True]
 
     # don't region group for WEM/WEMDE as they are not region specific
     if network in [NetworkWEM, NetworkWEMDE]:
-        return
+        region_groups = [False]
+
+    for region_group in region_groups:
+        rows = _GENERATION_ROLLUP_STORE.rollup(
+            network.code,
+            period_start.date(),
+            period_end.date(),
+            keys=["network_region", "fueltech_id"] if region_group else ["fueltech_id"],
+        )
 
-    milestone_data = await aggregate_generation_and_emissions_data(
-        network=network,
-        bucket_size=bucket_size,
-        date_start=period_start,
-        date_end=period_end,
-        region_group=True,
-    )
+        if rows is None:
+            logger.error(f"Missing generation day aggregates for {network.code} {bucket_size.value} from {period_start}")
+            return
 
-    await persist_milestones(
-        milestones=milestone_data,
-    )
+        milestone_data = generation_milestone_records(
+            rows=rows,
+            network=network,
+            bucket_size=bucket_size,
+            date_start=period_start,
+            region_group=region_group,
+        )
+
+        await persist_milestones(
+            milestones=milestone_data,
+        )
 
 
 if __name__ == "__main__":
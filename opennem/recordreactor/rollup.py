@@ -0,0 +1,142 @@
+"""
+RecordReactor period rollups
+
+Day aggregates are computed once and kept in process so that the values for the longer periods
+(month, quarter, year and financial year) are rolled up from the stored days rather than
+re-aggregated from the source tables at the end of each period. Days stored before they settled
+can still change from late and corrected data so are loaded again before they are rolled up.
+"""
+
+from collections.abc import Sequence
+from datetime import date, timedelta
+from enum import Enum
+from typing import Any
+
+RollupRow = dict[str, Any]
+
+# days kept for each network. Longer than the longest period that is rolled up
+ROLLUP_RETAIN_DAYS = 400
+
+# days after a day that its aggregates can still change from late and corrected source data
+ROLLUP_SETTLE_DAYS = 7
+
+
+class RollupMethod(str, Enum):
+    sum = "sum"
+    max = "max"
+    min = "min"
+
+
+def _rollup_values(method: RollupMethod, values: list[float | None]) -> float | None:
+    """Roll up values ignoring nulls. Null if all values are null the same as the SQL aggregates"""
+    values = [i for i in values if i is not None]
+
+    if not values:
+        return None
+
+    match method:
+        case RollupMethod.sum:
+            return sum(values)
+        case RollupMethod.max:
+            return max(values)
+        case RollupMethod.min:
+            return min(values)
+        case _:
+            raise ValueError(f"Invalid rollup method: {method}")
+
+
+def day_ranges(days: Sequence[date]) -> list[tuple[date, date]]:
+    """Ranges [date_start, date_end) of the consecutive days in a sorted list of days"""
+    ranges: list[tuple[date, date]] = []
+
+    for day in days:
+        if ranges and ranges[-1][1] == day:
+            ranges[-1] = (ranges[-1][0], day + timedelta(days=1))
+        else:
+            ranges.append((day, day + timedelta(days=1)))
+
+    return ranges
+
+
+class PeriodRollupStore:
+    """Day aggregates for each network keyed by day
+
+    Each day is a list of rows with the key columns and the value columns. The value columns are
+    rolled up over days with their rollup method. The date each day was stored on is kept so that
+    days stored within settle_days of the day can be loaded again.
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        columns: dict[str, RollupMethod],
+        retain_days: int = ROLLUP_RETAIN_DAYS,
+        settle_days: int = ROLLUP_SETTLE_DAYS,
+    ) -> None:
+        self.keys = tuple(keys)
+        self.columns = columns
+        self.retain_days = retain_days
+        self.settle_days = settle_days
+        self._days: dict[str, dict[date, list[RollupRow]]] = {}
+        self._stored_on: dict[str, dict[date, date]] = {}
+
+    def add_day(self, network_code: str, day: date, rows: list[RollupRow], stored_on: date | None = None) -> None:
+        """Store the aggregates for a day and evict the days older than the retain window. stored_on
+        defaults to today"""
+        network_days = self._days.setdefault(network_code, {})
+        network_days[day] = rows
+
+        network_stored_on = self._stored_on.setdefault(network_code, {})
+        network_stored_on[day] = stored_on or date.today()
+
+        earliest_day = max(network_days) - timedelta(days=self.retain_days)
+
+        for stored_day in [i for i in network_days if i < earliest_day]:
+            del network_days[stored_day]
+            del network_stored_on[stored_day]
+
+    def missing_days(self, network_code: str, date_start: date, date_end: date) -> list[date]:
+        """Days in the range [date_start, date_end) that aren't stored"""
+        network_days = self._days.get(network_code, {})
+
+        return [
+            date_start + timedelta(days=i)
+            for i in range((date_end - date_start).days)
+            if date_start + timedelta(days=i) not in network_days
+        ]
+
+    def stale_days(self, network_code: str, date_start: date, date_end: date) -> list[date]:
+        """Days in the range [date_start, date_end) that aren't stored or were stored before they settled"""
+        network_stored_on = self._stored_on.get(network_code, {})
+        days = [date_start + timedelta(days=i) for i in range((date_end - date_start).days)]
+
+        return [i for i in days if i not in network_stored_on or (network_stored_on[i] - i).days < self.settle_days]
+
+    def rollup(
+        self, network_code: str, date_start: date, date_end: date, keys: Sequence[str] | None = None
+    ) -> list[RollupRow] | None:
+        """Roll up the stored days in the range [date_start, date_end) grouped by keys, which default to
+        all the key columns. Returns None if any of the days aren't stored"""
+        if self.missing_days(network_code, date_start, date_end):
+            return None
+
+        group_keys = self.keys if keys is None else tuple(keys)
+        network_days = self._days[network_code]
+        groups: dict[tuple, dict[str, list[float | None]]] = {}
+
+        for day_offset in range((date_end - date_start).days):
+            for row in network_days[date_start + timedelta(days=day_offset)]:
+                group = groups.setdefault(tuple(row[i] for i in group_keys), {i: [] for i in self.columns})
+
+                for column in self.columns:
+                    group[column].append(row[column])
+
+        return [
+            dict(zip(group_keys, group_key, strict=True))
+            | {column: _rollup_values(method, group[column]) for column, method in self.columns.items()}
+            for group_key, group in groups.items()
+        ]
+
+    def clear(self) -> None:
+        self._days.clear()
+        self._stored_on.clear()
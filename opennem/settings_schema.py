@@ -78,6 +78,11 @@ class OpennemSettings(BaseSettings):
     http_verify_ssl: bool = True
     http_proxy_url: str | None = None  # @note don't let it confict with env HTTP_PROXY
 
+    # number of worker processes used to parse AEMO archive files. None uses the cpu count
+    # and 0 parses in the calling process
+    # see opennem.core.parsers.aemo.nemweb
+    aemo_parse_workers: int | None = None
+
     _static_folder_path: str = "opennem/static/"
 
     # api key cookie settings
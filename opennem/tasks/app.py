@@ -12,7 +12,7 @@ processed, and updated in a timely manner.
 
 Functions:
     startup(ctx): Initializes the HTTP client for the task scheduler.
-    shutdown(ctx): Closes the HTTP client for the task scheduler.
+    shutdown(ctx): Closes the cache redis clients for the task scheduler.
 
 Classes:
     WorkerSettings: Configuration class for the arq worker, including queue name and cron jobs.
@@ -48,10 +48,16 @@ from opennem.tasks.tasks import (
     task_update_facility_seen_range,
     task_wem_interval_check,
 )
+from opennem.utils.cache import close_caches
 
 logger = logging.getLogger("openenm.tasks.app")
 
 
+async def shutdown(ctx: dict) -> None:
+    """Close the cache redis clients when the worker shuts down"""
+    await close_caches()
+
+
 class WorkerSettings:
     # queue_name = "opennem"
     cron_jobs = [
@@ -168,6 +174,7 @@ class WorkerSettings:
         ),
     ]
     redis_settings = REDIS_SETTINGS
+    on_shutdown = shutdown
     retry_jobs = True
     max_tries = 5
     job_timeout = 60 * 60 * 12  # 12 hours max task time
@@ -3,19 +3,22 @@ Module to handle zip files and nested zip files.
 
 """
 
+import asyncio
 import io
 import json
 import logging
 import os
 import shutil
 import zipfile
+from collections.abc import Generator
 from io import BytesIO
 from pathlib import Path
-from tempfile import mkdtemp
+from tempfile import SpooledTemporaryFile, mkdtemp
 from typing import IO, Any
 from zipfile import ZipFile
 
 from opennem.utils.http import http
+from opennem.utils.httpx import http as httpx_client
 from opennem.utils.url import get_filename_from_url
 
 logger = logging.getLogger("opennem.archive.utils")
@@ -24,6 +27,13 @@ logger = logging.getLogger("opennem.archive.utils")
 # 0 means all
 ZIP_LIMIT = 0
 
+# size of the chunks read from the network and from zip members
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+ZIP_EXTRACT_BUFFER_SIZE = 1024 * 1024
+
+# nested zips up to this size are spooled in memory and larger ones to a temporary file
+NESTED_ZIP_MEMORY_LIMIT = 1024 * 1024
+
 
 def chain_streams(streams: Any, buffer_size: int = io.DEFAULT_BUFFER_SIZE) -> io.BufferedReader:
     """
@@ -103,6 +113,50 @@ def _handle_zip(file_obj: Any, mode: str) -> io.BufferedReader | IO[bytes]:
         return chain_streams(c)
 
 
+def iter_zip_members(
+    file_obj: IO[bytes], suffixes: tuple[str, ...] | None = None
+) -> Generator[tuple[str, IO[bytes]], None, None]:
+    """
+    Iterate over the members of a zip, descending into nested zips, and yield each
+    (filename, stream) pair. Streams are read lazily from the archive and are closed
+    once the consumer moves on to the next member. Nested zips are copied out of the
+    archive once into a spooled temporary file since reading a zip needs random access.
+
+    Optionally only yield members with a filename ending in one of suffixes
+
+        for filename, fh in iter_zip_members(zip_file, suffixes=(".csv",)):
+            parse_aemo_mms_csv_stream(fh)
+    """
+    with ZipFile(file_obj) as zf:
+        stream_count = 0
+
+        for member in zf.infolist():
+            if member.is_dir():
+                continue
+
+            if member.filename.lower().endswith(".zip"):
+                if ZIP_LIMIT > 0 and stream_count >= ZIP_LIMIT:
+                    continue
+
+                stream_count += 1
+
+                # zips need random access and seeking within a compressed member re-reads
+                # it from the start, so nested zips are spooled out of the archive first
+                with zf.open(member) as nested_fh, SpooledTemporaryFile(max_size=NESTED_ZIP_MEMORY_LIMIT) as nested_zip:
+                    shutil.copyfileobj(nested_fh, nested_zip, length=ZIP_EXTRACT_BUFFER_SIZE)
+                    nested_zip.seek(0)
+
+                    yield from iter_zip_members(nested_zip, suffixes=suffixes)
+
+                continue
+
+            if suffixes and not member.filename.lower().endswith(suffixes):
+                continue
+
+            with zf.open(member) as member_fh:
+                yield member.filename, member_fh
+
+
 def fix_central_directory(zfile: BytesIO) -> BytesIO:
     """
     Fixes the central directory on bad zip files
@@ -175,6 +229,30 @@ def stream_zip_contents(file_obj: IO[bytes], mode: str = "w"):  # type: ignore
         return chain_streams(c)
 
 
+def _extract_zip_incremental(zip_path: Path, dest_dir: Path, buffer_size: int = ZIP_EXTRACT_BUFFER_SIZE) -> None:
+    """Extract a zip into dest_dir one member at a time through a bounded buffer.
+    Nested zips are extracted into the same directory and then removed"""
+    nested_zips: list[Path] = []
+
+    with ZipFile(zip_path) as zf:
+        for member in zf.infolist():
+            if member.is_dir():
+                continue
+
+            # flatten the paths in the archive so files can't be written outside dest_dir
+            member_path = dest_dir / Path(member.filename).name
+
+            with zf.open(member) as src, member_path.open("wb") as dst:
+                shutil.copyfileobj(src, dst, length=buffer_size)
+
+            if member_path.suffix.lower() == ".zip":
+                nested_zips.append(member_path)
+
+    for nested_zip in nested_zips:
+        _extract_zip_incremental(nested_zip, dest_dir, buffer_size=buffer_size)
+        os.remove(nested_zip)
+
+
 def download_and_unzip(url: str) -> Path:
     """Download and unzip a multi-zip file into a temporary directory"""
 
@@ -201,23 +279,45 @@ def download_and_unzip(url: str) -> Path:
 
     logger.info(f"Wrote file to {save_path}")
 
-    with ZipFile(save_path) as zf:
-        try:
-            zf.extractall(dest_dir)
-        except Exception as e:
-            logger.error(e)
-            zf = fix_central_directory_file(save_path)
-            zf.extractall(dest_dir)
+    _extract_zip_incremental(save_path, dest_dir)
 
     os.remove(save_path)
 
-    for _, _, files in os.walk(dest_dir):
-        for file in files:
-            file_path = Path(dest_dir) / file
-            if file_path.suffix.lower() == ".zip":
-                with ZipFile(file_path) as zf:
-                    zf.extractall(dest_dir)
-                os.remove(file_path)
+    return dest_dir
+
+
+async def download_and_unzip_async(url: str, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Path:
+    """Async version of download_and_unzip. The response is streamed to disk in chunks
+    and extracted in a worker thread so the event loop is never blocked and the archive
+    is never held in memory"""
+    dest_dir = Path(mkdtemp(prefix="opennem_"))
+
+    logger.info(f"Saving to {dest_dir}")
+
+    save_path = dest_dir / get_filename_from_url(url)
+
+    try:
+        async with httpx_client.stream("GET", url) as response:
+            if not response.is_success:
+                raise Exception(f"Failed to download file: Status code {response.status_code}")
+
+            content_type = response.headers.get("Content-Type", None)
+
+            if not content_type or "zip" not in content_type:
+                raise Exception(f"Invalid content type: {content_type}")
+
+            with save_path.open("wb") as fh:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    fh.write(chunk)
+
+        logger.info(f"Wrote file to {save_path}")
+
+        await asyncio.to_thread(_extract_zip_incremental, save_path, dest_dir)
+    except Exception:
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        raise
+
+    os.remove(save_path)
 
     return dest_dir
 
@@ -1,78 +1,330 @@
 """
 OpenNEM cache utilities
 
+Two tier cache for hot lookups that are shared between API and worker processes. Values are
+kept in an in-process LRU in front of redis. Concurrent misses for the same key are coalesced
+so the lookup runs once per process, and across processes with a short lived lock in redis.
+
+Caches are registered by namespace so that crawlers etc. can invalidate them when new data
+lands:
+
+    await invalidate_cache(SCADA_RANGE_CACHE)
+
+and their redis clients are closed on shutdown with close_caches()
+
 """
 
-import inspect
+import asyncio
+import json
 import logging
+import time
 from collections.abc import Awaitable, Callable
+from datetime import datetime
 from functools import wraps
+from typing import Any, Generic, TypeVar
 
 from cachetools import TTLCache
+from redis import asyncio as aioredis
 
+from opennem import settings
 from opennem.api.stats.schema import ScadaDateRange
+from opennem.core.networks import network_from_network_code
 from opennem.schema.network import NetworkSchema
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 CACHE_AGE = 60 * 5
 
-scada_cache: TTLCache = TTLCache(maxsize=100, ttl=CACHE_AGE)
+# the in-process tier isn't invalidated by other processes so it is kept shorter
+CACHE_LOCAL_AGE = 30
+
+# how long a process computing a missing value holds the lock for it
+CACHE_LOCK_AGE = 30
+
+# after a redis error only the in-process tier is used for this long
+CACHE_REDIS_RETRY_AGE = 60
+
+_CACHE_POLL_INTERVAL = 0.05
+
+SCADA_RANGE_CACHE = "scada_range"
+
+_CACHES: dict[str, "TwoTierCache"] = {}
+
+
+def _create_redis_client() -> aioredis.Redis:
+    return aioredis.from_url(str(settings.redis_url), encoding="utf8", decode_responses=True)
+
+
+class TwoTierCache(Generic[T]):
+    """In-process LRU in front of redis with single-flight on misses
+
+    Values are stored serialized with dumps and are rebuilt with loads on each hit so callers
+    never share a mutable cached value."""
+
+    def __init__(
+        self,
+        namespace: str,
+        dumps: Callable[[T], str] = json.dumps,
+        loads: Callable[[str], T] = json.loads,
+        ttl: int = CACHE_AGE,
+        local_ttl: int = CACHE_LOCAL_AGE,
+        maxsize: int = 100,
+        use_redis: bool | None = None,
+    ) -> None:
+        self.namespace = namespace
+        self.dumps = dumps
+        self.loads = loads
+        self.ttl = ttl
+        self.use_redis = not settings.is_dev if use_redis is None else use_redis
+
+        self._local: TTLCache = TTLCache(maxsize=maxsize, ttl=local_ttl)
+        self._inflight: dict[str, asyncio.Future] = {}
+
+        self._redis: aioredis.Redis | None = None
+        self._redis_loop: asyncio.AbstractEventLoop | None = None
+        self._redis_disabled_until: float = 0
+
+        _CACHES[namespace] = self
+
+    def _redis_key(self, key: str) -> str:
+        return f"opennem:cache:{self.namespace}:{key}"
+
+    @property
+    def _redis_keys_key(self) -> str:
+        """Set of the keys stored in redis for this namespace so they can be invalidated without
+        scanning the keyspace"""
+        return f"opennem:cache:{self.namespace}:__keys__"
+
+    def _get_redis(self) -> aioredis.Redis | None:
+        if not self.use_redis or time.monotonic() < self._redis_disabled_until:
+            return None
+
+        # redis clients are bound to the event loop they're created in so a new client is
+        # created when called from another loop. clients are closed with close_caches
+        loop = asyncio.get_running_loop()
+
+        if not self._redis or self._redis_loop is not loop:
+            if self._redis:
+                logger.debug(f"Cache {self.namespace} redis client was not closed before its loop finished")
+
+            self._redis = _create_redis_client()
+            self._redis_loop = loop
+
+        return self._redis
+
+    async def close(self) -> None:
+        """Close the redis client if it was created in the running loop"""
+        redis = self._redis
+
+        if not redis or self._redis_loop is not asyncio.get_running_loop():
+            return
+
+        self._redis = None
+        self._redis_loop = None
+
+        try:
+            await redis.close()
+        except Exception as e:
+            logger.debug(f"Cache {self.namespace} error closing redis: {e}")
+
+    def _redis_error(self, error: Exception) -> None:
+        logger.warning(f"Cache {self.namespace} redis error, using in-process cache only: {error}")
+        self._redis_disabled_until = time.monotonic() + CACHE_REDIS_RETRY_AGE
+
+    async def _redis_call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        if not (redis := self._get_redis()):
+            return None
+
+        try:
+            return await getattr(redis, method)(*args, **kwargs)
+        except Exception as e:
+            self._redis_error(e)
+
+        return None
 
+    async def _wait_for_value(self, key: str) -> str | None:
+        """Wait for another process that holds the lock to store the value"""
+        deadline = time.monotonic() + CACHE_LOCK_AGE
 
-def cache_scada_result(func: Callable | Awaitable[Callable]) -> Callable | Awaitable[Callable]:
-    """
-    Caches the scada_range results in memory since they're called so often
-    by wrapping the function.
-    """
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_CACHE_POLL_INTERVAL)
 
-    @wraps(func)
-    async def _cache_scada_wrapper(
-        network: NetworkSchema | None = None,
-        networks: list[NetworkSchema] | None = None,
-        network_region: str | None = None,
-        facilities: list[str] | None = None,
-        energy: bool = False,
-    ) -> ScadaDateRange:
-        key_list = []
+            if value := await self._redis_call("get", self._redis_key(key)):
+                return value
 
-        if network:
-            key_list = [network.code]
+            # lock released or expired without a value so compute it here
+            if not await self._redis_call("exists", self._redis_key(f"{key}:lock")):
+                return None
 
-        if networks:
-            key_list += [n.code for n in networks]
+        return None
 
-        if facilities:
-            key_list += facilities
+    async def _load(self, key: str, loader: Callable[[], Awaitable[T]]) -> str:
+        value = await self._redis_call("get", self._redis_key(key))
 
-        key_list.append(str(energy))
+        if value is not None:
+            logger.debug(f"Cache {self.namespace} redis HIT at key: {key}")
+            return value
 
-        key = frozenset(key_list)
-        ret: ScadaDateRange | None = None
+        lock_key = self._redis_key(f"{key}:lock")
+        locked = await self._redis_call("set", lock_key, "1", nx=True, px=CACHE_LOCK_AGE * 1000)
+
+        if not locked and self._get_redis():
+            value = await self._wait_for_value(key)
+
+            if value is not None:
+                return value
+
+        logger.debug(f"Cache {self.namespace} MISS at key: {key}")
 
         try:
-            _val: dict = scada_cache[key]
-            ret = ScadaDateRange(**_val)
+            value = self.dumps(await loader())
 
-            logger.debug(f"scada range HIT at key: {key}")
+            if await self._redis_call("set", self._redis_key(key), value, ex=self.ttl):
+                await self._redis_call("sadd", self._redis_keys_key, self._redis_key(key))
+                await self._redis_call("expire", self._redis_keys_key, self.ttl)
+        finally:
+            if locked:
+                await self._redis_call("delete", lock_key)
 
-            return ret
+        return value
+
+    async def get_or_set(self, key: str, loader: Callable[[], Awaitable[T]]) -> T:
+        """Get the value for key, calling loader to compute it on a miss"""
+        try:
+            return self.loads(self._local[key])
         except KeyError:
-            if inspect.iscoroutinefunction(func):
-                ret = await func(network, networks, network_region, facilities, energy)
-            else:
-                ret = func(network, networks, network_region, facilities, energy)
+            pass
+
+        # another task in this process is already loading this key
+        if inflight := self._inflight.get(key):
+            try:
+                return self.loads(await asyncio.shield(inflight))
+            except asyncio.CancelledError:
+                # the loading task was cancelled rather than this one so load it here
+                if not inflight.cancelled():
+                    raise
+
+            return await self.get_or_set(key, loader)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            value = await self._load(key, loader)
         except Exception as e:
-            logger.error(f"Error in cache_scada_result: {e}")
+            future.set_exception(e)
+            # mark retrieved for when no other task was waiting
+            future.exception()
+            raise
+        except BaseException:
+            # cancelled so the waiting tasks don't hang on the future
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        future.set_result(value)
+        self._local[key] = value
+
+        return self.loads(value)
+
+    async def invalidate(self, key: str | None = None) -> None:
+        """Remove a key, or all keys if no key is given, from both tiers"""
+        if key:
+            self._local.pop(key, None)
+            await self._redis_call("delete", self._redis_key(key))
+            return
+
+        self._local.clear()
+
+        keys = await self._redis_call("smembers", self._redis_keys_key)
+
+        await self._redis_call("delete", *(keys or []), self._redis_keys_key)
+
+
+def cached(cache: TwoTierCache, key_func: Callable[..., str]) -> Callable:
+    """Decorator to cache an async function in a TwoTierCache. key_func takes the same arguments
+    as the function and returns the cache key"""
+
+    def _cached_decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @wraps(func)
+        async def _cached_wrapper(*args: Any, **kwargs: Any) -> T:
+            return await cache.get_or_set(key_func(*args, **kwargs), lambda: func(*args, **kwargs))
+
+        return _cached_wrapper
+
+    return _cached_decorator
+
+
+async def invalidate_cache(namespace: str, key: str | None = None) -> None:
+    """Invalidate a registered cache. Called when the data a cache is built from changes"""
+    if not (cache := _CACHES.get(namespace)):
+        logger.debug(f"No cache registered for {namespace}")
+        return
+
+    await cache.invalidate(key)
+
+
+async def close_caches() -> None:
+    """Close the redis clients of the registered caches. Called from the app and worker shutdown"""
+    for cache in _CACHES.values():
+        await cache.close()
+
+
+def _scada_range_key(
+    network: NetworkSchema | None = None,
+    networks: list[NetworkSchema] | None = None,
+    network_region: str | None = None,
+    facilities: list[str] | None = None,
+    energy: bool = False,
+) -> str:
+    key_list = []
+
+    if network:
+        key_list = [network.code]
+
+    if networks:
+        key_list += sorted(n.code for n in networks)
+
+    if network_region:
+        key_list.append(network_region)
+
+    if facilities:
+        key_list += sorted(facilities)
+
+    key_list.append(str(energy))
+
+    return ":".join(key_list)
+
+
+def _scada_range_dumps(scada_range: ScadaDateRange) -> str:
+    if not isinstance(scada_range, ScadaDateRange):
+        raise Exception(f"Invalid return type for scada range: {scada_range}")
+
+    return json.dumps(
+        {
+            "start": scada_range.start.isoformat(),
+            "end": scada_range.end.isoformat(),
+            "network": scada_range.network.code if scada_range.network else None,
+        }
+    )
+
 
-        logger.debug(f"scada range MISS at key: {key}")
+def _scada_range_loads(value: str) -> ScadaDateRange:
+    scada_range = json.loads(value)
 
-        if ret:
-            scada_cache[key] = ret.dict()
+    return ScadaDateRange(
+        start=datetime.fromisoformat(scada_range["start"]),
+        end=datetime.fromisoformat(scada_range["end"]),
+        network=network_from_network_code(scada_range["network"]) if scada_range["network"] else None,
+    )
 
-        if not isinstance(ret, ScadaDateRange):
-            raise Exception(f"Invalid return type for scada range: {ret}")
 
-        return ret
+scada_cache: TwoTierCache[ScadaDateRange] = TwoTierCache(
+    SCADA_RANGE_CACHE, dumps=_scada_range_dumps, loads=_scada_range_loads, maxsize=100
+)
 
-    return _cache_scada_wrapper
+# Caches the scada_range results since they're called so often
+cache_scada_result = cached(scada_cache, _scada_range_key)
@@ -1,8 +1,219 @@
+from datetime import datetime, timedelta
 from pathlib import Path
 
+import pytest
+from sqlalchemy import Engine, create_engine
+from sqlalchemy import text as sql
+
+from opennem.core import flow_solver
+from opennem.core.flow_solver import (
+    NEM_FLOW_TOPOLOGY,
+    NEM_REGION_FLOWS,
+    FlowSolverException,
+    FlowTopology,
+    InterconnectorNetEmissionsEnergy,
+    NetworkInterconnectorEnergyEmissions,
+    NetworkRegionsDemandEmissions,
+    Region,
+    RegionDemandEmissions,
+    RegionFlow,
+    get_flow_topology,
+    solve_flow_emissions_for_interval,
+    solve_flow_emissions_for_interval_range,
+)
+from opennem.schema.network import NetworkNEM, NetworkWEM
+
 TEST_FLOWS_FIXTURE_PATH = Path(__file__).parent / "test_flows.csv"
 
 
 def load_test_cases():
     # Load test cases from file
     pass
+
+
+@pytest.fixture
+def facility_tables(monkeypatch: pytest.MonkeyPatch) -> Engine:
+    """Facility tables with no interconnector units that the flow topology is loaded from"""
+    engine = create_engine("sqlite://")
+
+    with engine.begin() as conn:
+        conn.execute(sql("create table facilities (id integer primary key, network_id text)"))
+        conn.execute(
+            sql(
+                "create table units (id integer primary key, station_id integer, interconnector boolean, "
+                "interconnector_region_from text, interconnector_region_to text)"
+            )
+        )
+
+    monkeypatch.setattr(flow_solver, "db_connect_sync", lambda: engine)
+
+    return engine
+
+
+def _flow_solver_data(
+    intervals: list[datetime],
+) -> tuple[NetworkInterconnectorEnergyEmissions, NetworkRegionsDemandEmissions]:
+    region_values = {"NSW1": (600, 330), "QLD1": (500, 325), "VIC1": (300, 180), "SA1": (100, 15), "TAS1": (80, 4)}
+
+    region_data = [
+        RegionDemandEmissions(
+            interval=interval, region_code=Region(region), energy_mwh=energy + offset, emissions_t=emissions
+        )
+        for offset, interval in enumerate(intervals)
+        for region, (energy, emissions) in region_values.items()
+    ]
+
+    interconnector_data = [
+        InterconnectorNetEmissionsEnergy(
+            interval=interval, region_flow=region_flow, generated_mw=0, energy_mwh=10.0 * (flow_number + 1) + offset
+        )
+        for offset, interval in enumerate(intervals)
+        for flow_number, region_flow in enumerate(NEM_REGION_FLOWS)
+    ]
+
+    return (
+        NetworkInterconnectorEnergyEmissions(network=NetworkNEM, data=interconnector_data),
+        NetworkRegionsDemandEmissions(network=NetworkNEM, data=region_data),
+    )
+
+
+def test_solve_flow_emissions_for_interval_range(facility_tables: Engine) -> None:
+    intervals = [datetime.fromisoformat("2023-07-01T00:30:00+10:00") + timedelta(minutes=5 * i) for i in range(3)]
+    interconnector_data, region_data = _flow_solver_data(intervals)
+
+    flow_columns = solve_flow_emissions_for_interval_range(
+        network=NetworkNEM, interconnector_data=interconnector_data, region_data=region_data
+    )
+
+    assert flow_columns.intervals == intervals
+    assert flow_columns.emissions_t.shape == (3, len(NEM_REGION_FLOWS))
+    assert flow_columns.emissions_balance.shape == (3, 10)
+
+    # NSW1->QLD1 in the last interval is its energy times the NSW1 intensity
+    flow_position = NEM_REGION_FLOWS.index(RegionFlow("NSW1->QLD1"))
+    assert flow_columns.emissions_t[2, flow_position] == pytest.approx((50.0 + 2) * 330 / 602)
+
+    # flow emissions from the per interval solver before the system was batched, in NEM_REGION_FLOWS order
+    expected_emissions = [
+        [6.0, 12.0, 18.0, 22.0, 27.5, 39.0, 3.5, 12.0],
+        [6.578073, 12.558140, 18.538206, 22.512479, 28.003328, 39.570858, 3.506173, 12.029703],
+        [7.152318, 13.112583, 19.072848, 23.023256, 28.504983, 40.139442, 3.512195, 12.058824],
+    ]
+
+    for emissions_t, expected in zip(flow_columns.emissions_t, expected_emissions, strict=True):
+        assert emissions_t.tolist() == pytest.approx(expected, abs=1e-6)
+
+    # solutions of the fixed 10x10 NEM balance system with each intensity equation on its source region
+    expected_balance = {
+        "SA1": [31.620968, 32.022847, 32.418083],
+        "QLD1": [349.314516, 349.730243, 350.143179],
+        "TAS1": [15.080645, 15.531606, 15.974932],
+        "NSW1": [291.774194, 291.428946, 291.080650],
+        "VIC1": [166.209677, 165.286357, 164.383157],
+        "VIC1->NSW1": [5.540323, 6.040365, 6.531781],
+        "NSW1->QLD1": [24.314516, 24.730243, 25.143179],
+        "NSW1->VIC1": [19.451613, 19.881176, 20.307952],
+        "VIC1->SA1": [16.620968, 17.022847, 17.418083],
+        "VIC1->TAS1": [11.080645, 11.531606, 11.974932],
+    }
+
+    assert sorted(flow_columns.balance_columns) == sorted(expected_balance)
+
+    for column, balance in zip(flow_columns.balance_columns, flow_columns.emissions_balance.T, strict=True):
+        assert balance.tolist() == pytest.approx(expected_balance[column], abs=1e-6), column
+
+    for interval in intervals:
+        interval_result = solve_flow_emissions_for_interval(
+            network=NetworkNEM, interval=interval, interconnector_data=interconnector_data, region_data=region_data
+        )
+
+        assert [(i.region_flow, i.emissions_t) for i in interval_result.data] == [
+            (i.region_flow, i.emissions_t) for i in flow_columns.to_records() if i.interval == interval
+        ]
+
+    flow_df = flow_columns.to_dataframe()
+
+    assert len(flow_df) == 3 * len(NEM_REGION_FLOWS)
+    assert list(flow_df.columns) == ["trading_interval", "interconnector_region_from", "interconnector_region_to", "emissions"]
+
+
+def test_solve_flow_emissions_missing_interconnector(facility_tables: Engine) -> None:
+    intervals = [datetime.fromisoformat("2023-07-01T00:30:00+10:00")]
+    interconnector_data, region_data = _flow_solver_data(intervals)
+    interconnector_data.data.pop()
+
+    with pytest.raises(FlowSolverException):
+        solve_flow_emissions_for_interval_range(
+            network=NetworkNEM, interconnector_data=interconnector_data, region_data=region_data
+        )
+
+
+def test_solve_flow_emissions_with_topology() -> None:
+    # NEM with EnergyConnect between SA1 and NSW1
+    topology = FlowTopology.from_interconnectors(
+        "NEM", [("NSW1", "QLD1"), ("VIC1", "NSW1"), ("VIC1", "SA1"), ("TAS1", "VIC1"), ("SA1", "NSW1")]
+    )
+
+    assert len(topology.region_flows) == 10
+    assert NEM_FLOW_TOPOLOGY.regions == topology.regions
+
+    interval = datetime.fromisoformat("2023-07-01T00:30:00+10:00")
+    _, region_data = _flow_solver_data([interval])
+
+    interconnector_data = NetworkInterconnectorEnergyEmissions(
+        network=NetworkNEM,
+        data=[
+            InterconnectorNetEmissionsEnergy(interval=interval, region_flow=region_flow, generated_mw=0, energy_mwh=5.0 + i)
+            for i, region_flow in enumerate(topology.region_flows)
+        ],
+    )
+
+    flow_columns = solve_flow_emissions_for_interval_range(
+        network=NetworkNEM, interconnector_data=interconnector_data, region_data=region_data, topology=topology
+    )
+
+    assert flow_columns.region_flows == list(topology.region_flows)
+
+    # SA1 now passes flows through so its exports are part of the system
+    assert "SA1->NSW1" in flow_columns.balance_columns
+    assert len(flow_columns.balance_columns) == 5 + 8
+
+    # region balance: region emissions plus flow-through exports less flow-through imports
+    balance = dict(zip(flow_columns.balance_columns, flow_columns.emissions_balance[0], strict=True))
+    sa1_balance = balance["SA1"] + balance["SA1->NSW1"] + balance["SA1->VIC1"] - balance["VIC1->SA1"] - balance["NSW1->SA1"]
+    assert sa1_balance == pytest.approx(15)
+
+
+def test_get_flow_topology_from_facility_tables(facility_tables: Engine) -> None:
+    with facility_tables.begin() as conn:
+        conn.execute(sql("insert into facilities values (1, 'NEM'), (2, 'NEM'), (3, 'NEM')"))
+        conn.execute(
+            sql(
+                "insert into units values (1, 1, true, 'NSW1', 'QLD1'), (2, 1, true, 'NSW1', 'QLD1'), "
+                "(3, 2, true, 'VIC1', 'SA1'), (4, 3, false, null, null)"
+            )
+        )
+
+    topology = get_flow_topology(NetworkNEM)
+
+    assert topology.region_flows == ("NSW1->QLD1", "QLD1->NSW1", "VIC1->SA1", "SA1->VIC1")
+
+    # the same interconnectors are the same topology so the compiled system is reused
+    assert get_flow_topology(NetworkNEM) == topology
+
+
+def test_get_flow_topology_fallback(facility_tables: Engine) -> None:
+    assert get_flow_topology(NetworkNEM) is NEM_FLOW_TOPOLOGY
+
+    with pytest.raises(FlowSolverException):
+        get_flow_topology(NetworkWEM)
+
+
+def test_solve_flow_emissions_requires_topology(facility_tables: Engine) -> None:
+    interval = datetime.fromisoformat("2023-07-01T00:30:00+10:00")
+    interconnector_data, region_data = _flow_solver_data([interval])
+
+    with pytest.raises(FlowSolverException):
+        solve_flow_emissions_for_interval_range(
+            network=NetworkWEM, interconnector_data=interconnector_data, region_data=region_data
+        )
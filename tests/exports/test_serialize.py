@@ -0,0 +1,64 @@
+import io
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from opennem.api.stats.schema import OpennemData, OpennemDataHistory, OpennemDataSet, load_opennem_dataset_from_file
+from opennem.exporter.serialize import ChunkReader, dump_dataset_json, iter_dataset_json, number_series_json
+from opennem.utils.tests import TEST_FIXTURE_PATH
+
+
+def test_number_series_json() -> None:
+    values = [1, 0.1, 1e20, 1e-5, 1.5e-7, -0.0, Decimal("2.25"), None, float("nan"), float("inf"), 1 / 3]
+
+    history = OpennemDataHistory(
+        start=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        last=datetime(2024, 1, 1, 0, 50, tzinfo=timezone.utc),
+        interval="5m",
+        data=values,
+    )
+
+    history_json = history.model_dump_json().encode()
+
+    assert number_series_json(values) == history_json[history_json.index(b'"data":') + 7 : -1]
+
+
+@pytest.mark.parametrize("fixture", ["nem_nsw1_7d.json", "nem_vic1_week.json", "nem_sa1_all.json", "power-nsw1.json"])
+@pytest.mark.parametrize("exclude_unset", [True, False])
+def test_dump_dataset_json_matches_pydantic(fixture: str, exclude_unset: bool) -> None:
+    stat_set = load_opennem_dataset_from_file(TEST_FIXTURE_PATH / fixture)
+
+    expected = stat_set.model_dump_json(exclude_unset=exclude_unset).encode()
+
+    assert dump_dataset_json(stat_set, exclude_unset=exclude_unset) == expected
+
+
+def test_dump_dataset_json_forecast() -> None:
+    start = datetime(2024, 1, 1, tzinfo=timezone(timedelta(hours=10)))
+    history = OpennemDataHistory(start=start, last=start + timedelta(minutes=10), interval="5m", data=[1.0, None, 3])
+
+    stat_set = OpennemDataSet(
+        network="nem",
+        data=[
+            OpennemData(id="a", data_type="power", units="MW", history=history, forecast=history),
+            OpennemData(id="b", data_type="power", units="MW", history=history),
+        ],
+        messages=['"data":[]'],
+    )
+
+    for exclude_unset in (True, False):
+        expected = stat_set.model_dump_json(exclude_unset=exclude_unset).encode()
+        assert dump_dataset_json(stat_set, exclude_unset=exclude_unset) == expected
+
+
+def test_iter_dataset_json_streams_chunks() -> None:
+    stat_set = load_opennem_dataset_from_file(TEST_FIXTURE_PATH / "nem_nsw1_7d.json")
+    expected = stat_set.model_dump_json(exclude_unset=True).encode()
+
+    chunks = list(iter_dataset_json(stat_set, exclude_unset=True))
+    assert len(chunks) > len(stat_set.data), "Data set is serialized a series at a time"
+
+    reader = io.BufferedReader(ChunkReader(iter(chunks)), buffer_size=1024)
+    assert reader.read() == expected
+    assert reader.raw.bytes_read == len(expected)
@@ -1,4 +1,6 @@
-from opennem.core.parsers.aemo.mms import parse_aemo_mms_csv
+from io import BytesIO
+
+from opennem.core.parsers.aemo.mms import AEMOTableSet, parse_aemo_mms_csv, parse_aemo_mms_csv_stream
 
 
 def test_parse_aemo_mms_dispatch_scada(aemo_nemweb_dispatch_scada: str) -> None:
@@ -24,3 +26,97 @@ def test_parse_aemo_mms_dispatch_scada(aemo_nemweb_dispatch_scada: str) -> None:
         raise Exception("Invalid record")
 
     # assert record.settlementdate, "Record has settlement date"  # type: ignore
+
+
+def _build_unit_scada_csv(num_records: int) -> str:
+    rows = [
+        "C,NEMP.WORLD,DISPATCHSCADA,AEMO,PUBLIC,2021/09/02,12:50:07,0000000348376188,DISPATCHSCADA,0000000348376182",
+        "I,DISPATCH,UNIT_SCADA,1,SETTLEMENTDATE,DUID,SCADAVALUE,LASTCHANGED",
+    ]
+
+    for i in range(num_records):
+        rows.append(f'D,DISPATCH,UNIT_SCADA,1,"2021/09/02 12:55:00",UNIT{i},{i}.5,"2021/09/02 12:50:03"')
+
+    rows.append('C,"END OF REPORT",' + str(num_records + 3))
+
+    return "\n".join(rows) + "\n"
+
+
+def test_parse_aemo_mms_csv_stream_batches() -> None:
+    content = _build_unit_scada_csv(390)
+
+    batches = list(parse_aemo_mms_csv_stream(BytesIO(content.encode("utf-8")), batch_size=100))
+
+    assert batches, "Has batches"
+    assert {table_name for table_name, _ in batches} == {"dispatch_unit_scada"}, "Has table"
+    assert all(table.record_count <= 100 for _, table in batches), "Batches are bounded"
+    assert sum(table.record_count for _, table in batches) == 390, "Has all records"
+
+
+def test_parse_aemo_mms_columnar_frame() -> None:
+    table = parse_aemo_mms_csv(_build_unit_scada_csv(390)).get_table("unit_scada")
+
+    if not table or not table.columns:
+        raise Exception("No column store for table")
+
+    assert table.record_count == 390, "Table has correct number of records"
+    assert table.records[0]["duid"] == "UNIT0", "Records are built from the column store"
+
+    df = table.to_frame()
+
+    assert len(df) == 390, "Frame has all records"
+    assert str(df["settlementdate"].dtype).startswith("datetime64"), "Settlement dates are parsed"
+
+
+def test_aemo_table_set_merges_tables() -> None:
+    table_set = AEMOTableSet()
+
+    for _ in range(3):
+        parse_aemo_mms_csv(_build_unit_scada_csv(10), table_set=table_set)
+
+    assert len(table_set.tables) == 1, "Tables with the same name are merged"
+    assert table_set.has_table("dispatch_unit_scada"), "Has table by full name"
+
+    table = table_set.get_table("unit_scada")
+
+    if not table:
+        raise Exception("No table error")
+
+    assert table.record_count == 30, "Merged table has all records"
+    assert not table_set.get_table("unit_solution"), "Missing table"
+
+
+def test_aemo_table_uses_single_storage() -> None:
+    table = parse_aemo_mms_csv(_build_unit_scada_csv(10)).get_table("unit_scada")
+
+    if not table or not table.columns:
+        raise Exception("No column store for table")
+
+    assert table.columns.column("scadavalue").dtype == "float64", "Numeric fields are stored as floats"
+
+    # a row write moves the column stored records to rows rather than dropping them
+    table.add_record(["2021/09/02 12:55:00", "UNIT10", "10.5", "2021/09/02 12:50:03"], values_only=True)
+
+    assert table.columns is None, "Table has moved to row storage"
+    assert table.record_count == 11, "Table has all records"
+
+    # reading records doesn't move the table out of column storage
+    table = parse_aemo_mms_csv(_build_unit_scada_csv(10)).get_table("unit_scada")
+
+    if not table:
+        raise Exception("No table error")
+
+    assert len(table.records) == 10, "Has records"
+    assert table.columns is not None, "Table is still stored by column"
+
+
+def test_aemo_table_keeps_invalid_numeric_values() -> None:
+    content = _build_unit_scada_csv(3).replace("UNIT1,1.5", "UNIT1,n/a").replace("UNIT2,2.5", "UNIT2,")
+    table = parse_aemo_mms_csv(content).get_table("unit_scada")
+
+    if not table or not table.columns:
+        raise Exception("No column store for table")
+
+    assert [i["scadavalue"] for i in table.records] == [0.5, "n/a", ""], "Raw values are kept in records"
+    assert table.columns.invalid_count == 1, "Values that aren't numbers are counted"
+    assert table.to_frame()["scadavalue"].isna().tolist() == [False, True, True], "Frame has NaN for invalid values"
@@ -0,0 +1,53 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+
+from opennem.core.parsers.aemo import nemweb
+from opennem.core.parsers.aemo.nemweb import _get_parse_executor, parse_aemo_files
+from tests.parsers.test_aemo_mms import _build_unit_scada_csv
+
+
+async def _collect_parsed_files(files: list[Path], max_workers: int) -> list[tuple[Path, int]]:
+    return [
+        (csv_file, table_set.get_table("unit_scada").record_count)  # type: ignore
+        async for csv_file, table_set in parse_aemo_files(files, max_workers=max_workers)
+    ]
+
+
+@pytest.mark.parametrize("max_workers", [0, 2])
+def test_parse_aemo_files_in_order(tmp_path: Path, max_workers: int) -> None:
+    files = []
+
+    for i in range(1, 6):
+        csv_file = tmp_path / f"PUBLIC_DISPATCHSCADA_{i}.CSV"
+        csv_file.write_text(_build_unit_scada_csv(i * 10))
+        files.append(csv_file)
+
+    (tmp_path / "readme.txt").write_text("not a csv")
+
+    parsed = asyncio.run(_collect_parsed_files(files + [tmp_path / "readme.txt"], max_workers=max_workers))
+
+    assert parsed == [(f, (i + 1) * 10) for i, f in enumerate(files)], "Files are parsed in order"
+
+
+def test_parse_executor_recreated_when_broken(tmp_path: Path) -> None:
+    csv_file = tmp_path / "PUBLIC_DISPATCHSCADA_1.CSV"
+    csv_file.write_text(_build_unit_scada_csv(10))
+
+    # pools are kept for each worker count
+    assert _get_parse_executor(1) is not _get_parse_executor(2)
+
+    # break the pool by killing one of its processes
+    broken_executor = _get_parse_executor(1)
+
+    with pytest.raises(BrokenProcessPool):
+        broken_executor.submit(os._exit, 1).result()
+
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(_collect_parsed_files([csv_file], max_workers=1))
+
+    assert nemweb._PARSE_EXECUTORS.get(1) is not broken_executor, "Broken pool is dropped"
+    assert asyncio.run(_collect_parsed_files([csv_file], max_workers=1)) == [(csv_file, 10)], "Parses on a new pool"
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from opennem.core.units import get_unit
+from opennem.recordreactor.backfill import MILESTONE_FRAME_COLUMNS, find_record_breaking_milestones, rollup_day_frame
+from opennem.recordreactor.rollup import PeriodRollupStore, RollupMethod
+from opennem.recordreactor.schema import MilestoneAggregate, MilestonePeriod
+from opennem.schema.network import NetworkNEM
+
+
+def _demand_frame(values: list[float | None], network_region: str | None = "NSW1") -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            (datetime(2024, 1, 1, 0, 5 * (i + 1)), network_region, "demand", "demand", value)
+            for i, value in enumerate(values)
+        ],
+        columns=MILESTONE_FRAME_COLUMNS,
+    )
+
+
+def _values(records, aggregate: MilestoneAggregate) -> list[float]:
+    return [i.value for i in records if i.aggregate == aggregate]
+
+
+def test_find_record_breaking_milestones() -> None:
+    running_values: dict[str, float] = {}
+    frame = _demand_frame([5, 3, 0, None, 7, 7, 2, np.nan, 9])
+
+    records = find_record_breaking_milestones(frame, NetworkNEM, MilestonePeriod.interval, running_values)
+
+    # zero and missing values are never records and ties don't break a record
+    assert _values(records, MilestoneAggregate.high) == [5, 7, 9]
+    assert _values(records, MilestoneAggregate.low) == [5, 3, 2]
+    assert records == sorted(records, key=lambda x: x.interval)
+
+    high_record = next(i for i in records if i.aggregate == MilestoneAggregate.high)
+    low_record = next(i for i in records if i.aggregate == MilestoneAggregate.low)
+    assert running_values == {high_record.record_id: 9.0, low_record.record_id: 2.0}
+
+    # the next chunk carries on from the running values
+    records = find_record_breaking_milestones(_demand_frame([8, 10, 1]), NetworkNEM, MilestonePeriod.interval, running_values)
+
+    assert _values(records, MilestoneAggregate.high) == [10]
+    assert _values(records, MilestoneAggregate.low) == [1]
+
+
+def test_find_record_breaking_milestones_groups() -> None:
+    frame = pd.concat([_demand_frame([1, 2]), _demand_frame([4, 3], network_region=None)], ignore_index=True)
+
+    records = find_record_breaking_milestones(frame, NetworkNEM, MilestonePeriod.interval, {})
+
+    assert {i.network_region for i in records} == {"NSW1", None}
+    assert len({i.record_id for i in records}) == 4
+    assert sorted((i.network_region or "", i.aggregate.value, i.value) for i in records) == [
+        ("", "high", 4),
+        ("", "low", 3),
+        ("", "low", 4),
+        ("NSW1", "high", 1),
+        ("NSW1", "high", 2),
+        ("NSW1", "low", 1),
+    ]
+
+
+def test_find_record_breaking_milestones_price_unit() -> None:
+    frame = _demand_frame([50.0, 80.0])
+    frame["fueltech"] = None
+    frame["metric"] = "price"
+
+    records = find_record_breaking_milestones(frame, NetworkNEM, MilestonePeriod.interval, {})
+
+    # the same unit as the live price milestones
+    assert {i.unit.unit for i in records} == {get_unit("price_energy_mega").unit} == {"AUD/MWh"}
+
+
+def _energy_day_frame(date_start: datetime, days: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        [(date_start + timedelta(days=i), "NSW1", "coal", "energy", 10.0) for i in range(days)],
+        columns=MILESTONE_FRAME_COLUMNS,
+    )
+
+
+def test_rollup_day_frame() -> None:
+    rollup_store = PeriodRollupStore(keys=["network_region", "fueltech", "metric"], columns={"value": RollupMethod.sum})
+    day_frame = _energy_day_frame(datetime(2024, 1, 1), 33)
+    periods = [MilestonePeriod.week_rolling, MilestonePeriod.month, MilestonePeriod.quarter]
+
+    # the month ends in the second chunk and is rolled up from the days stored by both
+    chunks = [(datetime(2024, 1, 1), datetime(2024, 1, 20)), (datetime(2024, 1, 20), datetime(2024, 2, 3))]
+    rolled_up = [
+        (period, frame)
+        for chunk_start, chunk_end in chunks
+        for period, frame in rollup_day_frame(
+            rollup_store,
+            NetworkNEM,
+            day_frame[(day_frame["interval"] >= chunk_start) & (day_frame["interval"] < chunk_end)],
+            chunk_start,
+            chunk_end,
+            periods,
+        )
+    ]
+
+    week_frames = [frame for period, frame in rolled_up if period == MilestonePeriod.week_rolling]
+    assert list(pd.concat(week_frames)["interval"]) == [datetime(2024, 1, 1) + timedelta(days=i) for i in range(27)]
+    assert set(pd.concat(week_frames)["value"]) == {70.0}
+
+    month_frames = [frame for period, frame in rolled_up if period == MilestonePeriod.month]
+    assert len(month_frames) == 1
+    assert month_frames[0][["interval", "network_region", "value"]].values.tolist() == [[datetime(2024, 1, 1), "NSW1", 310.0]]
+
+    # the quarter started before the first stored day so isn't complete
+    assert MilestonePeriod.quarter not in [period for period, _ in rolled_up]
+
+
+def test_rollup_day_frame_skips_periods_before_range() -> None:
+    rollup_store = PeriodRollupStore(keys=["network_region", "fueltech", "metric"], columns={"value": RollupMethod.sum})
+    day_frame = _energy_day_frame(datetime(2024, 1, 15), 20)
+
+    rolled_up = rollup_day_frame(
+        rollup_store, NetworkNEM, day_frame, datetime(2024, 1, 15, 12), datetime(2024, 2, 4), [MilestonePeriod.month]
+    )
+
+    assert rolled_up == []
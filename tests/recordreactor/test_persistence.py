@@ -0,0 +1,66 @@
+import uuid
+from datetime import datetime, timedelta
+
+from opennem.recordreactor.persistence import _MILESTONE_UPDATE_FIELDS, get_new_milestones
+from opennem.recordreactor.schema import (
+    MilestoneAggregate,
+    MilestoneFueltechGrouping,
+    MilestonePeriod,
+    MilestoneRecordSchema,
+    MilestoneType,
+)
+from opennem.recordreactor.unit import get_milestone_unit
+from opennem.schema.network import NetworkNEM
+
+
+def _demand_record(interval_offset: int, value: float | None) -> MilestoneRecordSchema:
+    return MilestoneRecordSchema(
+        interval=datetime(2024, 1, 1) + timedelta(minutes=5 * interval_offset),
+        aggregate=MilestoneAggregate.high,
+        metric=MilestoneType.demand,
+        period=MilestonePeriod.interval,
+        unit=get_milestone_unit(MilestoneType.demand),
+        network=NetworkNEM,
+        network_region="NSW1",
+        fueltech=MilestoneFueltechGrouping.demand,
+        value=value,
+    )
+
+
+def test_get_new_milestones() -> None:
+    records = [_demand_record(0, 5), _demand_record(1, 4), _demand_record(2, 0), _demand_record(3, 8), _demand_record(3, 9)]
+
+    milestone_rows, state_updates = get_new_milestones(records, {})
+
+    # lower values and zero values aren't records and a record id and interval is only written once
+    assert [i["value"] for i in milestone_rows] == [5, 8]
+    assert milestone_rows[0]["previous_instance_id"] is None
+    assert milestone_rows[1]["previous_instance_id"] == milestone_rows[0]["instance_id"]
+    assert milestone_rows[0]["fueltech_id"] == "demand"
+
+    record_id = records[0].record_id
+    assert list(state_updates) == [record_id]
+    assert state_updates[record_id].instance_id == milestone_rows[1]["instance_id"]
+
+    # diffed against the existing state
+    milestone_rows, _ = get_new_milestones([_demand_record(4, 8), _demand_record(5, 10)], state_updates)
+
+    assert [i["value"] for i in milestone_rows] == [10]
+    assert milestone_rows[0]["previous_instance_id"] == state_updates[record_id].instance_id
+
+
+def test_get_new_milestones_keeps_existing_instance_ids() -> None:
+    records = [_demand_record(0, 5), _demand_record(1, 8)]
+    existing_instance_id = uuid.uuid4()
+
+    milestone_rows, state_updates = get_new_milestones(
+        records, {}, existing_instance_ids={(records[0].record_id, records[0].interval): existing_instance_id}
+    )
+
+    # the stored milestone keeps its instance id and the next milestone points to it
+    assert milestone_rows[0]["instance_id"] == existing_instance_id
+    assert milestone_rows[1]["instance_id"] != existing_instance_id
+    assert milestone_rows[1]["previous_instance_id"] == existing_instance_id
+    assert state_updates[records[0].record_id].instance_id == milestone_rows[1]["instance_id"]
+
+    assert "instance_id" not in _MILESTONE_UPDATE_FIELDS
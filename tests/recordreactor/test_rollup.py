@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+from opennem.recordreactor.rollup import PeriodRollupStore, RollupMethod, day_ranges
+
+
+def _store() -> PeriodRollupStore:
+    store = PeriodRollupStore(
+        keys=["network_region", "fueltech_id"],
+        columns={"energy": RollupMethod.sum, "demand_max": RollupMethod.max, "demand_min": RollupMethod.min},
+        retain_days=40,
+    )
+
+    for day_offset in range(31):
+        day = date(2024, 1, 1) + timedelta(days=day_offset)
+        store.add_day(
+            "NEM",
+            day,
+            [
+                {
+                    "network_region": "NSW1",
+                    "fueltech_id": "coal",
+                    "energy": 1.0,
+                    "demand_max": day_offset,
+                    "demand_min": day_offset,
+                },
+                {"network_region": "VIC1", "fueltech_id": "coal", "energy": 2.0, "demand_max": None, "demand_min": None},
+            ],
+        )
+
+    return store
+
+
+def test_rollup_month() -> None:
+    store = _store()
+
+    rows = store.rollup("NEM", date(2024, 1, 1), date(2024, 2, 1))
+
+    assert rows == [
+        {"network_region": "NSW1", "fueltech_id": "coal", "energy": 31.0, "demand_max": 30, "demand_min": 0},
+        {"network_region": "VIC1", "fueltech_id": "coal", "energy": 62.0, "demand_max": None, "demand_min": None},
+    ]
+
+    assert store.rollup("NEM", date(2024, 1, 1), date(2024, 2, 1), keys=["fueltech_id"]) == [
+        {"fueltech_id": "coal", "energy": 93.0, "demand_max": 30, "demand_min": 0}
+    ]
+
+
+def test_rollup_missing_days() -> None:
+    store = _store()
+
+    assert store.missing_days("NEM", date(2024, 1, 30), date(2024, 2, 2)) == [date(2024, 2, 1)]
+    assert store.rollup("NEM", date(2024, 1, 1), date(2024, 2, 2)) is None
+    assert store.rollup("WEM", date(2024, 1, 1), date(2024, 1, 2)) is None
+
+    # days older than the retain window are evicted
+    store.add_day("NEM", date(2024, 2, 15), [])
+
+    assert store.missing_days("NEM", date(2024, 1, 5), date(2024, 1, 7)) == [date(2024, 1, 5)]
+
+
+def test_rollup_stale_days() -> None:
+    store = PeriodRollupStore(keys=["fueltech_id"], columns={"energy": RollupMethod.sum}, settle_days=7)
+
+    # stored the day after each day
+    for day_offset in range(31):
+        day = date(2024, 1, 1) + timedelta(days=day_offset)
+        store.add_day("NEM", day, [{"fueltech_id": "coal", "energy": 1.0}], stored_on=day + timedelta(days=1))
+
+    assert store.stale_days("NEM", date(2024, 1, 30), date(2024, 2, 2)) == [
+        date(2024, 1, 30),
+        date(2024, 1, 31),
+        date(2024, 2, 1),
+    ]
+
+    # loading the month again at the end of the month settles all but the trailing days
+    for day_offset in range(31):
+        store.add_day("NEM", date(2024, 1, 1) + timedelta(days=day_offset), [], stored_on=date(2024, 2, 1))
+
+    stale_days = store.stale_days("NEM", date(2024, 1, 1), date(2024, 2, 1))
+    assert stale_days == [date(2024, 1, 26) + timedelta(days=i) for i in range(6)]
+
+
+def test_day_ranges() -> None:
+    days = [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 5), date(2024, 1, 7), date(2024, 1, 8)]
+
+    assert day_ranges(days) == [
+        (date(2024, 1, 1), date(2024, 1, 3)),
+        (date(2024, 1, 5), date(2024, 1, 6)),
+        (date(2024, 1, 7), date(2024, 1, 9)),
+    ]
+    assert day_ranges([]) == []
@@ -0,0 +1,136 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from opennem.db import bulk_insert_csv
+from opennem.db.bulk_insert_csv import (
+    build_insert_query,
+    bulkinsert_mms_items,
+    bulkinsert_transaction,
+    encode_copy_records,
+    get_column_scalar_defaults,
+    get_table_meta,
+)
+from opennem.db.models.opennem import BalancingSummary, FacilityScada
+
+
+def test_build_insert_query_partial_columns() -> None:
+    staging_table_name, queries = build_insert_query(
+        BalancingSummary,
+        update_cols=["price"],
+        columns=["network_id", "interval", "network_region", "price", "is_forecast"],
+        conflict_columns=["interval", "network_id", "network_region", "is_forecast"],
+    )
+
+    insert_query = " ".join(queries[2].split())
+
+    assert "INSERT INTO balancing_summary (network_id, interval, network_region, price, is_forecast)" in insert_query
+    assert "SELECT network_id, interval, network_region, price, is_forecast FROM" in insert_query
+    assert "(interval,network_id,network_region,is_forecast) DO UPDATE set price = EXCLUDED.price" in insert_query
+
+    # staging tables are reused per connection so the name is stable and the table truncated
+    assert staging_table_name == "__staging_balancing_summary"
+    assert "CREATE TEMP TABLE IF NOT EXISTS __staging_balancing_summary" in queries[0]
+    assert "TRUNCATE __staging_balancing_summary" in queries[1]
+
+
+def test_column_scalar_defaults() -> None:
+    assert get_column_scalar_defaults(BalancingSummary) == {"is_forecast": False}
+
+
+def test_encode_copy_records() -> None:
+    records = [
+        {
+            "network_id": "NEM",
+            "interval": "2024-01-01 00:05:00",
+            "network_region": "NSW1",
+            "price": "45.5",
+        },
+        {
+            "network_id": "NEM",
+            "interval": "2024-01-01 00:10:00",
+            "network_region": "NSW1",
+            "price": None,
+        },
+    ]
+    columns = ["network_id", "interval", "network_region", "price", "is_forecast"]
+
+    encoded = encode_copy_records(records, columns, get_table_meta(BalancingSummary))
+
+    assert encoded == [
+        ("NEM", datetime(2024, 1, 1, 0, 5), "NSW1", 45.5, False),
+        ("NEM", datetime(2024, 1, 1, 0, 10), "NSW1", None, False),
+    ]
+    assert encode_copy_records(pd.DataFrame(records), columns, get_table_meta(BalancingSummary)) == encoded
+
+
+class _FakeConnection:
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+        self.transactions = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.transactions += 1
+        yield
+
+    async def execute(self, query: str) -> str:
+        self.statements.append(" ".join(query.split()))
+        return "INSERT 0 1"
+
+    async def copy_records_to_table(self, table_name: str, records: list, columns: list[str]) -> None:
+        self.statements.append(f"COPY {table_name} {len(records)}")
+
+
+class _FakePool:
+    def __init__(self) -> None:
+        self.connections: list[_FakeConnection] = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        conn = _FakeConnection()
+        self.connections.append(conn)
+        yield conn
+
+
+@pytest.fixture
+def fake_pool(monkeypatch: pytest.MonkeyPatch) -> _FakePool:
+    fake_pool = _FakePool()
+
+    async def _get_pool() -> _FakePool:
+        return fake_pool
+
+    monkeypatch.setattr(bulk_insert_csv, "get_pool", _get_pool)
+
+    return fake_pool
+
+
+def test_bulkinsert_transaction_shares_connection(fake_pool: _FakePool) -> None:
+    interval = datetime(2024, 1, 1, 0, 5)
+
+    async def _store() -> None:
+        async with bulkinsert_transaction():
+            await bulkinsert_mms_items(
+                FacilityScada,
+                [{"network_id": "NEM", "interval": interval, "facility_code": "BW01", "generated": 1.0}],
+                ["generated"],
+            )
+            await bulkinsert_mms_items(
+                BalancingSummary,
+                [{"network_id": "NEM", "interval": interval, "network_region": "NSW1", "price": 45.5}],
+                ["price"],
+            )
+
+    asyncio.run(_store())
+
+    assert len(fake_pool.connections) == 1
+
+    conn = fake_pool.connections[0]
+
+    # one outer transaction and a savepoint for each table
+    assert conn.transactions == 3
+    assert "COPY __staging_facility_scada 1" in conn.statements
+    assert "COPY __staging_balancing_summary 1" in conn.statements
@@ -0,0 +1,121 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pandas as pd
+import pytest
+
+from opennem.controllers import nem
+from opennem.controllers.nem import (
+    generate_interval_records,
+    interval_records_to_dicts,
+    remap_battery_facility_codes,
+    store_aemo_tableset,
+)
+from opennem.controllers.schema import ControllerReturn
+from opennem.core.battery import BatteryUnitMap
+from opennem.core.parsers.aemo.mms import AEMOTableSchema, AEMOTableSet, parse_aemo_mms_csv
+from opennem.db import bulk_insert_csv
+
+
+def test_remap_battery_facility_codes() -> None:
+    battery_unit_map = {
+        "HPRG1": BatteryUnitMap(unit="HPRG1", charge_unit="HPRL1", discharge_unit="HPRG1_D"),
+    }
+
+    df = pd.DataFrame(
+        {
+            "facility_code": ["HPRG1", "HPRG1", "HPRG1", "BW01"],
+            "generated": [-10.0, 0.0, 12.5, -1.0],
+        }
+    )
+
+    remapped = remap_battery_facility_codes(df, battery_unit_map)
+
+    assert remapped.tolist() == ["HPRL1", "HPRG1_D", "HPRG1_D", "BW01"], "Battery units are split on sign of generated"
+
+
+def test_remap_battery_facility_codes_no_batteries() -> None:
+    df = pd.DataFrame({"facility_code": ["BW01"], "generated": [1.0]})
+
+    assert remap_battery_facility_codes(df, {}).tolist() == ["BW01"], "Codes are unchanged without battery map"
+
+
+def test_generate_interval_records_dedupes_on_interval_and_key() -> None:
+    content = "\n".join(
+        [
+            "I,DISPATCH,PRICE,1,SETTLEMENTDATE,REGIONID,RRP",
+            'D,DISPATCH,PRICE,1,"2021/09/02 12:55:00",NSW1,100.5',
+            'D,DISPATCH,PRICE,1,"2021/09/02 12:55:00",NSW1,999',
+            'D,DISPATCH,PRICE,1,"2021/09/02 12:55:00",QLD1,80',
+            'D,DISPATCH,PRICE,1,"2021/09/02 13:00:00",NSW1,101',
+            'D,DISPATCH,PRICE,1,"",NSW1,1',
+            "C,END OF REPORT",
+        ]
+    )
+
+    table = parse_aemo_mms_csv(content).get_table("dispatch_price")
+
+    if not table:
+        raise Exception("No table error")
+
+    df = generate_interval_records(table, key_field="regionid", key_name="network_region", value_fields={"rrp": "price"})
+    records = interval_records_to_dicts(df)
+
+    assert [(str(r["interval"]), r["network_region"], r["price"]) for r in records] == [
+        ("2021-09-02 12:55:00", "NSW1", 100.5),
+        ("2021-09-02 12:55:00", "QLD1", 80.0),
+        ("2021-09-02 13:00:00", "NSW1", 101.0),
+    ], "First record for each interval and region is kept"
+    assert all(r["network_id"] == "NEM" for r in records), "Has network"
+
+
+class _FakeConnection:
+    def __init__(self) -> None:
+        self.savepoints_rolled_back = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        try:
+            yield
+        except Exception:
+            self.savepoints_rolled_back += 1
+            raise
+
+
+def test_store_aemo_tableset_isolates_table_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    conn = _FakeConnection()
+
+    @asynccontextmanager
+    async def _acquire():
+        yield conn
+
+    class _FakePool:
+        acquire = staticmethod(_acquire)
+
+    async def _get_pool() -> _FakePool:
+        return _FakePool()
+
+    async def _process_price(table: AEMOTableSchema) -> ControllerReturn:
+        raise Exception("price error")
+
+    async def _process_regionsum(table: AEMOTableSchema) -> ControllerReturn:
+        return ControllerReturn(total_records=2, processed_records=2, inserted_records=2)
+
+    monkeypatch.setattr(bulk_insert_csv, "get_pool", _get_pool)
+    monkeypatch.setattr(nem, "process_nem_price", _process_price)
+    monkeypatch.setattr(nem, "process_dispatch_regionsum", _process_regionsum)
+
+    table_set = AEMOTableSet()
+
+    for name in ["price", "regionsum"]:
+        table = AEMOTableSchema(name=name, namespace="dispatch", fieldnames=["settlementdate", "regionid"])
+        table.add_row(["2024/01/01 00:05:00", "NSW1"])
+        table_set.add_table(table)
+
+    cr = asyncio.run(store_aemo_tableset(table_set))
+
+    # the failing table is rolled back in its savepoint and the other table is still stored
+    assert conn.savepoints_rolled_back == 1
+    assert cr.inserted_records == 2
+    assert cr.errors == 1
+    assert cr.error_detail == ["Error processing dispatch_price: price error"]
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from opennem.core.crawlers import history
+from opennem.core.crawlers.history import CrawlerIntervalBitmap, CrawlHistoryEntry, CrawlHistoryWriter
+from opennem.core.time import get_interval
+
+
+@pytest.fixture
+def inserted_batches(monkeypatch: pytest.MonkeyPatch) -> list[list[dict]]:
+    batches: list[list[dict]] = []
+
+    async def _bulkinsert_mms_items(table, records, update_fields=None, conflict_columns=None) -> int:
+        batches.append(records)
+        return len(records)
+
+    monkeypatch.setattr(history, "bulkinsert_mms_items", _bulkinsert_mms_items)
+
+    return batches
+
+
+def test_crawl_history_writer_batches(inserted_batches: list[list[dict]]) -> None:
+    start = datetime(2024, 1, 1, 0, 5)
+
+    async def _crawl() -> None:
+        async with CrawlHistoryWriter("au.nemweb.current.dispatch_scada", flush_size=3) as writer:
+            for i in range(4):
+                await writer.add(CrawlHistoryEntry(interval=start + timedelta(minutes=5 * i), records=10))
+
+            # same interval again replaces the buffered entry
+            await writer.add(CrawlHistoryEntry(interval=start + timedelta(minutes=15), records=20))
+
+            assert writer.pending == 1
+
+    asyncio.run(_crawl())
+
+    assert [len(batch) for batch in inserted_batches] == [3, 1]
+    assert inserted_batches[1][0]["interval"] == start + timedelta(minutes=15)
+    assert inserted_batches[1][0]["inserted_records"] == 20
+    assert inserted_batches[0][0]["crawler_name"] == "au.nemweb.current.dispatch_scada"
+
+
+def test_crawl_history_writer_flushes_on_age(inserted_batches: list[list[dict]]) -> None:
+    async def _crawl() -> None:
+        writer = CrawlHistoryWriter("au.nemweb.current.dispatch_scada", flush_seconds=0)
+        await writer.add(CrawlHistoryEntry(interval=datetime(2024, 1, 1, 0, 5), records=10))
+
+        assert writer.pending == 0
+
+    asyncio.run(_crawl())
+
+    assert len(inserted_batches) == 1
+
+
+def test_crawler_interval_bitmap_missing() -> None:
+    start = datetime(2024, 1, 1, 0, 0)
+    bitmap = CrawlerIntervalBitmap(start=start, interval_size=5, crawled=np.zeros(0, dtype=bool))
+
+    bitmap.mark([start, start + timedelta(minutes=10), start + timedelta(minutes=7)])
+
+    assert bitmap.missing(start, start + timedelta(minutes=20)) == [
+        start + timedelta(minutes=20),
+        start + timedelta(minutes=15),
+        start + timedelta(minutes=5),
+    ]
+
+    assert bitmap.covers(start + timedelta(days=1))
+    assert not bitmap.covers(start - timedelta(minutes=5))
+
+
+def test_crawler_interval_bitmap_updated_on_write(inserted_batches: list[list[dict]]) -> None:
+    start = datetime(2024, 1, 1, 0, 0)
+    bitmap = CrawlerIntervalBitmap(start=start, interval_size=5, crawled=np.zeros(0, dtype=bool))
+    history._CRAWLER_INTERVAL_BITMAPS[("au.nemweb.current.dispatch_is", 5)] = bitmap
+
+    try:
+        asyncio.run(
+            history.set_crawler_history(
+                "au.nemweb.current.dispatch_is", [CrawlHistoryEntry(interval=start + timedelta(minutes=5), records=1)]
+            )
+        )
+    finally:
+        history._CRAWLER_INTERVAL_BITMAPS.clear()
+
+    assert bitmap.missing(start, start + timedelta(minutes=5)) == [start]
+
+
+def test_crawler_missing_intervals_reuses_bitmap_for_30_minute_crawlers(monkeypatch: pytest.MonkeyPatch) -> None:
+    loads: list[datetime] = []
+    latest_intervals = iter([datetime(2024, 1, 2, 10, 5) + timedelta(minutes=5 * i) for i in range(6)])
+
+    async def _load_crawler_interval_bitmap(crawler_name, interval, start) -> CrawlerIntervalBitmap:
+        loads.append(start)
+        return CrawlerIntervalBitmap(start=start, interval_size=interval.interval, crawled=np.zeros(0, dtype=bool))
+
+    monkeypatch.setattr(history, "_load_crawler_interval_bitmap", _load_crawler_interval_bitmap)
+    monkeypatch.setattr(history, "get_last_completed_interval_for_network", lambda *args, **kwargs: next(latest_intervals))
+
+    try:
+        missing = [
+            asyncio.run(history.get_crawler_missing_intervals("au.nemweb.current.trading_is", get_interval("30m"), days=1))
+            for _ in range(6)
+        ]
+    finally:
+        history._CRAWLER_INTERVAL_BITMAPS.clear()
+
+    assert loads == [datetime(2024, 1, 1, 10, 0)], "Bitmap is loaded once"
+    assert missing[0][0] == datetime(2024, 1, 2, 10, 0), "Intervals are aligned to the crawler interval"
+    assert missing[-1][0] == datetime(2024, 1, 2, 10, 30)
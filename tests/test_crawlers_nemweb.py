@@ -0,0 +1,82 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from opennem.controllers.schema import ControllerReturn
+from opennem.core.parsers.aemo.mms import AEMOTableSchema, AEMOTableSet
+from opennem.crawlers import nemweb
+
+
+@pytest.fixture
+def parsed_files(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    parsed: list[str] = []
+
+    async def parse_aemo_files(files: list[Path]):
+        for csv_file in files:
+            parsed.append(csv_file.name)
+            table_set = AEMOTableSet()
+            table = AEMOTableSchema(name="unit_scada", namespace="dispatch", fieldnames=["duid"])
+            table.add_row([csv_file.stem])
+            table_set.add_table(table)
+
+            yield csv_file, table_set
+
+    monkeypatch.setattr(nemweb, "parse_aemo_files", parse_aemo_files)
+
+    return parsed
+
+
+def _download_path(tmp_path: Path) -> Path:
+    for i in range(3):
+        (tmp_path / f"file_{i}.CSV").write_text("")
+
+    return tmp_path
+
+
+def test_parse_nemweb_entry_hands_parsed_table_sets_to_store(
+    tmp_path: Path, parsed_files: list[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    stored: list[list[str]] = []
+
+    async def store_aemo_tableset(table_set: AEMOTableSet) -> ControllerReturn:
+        stored.append([i["duid"] for i in table_set.tables[0].records])
+        return ControllerReturn(inserted_records=1, processed_records=1, total_records=1)
+
+    monkeypatch.setattr(nemweb, "store_aemo_tableset", store_aemo_tableset)
+
+    async def run() -> ControllerReturn:
+        parse_slots = asyncio.Semaphore(1)
+        job = nemweb.NemwebEntryJob(entry=SimpleNamespace(link="test"), download_path=_download_path(tmp_path))  # type: ignore
+
+        job = await nemweb.parse_nemweb_entry(SimpleNamespace(bulk_insert=False), job, parse_slots=parse_slots)  # type: ignore
+
+        assert job.parse_task, "Files are parsed by the parse stage"
+        assert parse_slots.locked(), "Entry holds a parse slot while its files are parsed"
+
+        controller_return = await nemweb._store_nemweb_table_sets(job)
+
+        # the slot is released by the parse task done callback
+        await asyncio.sleep(0)
+
+        assert not parse_slots.locked(), "Parse slot is released once the files are parsed"
+
+        return controller_return
+
+    controller_return = asyncio.run(run())
+
+    assert parsed_files == ["file_0.CSV", "file_1.CSV", "file_2.CSV"]
+    assert stored == [["file_0"], ["file_1"], ["file_2"]], "Each file is stored as its own table set"
+    assert controller_return.inserted_records == 3
+    assert not tmp_path.exists(), "Download path is removed"
+
+
+def test_parse_nemweb_entry_bulk_insert_merges_files(tmp_path: Path, parsed_files: list[str]) -> None:
+    job = nemweb.NemwebEntryJob(entry=SimpleNamespace(link="test"), download_path=_download_path(tmp_path))  # type: ignore
+
+    job = asyncio.run(nemweb.parse_nemweb_entry(SimpleNamespace(bulk_insert=True), job))  # type: ignore
+
+    assert job.table_set, "Files are merged into a single table set"
+    assert job.table_set.tables[0].record_count == 3
+    assert job.parse_task is None and job.download_path is None
@@ -0,0 +1,36 @@
+import asyncio
+
+from opennem.core.crawlers.pipeline import PipelineStage, run_pipeline
+
+
+def test_pipeline_runs_stages_and_isolates_errors() -> None:
+    running = {"double": 0, "max": 0}
+
+    async def double(item: int) -> int:
+        running["double"] += 1
+        running["max"] = max(running["max"], running["double"])
+        await asyncio.sleep(0.001)
+        running["double"] -= 1
+
+        if item == 3:
+            raise ValueError("bad item")
+
+        return item * 2
+
+    async def add_one(item: int) -> int:
+        return item + 1
+
+    result = asyncio.run(
+        run_pipeline(
+            items=range(10),
+            stages=[
+                PipelineStage(name="double", handler=double, concurrency=3),
+                PipelineStage(name="add_one", handler=add_one, concurrency=2),
+            ],
+        )
+    )
+
+    assert sorted(result.results) == [i * 2 + 1 for i in range(10) if i != 3], "Items run through every stage"
+    assert len(result.errors) == 1, "Failed item is recorded"
+    assert result.errors[0].stage == "double" and result.errors[0].item == 3, "Error has stage and item"
+    assert running["max"] <= 3, "Stage concurrency is bounded"
@@ -1,9 +1,22 @@
+import asyncio
+from dataclasses import FrozenInstanceError
 from datetime import datetime
 from pathlib import Path
 
+import httpx
 import pytest
+from pydantic import ValidationError
 
-from opennem.core.parsers.dirlisting import DirlistingEntry, parse_dirlisting_datetime, parse_dirlisting_line
+from opennem.core.parsers import dirlisting
+from opennem.core.parsers.aemo.filenames import parse_aemo_filename
+from opennem.core.parsers.dirlisting import (
+    DirectoryListing,
+    DirlistingEntry,
+    get_dirlisting,
+    parse_dirlisting_datetime,
+    parse_dirlisting_line,
+)
+from opennem.schema.date_range import CrawlDateRange
 
 from .conftest import PATH_TESTS_FIXTURES
 
@@ -68,3 +81,128 @@ def test_dirlisting_line(line: str, result: dict[str, str | datetime | int]) ->
     dirlisting_line_result = parse_dirlisting_line(line)
 
     assert result_model == dirlisting_line_result, "Models match for dirlisting line"
+
+
+class _FakeHttp:
+    def __init__(self, responses: list[httpx.Response]) -> None:
+        self.responses = responses
+        self.requests: list[dict[str, str]] = []
+
+    async def get(self, url: str, headers: dict[str, str] | None = None) -> httpx.Response:
+        self.requests.append(headers or {})
+        return self.responses.pop(0)
+
+
+def test_get_dirlisting_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    url = "http://nemweb.com.au/Reports/Current/DispatchIS_Reports/"
+    content = load_fixture()
+    etag_headers = {"etag": '"abc"', "last-modified": "Mon, 08 Nov 2021 03:30:00 GMT"}
+
+    fake_http = _FakeHttp(
+        [
+            httpx.Response(200, text=content, headers=etag_headers),
+            httpx.Response(304, headers=etag_headers),
+            httpx.Response(200, text=content, headers={"etag": '"def"'}),
+        ]
+    )
+
+    monkeypatch.setattr(dirlisting, "http", fake_http)
+    monkeypatch.setattr(dirlisting, "_DIRLISTING_CACHE", {})
+
+    parsed_lines: list[str] = []
+
+    def _parse_dirlisting_line(dirlisting_line: str) -> DirlistingEntry | None:
+        parsed_lines.append(dirlisting_line)
+        return parse_dirlisting_line(dirlisting_line)
+
+    monkeypatch.setattr(dirlisting, "parse_dirlisting_line", _parse_dirlisting_line)
+
+    listing = asyncio.run(get_dirlisting(url))
+    assert listing.count > 0
+    lines_parsed_first = len(parsed_lines)
+
+    # not modified so the previous listing is used
+    listing_not_modified = asyncio.run(get_dirlisting(url))
+    assert fake_http.requests[1] == {"If-None-Match": '"abc"', "If-Modified-Since": "Mon, 08 Nov 2021 03:30:00 GMT"}
+    assert listing_not_modified.entries == listing.entries
+
+    # modified but the same lines so nothing is parsed again
+    listing_modified = asyncio.run(get_dirlisting(url))
+    assert listing_modified.entries == listing.entries
+    assert len(parsed_lines) == lines_parsed_first
+
+
+def test_get_dirlisting_cache_shares_immutable_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    url = "http://nemweb.com.au/Reports/Current/DispatchIS_Reports/"
+    etag_headers = {"etag": '"abc"'}
+
+    fake_http = _FakeHttp(
+        [
+            httpx.Response(200, text=load_fixture(), headers=etag_headers),
+            httpx.Response(304, headers=etag_headers),
+            httpx.Response(500, text="<html><pre>error</pre></html>"),
+        ]
+    )
+
+    monkeypatch.setattr(dirlisting, "http", fake_http)
+    monkeypatch.setattr(dirlisting, "_DIRLISTING_CACHE", {})
+
+    listing = asyncio.run(get_dirlisting(url))
+
+    # cached entries are shared between listings and can't be modified
+    with pytest.raises(ValidationError):
+        listing.entries[0].link = "modified"
+
+    aemo_interval_date = next(i.aemo_interval_date for i in listing.entries if i.aemo_interval_date)
+
+    with pytest.raises(FrozenInstanceError):
+        aemo_interval_date.date = None  # type: ignore
+
+    listing.entries.pop()
+
+    listing_not_modified = asyncio.run(get_dirlisting(url))
+    assert listing_not_modified.entries[0] is listing.entries[0]
+    assert listing_not_modified.count == listing.count + 1, "Listings have their own list of entries"
+
+    # error responses raise and aren't cached
+    with pytest.raises(Exception, match="status 500"):
+        asyncio.run(get_dirlisting(url))
+
+    assert dirlisting._DIRLISTING_CACHE[url].etag == '"abc"'
+
+
+def _build_listing() -> DirectoryListing:
+    base_url = "http://nemweb.com.au/Reports/Current/DispatchIS_Reports/"
+    entries = []
+
+    # listing order is not modified date order
+    for minute in [10, 5, 20, 15]:
+        filename = f"PUBLIC_DISPATCHIS_2021110814{minute:02d}_0000000352251582.zip"
+        entry = DirlistingEntry(
+            filename=Path(filename),
+            link=base_url + filename,
+            modified_date=datetime(2021, 11, 8, 14, minute),
+            file_size=18166,
+            aemo_interval_date=parse_aemo_filename(filename),
+        )
+        entries.append(entry)
+
+    return DirectoryListing(url=base_url, entries=entries)
+
+
+def test_dirlisting_index_queries() -> None:
+    listing = _build_listing()
+
+    aemo_intervals = listing.get_files_aemo_intervals([datetime(2021, 11, 8, 14, 20), datetime(2021, 11, 8, 14, 10)])
+    assert [i.modified_date.minute for i in aemo_intervals] == [10, 20]
+
+    modified_since = listing.get_files_modified_since(datetime(2021, 11, 8, 14, 10))
+    assert [i.modified_date.minute for i in modified_since] == [20, 15]
+
+    assert [i.modified_date.minute for i in listing.get_most_recent_files(limit=2)] == [20, 15]
+
+    # the index is rebuilt once entries change
+    listing = _build_listing()
+    listing.apply_date_range(CrawlDateRange(start=datetime(2021, 11, 8, 14, 5), end=datetime(2021, 11, 8, 14, 20)))
+    assert [i.modified_date.minute for i in listing.entries] == [10, 15]
+    assert listing.get_files_aemo_intervals([datetime(2021, 11, 8, 14, 20)]) == []
@@ -1,8 +1,9 @@
 import json
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
 
 from opennem.api.stats.loader import load_statset
+from opennem.api.stats.schema import OpennemDataHistory
 
 
 def get_fixture(name: str) -> dict:
@@ -36,3 +37,69 @@ def test_schema_loader() -> None:
     values = a.data[0].history.values()
 
     assert len(values) == 3, "Has 3 generated values"
+
+
+def test_history_index_lookups() -> None:
+    tz = timezone(timedelta(hours=10))
+    history = OpennemDataHistory(
+        start=datetime(2024, 1, 1, tzinfo=tz),
+        last=datetime(2024, 1, 3, 23, 30, tzinfo=tz),
+        interval="30m",
+        data=[float(i) if i % 7 else None for i in range(144)],
+    )
+
+    assert history.get_date(date(2024, 1, 2)) == 95.0, "Last interval on the date"
+    assert history.get_date(date(2024, 1, 4)) is None, "Date out of range"
+    assert history.get_value(datetime(2024, 1, 1, 1, tzinfo=tz)) == 2.0
+    assert history.get_value(datetime(2023, 12, 31, 15, tzinfo=timezone.utc)) == 2.0, "Other timezones"
+    assert history.get_value(datetime(2024, 1, 1, 1, 5, tzinfo=tz)) is None, "Not an interval"
+
+    values = history.values()
+    assert len(values) == 144
+    assert values[-1] == (history.last, 143.0)
+
+    history_slice = history.slice(datetime(2024, 1, 1, 0, 10, tzinfo=tz), datetime(2024, 1, 1, 2, tzinfo=tz))
+    assert history_slice
+    assert history_slice.start == datetime(2024, 1, 1, 0, 30, tzinfo=tz)
+    assert history_slice.last == datetime(2024, 1, 1, 2, tzinfo=tz)
+    assert history_slice.data == [1.0, 2.0, 3.0, 4.0]
+
+    history_hourly = history.resample("1h")
+    assert len(history_hourly.data) == 72
+    assert history_hourly.last == datetime(2024, 1, 3, 23, tzinfo=tz)
+    assert history_hourly.data[:4] == [1.0, 5.0, 9.0, 6.0], "Nulls are skipped in sums"
+
+    history_monthly = OpennemDataHistory(
+        start=datetime(2023, 1, 1, tzinfo=tz),
+        last=datetime(2023, 12, 1, tzinfo=tz),
+        interval="1M",
+        data=list(range(12)),
+    )
+
+    assert history_monthly.get_date(date(2023, 5, 1)) == 4
+    assert history_monthly.resample("3M", method="mean").data == [1.0, 4.0, 7.0, 10.0]
+
+
+def test_history_month_end_start_steps_cumulatively() -> None:
+    tz = timezone(timedelta(hours=10))
+    start = datetime(2024, 1, 31, tzinfo=tz)
+    history = OpennemDataHistory(start=start, last=datetime(2024, 5, 1, tzinfo=tz), interval="1M", data=[0, 1, 2, 3])
+
+    interval = history.get_interval()
+    expected_datetimes = [start]
+
+    for _ in range(3):
+        expected_datetimes.append(expected_datetimes[-1] + interval)
+
+    assert expected_datetimes[1:] == [datetime(2024, m, 1, tzinfo=tz) for m in (3, 4, 5)]
+    assert [history.index.datetime_at(i) for i in range(4)] == expected_datetimes
+
+    assert history.get_value(datetime(2024, 3, 1, tzinfo=tz)) == 1
+    assert history.get_value(datetime(2024, 4, 1, tzinfo=tz)) == 2
+    assert history.get_value(datetime(2024, 3, 31, tzinfo=tz)) is None
+    assert history.get_date(date(2024, 4, 1)) == 2
+
+    history_slice = history.slice(datetime(2024, 2, 15, tzinfo=tz), datetime(2024, 4, 15, tzinfo=tz))
+    assert history_slice
+    assert history_slice.start == datetime(2024, 3, 1, tzinfo=tz)
+    assert history_slice.data == [1, 2]
@@ -2,7 +2,7 @@ import json
 from datetime import datetime, timedelta
 
 from opennem.api.stats.controllers import stats_factory
-from opennem.api.stats.schema import DataQueryResult, OpennemData, OpennemDataSet
+from opennem.api.stats.schema import DataQueryColumns, DataQueryResult, OpennemData, OpennemDataSet
 from opennem.api.time import human_to_interval, human_to_period
 from opennem.core.networks import network_from_network_code
 from opennem.core.units import get_unit
@@ -121,3 +121,34 @@ def test_power_returns_json() -> None:
 
     assert isinstance(r, dict), "JSON is a dict"
     assert "version" in r, "Has a version string"
+
+
+def test_stats_factory_from_columns() -> None:
+    """Results passed as columns build the same data sets as a list of DataQueryResult"""
+    network = network_from_network_code("NEM")
+    dt = datetime.fromisoformat("2021-01-15 10:00:00")
+
+    rows = [
+        [dt + timedelta(minutes=10), "coal_black", 3.0],
+        [dt, "coal_black", 1.0],
+        [dt + timedelta(minutes=5), "coal_black", 2.0],
+        # the last row for an interval wins
+        [dt + timedelta(minutes=5), "coal_black", 4.0],
+        [dt, "solar", None],
+        [dt + timedelta(minutes=5), "solar", None],
+        [dt, None, 5.0],
+    ]
+
+    stats_kwargs = {"network": network, "interval": human_to_interval("5m"), "units": get_unit("power"), "fueltech_group": True}
+
+    result = stats_factory(DataQueryColumns.from_rows(rows, result_index=2, group_by_index=1), **stats_kwargs)
+    result_models = stats_factory(
+        [DataQueryResult(interval=i[0], result=i[2], group_by=i[1]) for i in rows],
+        **stats_kwargs,
+    )
+
+    assert result.data == result_models.data
+
+    # solar is all nulls so skipped
+    assert [i.fuel_tech for i in result.data] == ["coal_black"]
+    assert result.data[0].history.data == [1.0, 4.0, 3.0]
@@ -0,0 +1,61 @@
+from io import BytesIO
+from pathlib import Path
+from zipfile import ZipFile
+
+import pytest
+
+from opennem.utils import archive
+from opennem.utils.archive import _extract_zip_incremental, iter_zip_members
+
+
+def _build_zip(files: dict[str, bytes]) -> bytes:
+    buffer = BytesIO()
+
+    with ZipFile(buffer, "w") as zf:
+        for filename, content in files.items():
+            zf.writestr(filename, content)
+
+    return buffer.getvalue()
+
+
+def test_extract_zip_incremental_nested(tmp_path: Path) -> None:
+    inner_zip = _build_zip({"PUBLIC_DISPATCHIS_1.CSV": b"C,1\n", "PUBLIC_DISPATCHIS_2.CSV": b"C,2\n"})
+    outer_zip = tmp_path / "archive.zip"
+    outer_zip.write_bytes(_build_zip({"PUBLIC_DISPATCHIS_0.CSV": b"C,0\n", "inner/PUBLIC_DISPATCHIS_1.zip": inner_zip}))
+
+    dest_dir = tmp_path / "out"
+    dest_dir.mkdir()
+
+    _extract_zip_incremental(outer_zip, dest_dir, buffer_size=2)
+
+    assert sorted(f.name for f in dest_dir.iterdir()) == [
+        "PUBLIC_DISPATCHIS_0.CSV",
+        "PUBLIC_DISPATCHIS_1.CSV",
+        "PUBLIC_DISPATCHIS_2.CSV",
+    ], "Nested zips are extracted and removed"
+    assert (dest_dir / "PUBLIC_DISPATCHIS_2.CSV").read_bytes() == b"C,2\n", "Content is extracted"
+
+
+def test_iter_zip_members_nested() -> None:
+    inner_zip = _build_zip({"PUBLIC_DISPATCHIS_1.CSV": b"C,1\n", "readme.txt": b"skip"})
+    outer_zip = _build_zip({"PUBLIC_DISPATCHIS_0.CSV": b"C,0\n", "PUBLIC_DISPATCHIS_1.zip": inner_zip})
+
+    members = [(filename, fh.read()) for filename, fh in iter_zip_members(BytesIO(outer_zip), suffixes=(".csv",))]
+
+    assert members == [
+        ("PUBLIC_DISPATCHIS_0.CSV", b"C,0\n"),
+        ("PUBLIC_DISPATCHIS_1.CSV", b"C,1\n"),
+    ], "Yields CSV members of nested zips"
+
+
+def test_iter_zip_members_nested_spooled_to_disk(monkeypatch: pytest.MonkeyPatch) -> None:
+    # nested zips larger than the memory limit are spooled to a temporary file
+    monkeypatch.setattr(archive, "NESTED_ZIP_MEMORY_LIMIT", 16)
+
+    inner_zip = _build_zip({f"PUBLIC_DISPATCHIS_{i}.CSV": f"C,{i}\n".encode() * 100 for i in range(1, 4)})
+    outer_zip = _build_zip({"PUBLIC_DISPATCHIS_0.zip": inner_zip})
+
+    members = [(filename, fh.read()) for filename, fh in iter_zip_members(BytesIO(outer_zip))]
+
+    assert [filename for filename, _ in members] == [f"PUBLIC_DISPATCHIS_{i}.CSV" for i in range(1, 4)]
+    assert members[2][1] == b"C,3\n" * 100, "Content is read from the spooled zip"
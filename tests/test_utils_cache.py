@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from opennem.api.stats.schema import ScadaDateRange
+from opennem.schema.network import NetworkNEM
+from opennem.utils import cache
+from opennem.utils.cache import TwoTierCache, _scada_range_dumps, _scada_range_loads, close_caches, invalidate_cache
+
+
+class _FakeRedis:
+    """Stands in for a redis server shared between processes"""
+
+    def __init__(self) -> None:
+        self.values: dict[str, str] = {}
+        self.sets: dict[str, set[str]] = {}
+        self.closed = False
+
+    async def get(self, key: str) -> str | None:
+        return self.values.get(key)
+
+    async def set(self, key: str, value: str, nx: bool = False, px: int | None = None, ex: int | None = None) -> bool:
+        if nx and key in self.values:
+            return False
+
+        self.values[key] = value
+        return True
+
+    async def exists(self, key: str) -> int:
+        return int(key in self.values)
+
+    async def delete(self, *keys: str) -> int:
+        return len([self.values.pop(k) for k in keys if k in self.values] + [self.sets.pop(k) for k in keys if k in self.sets])
+
+    async def sadd(self, key: str, *members: str) -> int:
+        self.sets.setdefault(key, set()).update(members)
+        return len(members)
+
+    async def smembers(self, key: str) -> list[str]:
+        return list(self.sets.get(key, []))
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return key in self.sets or key in self.values
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch) -> _FakeRedis:
+    fake_redis = _FakeRedis()
+    monkeypatch.setattr(cache, "_create_redis_client", lambda: fake_redis)
+
+    return fake_redis
+
+
+def test_two_tier_cache_single_flight() -> None:
+    calls = 0
+
+    async def _loader() -> dict:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"value": calls}
+
+    async def _run() -> list[dict]:
+        test_cache: TwoTierCache[dict] = TwoTierCache("test_single_flight", use_redis=False)
+        results = await asyncio.gather(*[test_cache.get_or_set("key", _loader) for _ in range(5)])
+
+        # served from the in-process tier
+        results.append(await test_cache.get_or_set("key", _loader))
+
+        return results
+
+    results = asyncio.run(_run())
+
+    assert calls == 1
+    assert results == [{"value": 1}] * 6
+
+
+def test_two_tier_cache_shared_and_invalidated(fake_redis: _FakeRedis) -> None:
+    calls = 0
+
+    async def _loader() -> dict:
+        nonlocal calls
+        calls += 1
+        return {"value": calls}
+
+    async def _run() -> None:
+        cache_one: TwoTierCache[dict] = TwoTierCache("test_shared", use_redis=True)
+        assert await cache_one.get_or_set("key", _loader) == {"value": 1}
+
+        # another process with an empty in-process tier gets the value from redis
+        cache_two: TwoTierCache[dict] = TwoTierCache("test_shared", use_redis=True)
+        assert await cache_two.get_or_set("key", _loader) == {"value": 1}
+
+        await invalidate_cache("test_shared")
+        assert not fake_redis.values
+        assert not fake_redis.sets
+
+        assert await cache_two.get_or_set("key", _loader) == {"value": 2}
+
+        # the clients are closed on shutdown
+        await close_caches()
+        assert fake_redis.closed
+        assert not cache_two._redis
+
+    asyncio.run(_run())
+
+    assert calls == 2
+
+
+def test_two_tier_cache_cancelled_loader() -> None:
+    calls = 0
+
+    async def _loader() -> dict:
+        nonlocal calls
+        calls += 1
+
+        if calls == 1:
+            await asyncio.sleep(10)
+
+        return {"value": calls}
+
+    async def _run() -> list[dict]:
+        test_cache: TwoTierCache[dict] = TwoTierCache("test_cancelled", use_redis=False)
+
+        loading_task = asyncio.create_task(test_cache.get_or_set("key", _loader))
+        await asyncio.sleep(0)
+
+        waiting_tasks = [asyncio.create_task(test_cache.get_or_set("key", _loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+
+        loading_task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await loading_task
+
+        # the waiting tasks load the value themselves rather than hanging
+        return await asyncio.wait_for(asyncio.gather(*waiting_tasks), timeout=1)
+
+    results = asyncio.run(_run())
+
+    assert calls == 2
+    assert results == [{"value": 2}] * 3
+
+
+def test_scada_range_serialization() -> None:
+    scada_range = ScadaDateRange(
+        start=datetime.fromisoformat("2021-01-01T00:00:00+10:00"),
+        end=datetime.fromisoformat("2021-01-15T10:00:00+10:00"),
+        network=NetworkNEM,
+    )
+
+    assert _scada_range_loads(_scada_range_dumps(scada_range)) == scada_range